@@ -0,0 +1,138 @@
+"""
+End-to-end backtest throughput on generated monthly kline files (1m/5m/15m/1h and the config's timeframes)
+for every symbol of a shipped config: bars replayed per second, time of each phase and peak memory.
+
+    python benchmarks/backtest_throughput.py --sym_cfg_file configs/scalping_high_frequency_config.json --months 2
+
+Load is the warm up split only, later months are read while replaying. Peak RSS of worker processes is
+reported separately, it is not available on Windows.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import pandas as pd
+from backtest import BackTest
+from report import write_reports
+from utils import NUM_KLINE_INIT, get_pretty_table
+from benchmarks.synthetic import generate_klines, resample_klines
+
+DATA_TFS = ["1m", "5m", "15m", "1h"]
+START_TIME = pd.Timestamp("2023-01-01")
+
+
+def generate_data(symbols_config, data_dir, months, seed):
+    # monthly csv files of each symbol and tf, return config backtesting those months
+    end_time = START_TIME + pd.DateOffset(months=months)
+    num_bars = int((end_time - START_TIME) / pd.Timedelta(minutes=1))
+    bench_config = []
+    for i, symbol_cfg in enumerate(symbols_config):
+        symbol = symbol_cfg["symbol"]
+        tfs = set(DATA_TFS) | {tf for strategy in symbol_cfg["strategies"] for tf in strategy["tfs"].values()}
+        base_chart = generate_klines(num_bars, "1m", seed + i, start_time=START_TIME)
+        for tf in tfs:
+            chart = base_chart if tf == "1m" else resample_klines(base_chart, tf)
+            for month, df in chart.groupby(chart["Open time"].dt.to_period("M")):
+                df.to_csv(
+                    os.path.join(data_dir, "{}-{}-{}-{:02d}.csv".format(symbol, tf, month.year, month.month)),
+                    index=False,
+                )
+        bench_cfg = {k: v for k, v in symbol_cfg.items() if k not in ["year", "months"]}
+        bench_cfg["start"] = str(START_TIME.date())
+        bench_cfg["end"] = str(end_time.date())
+        bench_config.append(bench_cfg)
+    return bench_config
+
+
+def get_peak_rss_mb():
+    # (this process, children) peak resident memory in MB, None where resource module is missing
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    # ru_maxrss is in KB on Linux, bytes on macOS
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end backtest throughput benchmark")
+    parser.add_argument(
+        "--sym_cfg_file", required=False, type=str, default="configs/scalping_high_frequency_config.json"
+    )
+    parser.add_argument("--months", required=False, type=int, default=2)
+    parser.add_argument("--seed", required=False, type=int, default=1)
+    parser.add_argument("--workers", required=False, type=int, default=1)
+    parser.add_argument("--intrabar", action="store_true")
+    parser.add_argument("--vectorized", action="store_true")
+    parser.add_argument("--fast_plot", action="store_true")
+    parser.add_argument("--output", required=False, type=str)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    data_dir = os.path.join(work_dir, "data")
+    os.makedirs(data_dir)
+    os.environ["DEBUG_DIR"] = os.path.join(work_dir, "debug")
+    os.makedirs(os.environ["DEBUG_DIR"])
+    with open(os.path.join(ROOT_DIR, args.sym_cfg_file)) as f:
+        symbols_config = json.load(f)
+    print("[*] Generate {} months of klines for {} symbols in {}".format(args.months, len(symbols_config), data_dir))
+    bench_cfg_file = os.path.join(work_dir, "bench_config.json")
+    with open(bench_cfg_file, "w") as f:
+        json.dump(generate_data(symbols_config, data_dir, args.months, args.seed), f)
+
+    backtest_engine = BackTest(
+        "mt5",
+        bench_cfg_file,
+        data_dir,
+        intrabar=args.intrabar,
+        vectorized=args.vectorized,
+        workers=args.workers,
+        fast_plot=args.fast_plot,
+        report=False,
+    )
+    timings = {}
+    start_time = time.perf_counter()
+    backtest_engine.start()
+    timings["backtest (wall)"] = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    backtest_engine.summary_trade_result()
+    timings["summary"] = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    write_reports(backtest_engine.bot_traders, args.workers, fast_plot=args.fast_plot)
+    timings["report"] = time.perf_counter() - start_time
+
+    bot_traders = backtest_engine.bot_traders
+    timings["load (sum)"] = sum(bot_trader.timings["load"] for bot_trader in bot_traders)
+    timings["replay (sum)"] = sum(bot_trader.timings["replay"] for bot_trader in bot_traders)
+    num_bars = sum(
+        len(bot_trader.tfs_chart[tf]) - NUM_KLINE_INIT for bot_trader in bot_traders for tf in bot_trader.tfs_chart
+    )
+    peak_rss, peak_rss_children = get_peak_rss_mb()
+    result = {
+        "config": args.sym_cfg_file,
+        "symbols": len(bot_traders),
+        "months": args.months,
+        "workers": args.workers,
+        "bars": num_bars,
+        "bars_per_second": num_bars / timings["replay (sum)"] if timings["replay (sum)"] > 0 else 0,
+        "timings": timings,
+        "peak_rss_mb": peak_rss,
+        "peak_rss_children_mb": peak_rss_children,
+    }
+    rows = [{"METRIC": name, "VALUE": value} for name, value in result.items() if name != "timings"]
+    rows += [{"METRIC": "{} (s)".format(name), "VALUE": value} for name, value in timings.items()]
+    print(get_pretty_table(pd.DataFrame(rows), "BACKTEST THROUGHPUT"))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print("[+] Results written to {}".format(args.output))
@@ -0,0 +1,73 @@
+"""
+Measure cold-start import time of the bot in fresh interpreters.
+Compares loading only the strategies of a symbols config with importing every strategy and plotly up front.
+
+    python benchmarks/import_time.py --sym_cfg_file configs/ma_cross_config.json --runs 5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import statistics
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import pandas as pd
+from utils import get_pretty_table
+from strategy_utils import strategies
+
+
+def get_cases(symbols_config):
+    load_code = (
+        "import json\n"
+        "from strategy_utils import load_strategy\n"
+        "for symbol_cfg in json.loads({!r}):\n"
+        "    for strategy_def in symbol_cfg['strategies']:\n"
+        "        load_strategy(strategy_def)\n"
+    ).format(json.dumps(symbols_config))
+    eager_code = "".join(
+        "import strategies.{}\n".format(module_name)
+        for name, (module_name, _) in strategies.items()
+        if os.path.exists(os.path.join(ROOT_DIR, "strategies", module_name + ".py"))
+    )
+    eager_code += "import plotly.graph_objects\nimport plotly.subplots\nimport scipy.optimize\n"
+    return {
+        "trader": "import trader",
+        "trader + config strategies": "import trader\n" + load_code,
+        "all strategies + plotly + scipy": "import trader\n" + eager_code,
+    }
+
+
+def time_import(code, runs):
+    timings = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=ROOT_DIR, check=True)
+        timings.append(time.perf_counter() - start_time)
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold-start import time benchmark")
+    parser.add_argument("--sym_cfg_file", required=True, type=str)
+    parser.add_argument("--runs", required=False, type=int, default=5)
+    args = parser.parse_args()
+
+    with open(args.sym_cfg_file) as f:
+        symbols_config = json.load(f)
+    baseline = time_import("pass", args.runs)
+    rows = []
+    for case_name, code in get_cases(symbols_config).items():
+        timings = time_import(code, args.runs)
+        rows.append(
+            {
+                "CASE": case_name,
+                "median (s)": statistics.median(timings) - statistics.median(baseline),
+                "min (s)": min(timings) - min(baseline),
+                "max (s)": max(timings) - min(baseline),
+            }
+        )
+    print(get_pretty_table(pd.DataFrame(rows), "IMPORT TIME ({} runs, interpreter start excluded)".format(args.runs)))
@@ -0,0 +1,207 @@
+"""
+Time indicators (batch and streaming) and strategies (bar by bar replay) on seeded synthetic klines,
+write per bar timings to json and compare two runs to flag regressions.
+
+    python benchmarks/suite.py --bars 5000 --seed 1 --output benchmarks/results/base.json
+    python benchmarks/suite.py --bars 5000 --seed 1 --output benchmarks/results/new.json
+    python benchmarks/suite.py --compare benchmarks/results/base.json benchmarks/results/new.json --threshold 0.1
+
+Strategy params are taken from the first config in configs/ using each strategy, strategies without a module
+or a config are skipped.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import platform
+import argparse
+import tempfile
+import statistics
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import pandas as pd
+import indicators as mta
+from trader import Trader
+from strategy_utils import strategies
+from utils import NUM_KLINE_INIT, get_pretty_table, tf_to_timedelta, find_uptrend_line, find_downtrend_line
+from benchmarks.synthetic import generate_klines, resample_klines
+
+# klines of each trend line fitted by find_uptrend_line/find_downtrend_line
+TREND_LINE_KLINES = 20
+ZIGZAG_SIGMA = 0.005
+ZIGZAG_CONV_SIZE = 3
+
+
+def time_call(func, repeat):
+    # median seconds of func() over repeat runs, func sets up its own state on each run
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start_time)
+    return statistics.median(timings)
+
+
+def bench_indicators(df, repeat):
+    # {case: (seconds, number of bars or calls)}
+    init = NUM_KLINE_INIT
+    results = {}
+
+    results["heikin_ashi"] = (time_call(lambda: mta.heikin_ashi(df), repeat), len(df))
+
+    def heikin_ashi_stream():
+        ha = mta.heikin_ashi(df[:init])
+        for i in range(init, len(df)):
+            mta.heikin_ashi_stream(ha, df.iloc[i])
+
+    results["heikin_ashi_stream"] = (time_call(heikin_ashi_stream, repeat), len(df) - init)
+
+    results["zigzag"] = (time_call(lambda: mta.zigzag(df, ZIGZAG_SIGMA), repeat), len(df))
+
+    def zigzag_stream():
+        zz_points = mta.zigzag(df[:init], ZIGZAG_SIGMA)
+        for i in range(init, len(df)):
+            mta.zigzag_stream(df[: i + 1], ZIGZAG_SIGMA, zz_points)
+
+    results["zigzag_stream"] = (time_call(zigzag_stream, repeat), len(df) - init)
+
+    results["zigzag_conv"] = (time_call(lambda: mta.zigzag_conv(df, ZIGZAG_CONV_SIZE, ZIGZAG_SIGMA), repeat), len(df))
+
+    def zigzag_conv_stream():
+        zz_points = mta.zigzag_conv(df[:init], ZIGZAG_CONV_SIZE, ZIGZAG_SIGMA)
+        for i in range(init, len(df)):
+            mta.zigzag_conv_stream(df[: i + 1], ZIGZAG_CONV_SIZE, ZIGZAG_SIGMA, zz_points)
+
+    results["zigzag_conv_stream"] = (time_call(zigzag_conv_stream, repeat), len(df) - init)
+
+    # trend lines of sliding windows, like strategies fit them on the last klines
+    num_windows = min(len(df) - TREND_LINE_KLINES, 500)
+    lows, highs = df["Low"].values, df["High"].values
+
+    def trend_lines(find_trend_line, prices):
+        for i in range(num_windows):
+            find_trend_line(list(zip(range(i, i + TREND_LINE_KLINES), prices[i : i + TREND_LINE_KLINES])))
+
+    results["find_uptrend_line"] = (time_call(lambda: trend_lines(find_uptrend_line, lows), repeat), num_windows)
+    results["find_downtrend_line"] = (time_call(lambda: trend_lines(find_downtrend_line, highs), repeat), num_windows)
+    return results
+
+
+def get_strategy_defs():
+    # first strategy def of each strategy name in configs/
+    strategy_defs = {}
+    for cfg_file in sorted(glob.glob(os.path.join(ROOT_DIR, "configs", "*.json"))):
+        with open(cfg_file) as f:
+            symbols_config = json.load(f)
+        if not isinstance(symbols_config, list):
+            continue
+        for symbol_cfg in symbols_config:
+            for strategy_def in symbol_cfg.get("strategies", []):
+                strategy_defs.setdefault(strategy_def["name"], strategy_def)
+    return strategy_defs
+
+
+def bench_strategy(strategy_def, num_bars, seed, repeat):
+    # replay num_bars klines of the smallest tf after warm up, return (seconds, number of bars)
+    tfs = sorted(set(strategy_def["tfs"].values()), key=tf_to_timedelta)
+    ratio = tf_to_timedelta(tfs[-1]) // tf_to_timedelta(tfs[0])
+    base_chart = generate_klines((NUM_KLINE_INIT + 1) * ratio + num_bars, tfs[0], seed)
+    charts = {tf: base_chart if tf == tfs[0] else resample_klines(base_chart, tf) for tf in tfs}
+    max_time = max([chart.iloc[NUM_KLINE_INIT - 1]["Open time"] for chart in charts.values()])
+    end_time = max([chart.iloc[-1]["Open time"] for chart in charts.values()])
+    num_replayed = int((base_chart["Open time"] > max_time).sum())
+
+    def replay():
+        bot_trader = Trader({"symbol": "SYNTHETIC", "strategies": [strategy_def]})
+        bot_trader.init_strategies()
+        tfs_chart_init = {}
+        tfs_chart = {}
+        for tf, chart in charts.items():
+            tfs_chart_init[tf] = chart[chart["Open time"] <= max_time][-NUM_KLINE_INIT:].reset_index(drop=True)
+            tfs_chart[tf] = chart[chart["Open time"] > max_time]
+        bot_trader.init_chart(tfs_chart_init)
+        bot_trader.attach_oms(None)
+        bot_trader.replay(tfs_chart, max_time, end_time)
+
+    return time_call(replay, repeat), num_replayed
+
+
+def run(num_bars, seed, repeat):
+    os.environ["DEBUG_DIR"] = tempfile.mkdtemp()
+    df = generate_klines(NUM_KLINE_INIT + num_bars, "15m", seed)
+    results = {}
+    for case, (seconds, count) in bench_indicators(df, repeat).items():
+        results["indicator/" + case] = {"seconds": seconds, "count": count, "us_per_bar": 1e6 * seconds / count}
+        print("   [+] indicator/{}: {:.1f} us per bar".format(case, results["indicator/" + case]["us_per_bar"]))
+    strategy_defs = get_strategy_defs()
+    for name, (module_name, _) in strategies.items():
+        has_module = os.path.exists(os.path.join(ROOT_DIR, "strategies", module_name + ".py"))
+        if not has_module or name not in strategy_defs:
+            print("   [-] strategy/{}: no module or config, skip".format(name))
+            continue
+        seconds, count = bench_strategy(strategy_defs[name], num_bars, seed, repeat)
+        results["strategy/" + name] = {"seconds": seconds, "count": count, "us_per_bar": 1e6 * seconds / count}
+        print("   [+] strategy/{}: {:.1f} us per bar".format(name, results["strategy/" + name]["us_per_bar"]))
+    return {
+        "meta": {
+            "bars": num_bars,
+            "seed": seed,
+            "repeat": repeat,
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "time": str(datetime.now()),
+        },
+        "results": results,
+    }
+
+
+def compare(base_file, new_file, threshold):
+    # table of per bar timings, return names of cases slower than base by more than threshold
+    with open(base_file) as f:
+        base = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    if base["meta"]["bars"] != new["meta"]["bars"] or base["meta"]["seed"] != new["meta"]["seed"]:
+        print("[!] Runs use different bars/seed, timings may not be comparable")
+    rows = []
+    regressions = []
+    for case in sorted(set(base["results"]) & set(new["results"])):
+        base_us, new_us = base["results"][case]["us_per_bar"], new["results"][case]["us_per_bar"]
+        ratio = new_us / base_us if base_us > 0 else float("inf")
+        status = "OK"
+        if ratio > 1 + threshold:
+            status = "REGRESSION"
+            regressions.append(case)
+        elif ratio < 1 - threshold:
+            status = "FASTER"
+        rows.append({"CASE": case, "BASE(us/bar)": base_us, "NEW(us/bar)": new_us, "RATIO": ratio, "STATUS": status})
+    print(get_pretty_table(pd.DataFrame(rows), "BENCHMARK {} vs {}".format(new_file, base_file)))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indicator and strategy benchmark suite")
+    parser.add_argument("--bars", required=False, type=int, default=5000)
+    parser.add_argument("--seed", required=False, type=int, default=1)
+    parser.add_argument("--repeat", required=False, type=int, default=3)
+    parser.add_argument("--output", required=False, type=str)
+    parser.add_argument("--compare", required=False, nargs=2, metavar=("BASE", "NEW"))
+    parser.add_argument("--threshold", required=False, type=float, default=0.1)
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(args.compare[0], args.compare[1], args.threshold)
+        if len(regressions) > 0:
+            print("[-] {} regressions: {}".format(len(regressions), ", ".join(regressions)))
+            sys.exit(1)
+        sys.exit(0)
+    report = run(args.bars, args.seed, args.repeat)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print("[+] Results written to {}".format(args.output))
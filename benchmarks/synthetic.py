@@ -0,0 +1,55 @@
+"""
+Seeded synthetic OHLCV klines for benchmarks: a random walk whose drift and volatility switch between
+regimes (trend up, trend down, range, volatile) at random lengths, so zigzags, divergences and trend lines form.
+
+    from benchmarks.synthetic import generate_klines
+    df = generate_klines(10000, "15m", seed=1)
+"""
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from utils import tf_to_timedelta
+
+# (drift, volatility) of returns per bar
+REGIMES = [(0.0004, 0.002), (-0.0004, 0.002), (0.0, 0.001), (0.0, 0.004)]
+
+
+def generate_klines(num_bars, tf="15m", seed=0, start_time="2023-01-02", start_price=100.0, mean_regime_bars=200):
+    rng = np.random.default_rng(seed)
+    # regime of each bar, regime lengths are geometric with mean mean_regime_bars
+    regimes = np.empty(num_bars, dtype=int)
+    i = 0
+    while i < num_bars:
+        length = rng.geometric(1 / mean_regime_bars)
+        regimes[i : i + length] = rng.integers(len(REGIMES))
+        i += length
+    drift = np.array([REGIMES[r][0] for r in regimes])
+    volatility = np.array([REGIMES[r][1] for r in regimes])
+    close = start_price * np.exp(np.cumsum(drift + volatility * rng.standard_normal(num_bars)))
+    open = np.concatenate([[start_price], close[:-1]])
+    # wicks beyond the body
+    high = np.maximum(open, close) * (1 + volatility * np.abs(rng.standard_normal(num_bars)) / 2)
+    low = np.minimum(open, close) * (1 - volatility * np.abs(rng.standard_normal(num_bars)) / 2)
+    volume = np.round(rng.lognormal(6, 0.5, num_bars) * (1 + 50 * volatility))
+    return pd.DataFrame(
+        {
+            "Open time": pd.date_range(start_time, periods=num_bars, freq=tf_to_timedelta(tf)),
+            "Open": open,
+            "High": high,
+            "Low": low,
+            "Close": close,
+            "Volume": volume,
+        }
+    )
+
+
+def resample_klines(df, tf):
+    # klines of a larger timeframe from klines of a smaller one
+    chart = df.set_index("Open time").resample(tf_to_timedelta(tf), label="left", closed="left")
+    df_tf = chart.agg({"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"})
+    return df_tf.dropna().reset_index()
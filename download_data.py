@@ -2,171 +2,267 @@
 Download historical data from MetaTrader 5 for backtesting.
 This script uses the MT5 Python API to download the same historical data
 that MT5 Strategy Tester uses.
+
+Monthly files already complete are skipped, the file of the current month only gets the klines after its
+last stored one. Klines are fetched from the terminal on one thread while a thread pool encodes and writes
+the csv files.
 """
 import os
 import time
 import calendar
 import argparse
 import json
-from datetime import datetime, timezone
+import logging
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-import MetaTrader5 as mt5
+from utils import TIMEFRAME_MAP, tf_to_timedelta
+from klines_loader import KLINE_COLUMNS, get_months
+from resample import BASE_TF, build_resampled_files, get_resampled_files
 
+bot_logger = logging.getLogger("bot_logger")
 
-# Map interval string to MT5 timeframe constant
-TIMEFRAME_MAP = {
-    "1m": mt5.TIMEFRAME_M1,
-    "5m": mt5.TIMEFRAME_M5,
-    "15m": mt5.TIMEFRAME_M15,
-    "30m": mt5.TIMEFRAME_M30,
-    "1h": mt5.TIMEFRAME_H1,
-    "4h": mt5.TIMEFRAME_H4,
-    "1d": mt5.TIMEFRAME_D1,
-    "1w": mt5.TIMEFRAME_W1,
-    "1mn": mt5.TIMEFRAME_MN1,
-}
+# klines of a finished month may stop this long before its end when the market is closed over a weekend
+COMPLETE_MARGIN = timedelta(days=3)
+# earliest local hour brokers close the market on Friday
+FRIDAY_CLOSE_HOUR = 20
+# bytes read from the end of a csv file to find its last kline
+TAIL_BYTES = 4096
 
 
 def initialize_mt5(exchange_config):
-    """Initialize and login to MT5."""
+    """Initialize and login to MT5, return the MetaTrader5 module or None."""
+    import MetaTrader5 as mt5
+
     if not mt5.initialize():
-        print("[-] MT5 initialize() failed, error code =", mt5.last_error())
-        return False
-    
+        bot_logger.error("[-] MT5 initialize() failed, error code = {}".format(mt5.last_error()))
+        return None
+
     account = exchange_config["account"]
     server = exchange_config["server"]
-    
+
     authorized = mt5.login(account, server=server)
-    if authorized:
-        account_info = mt5.account_info()
-        if account_info:
-            print(f"[+] MT5 login successful")
-            print(f"    Account: {account_info.login}")
-            print(f"    Server: {account_info.server}")
-            print(f"    Balance: {account_info.balance}")
-            return True
-        else:
-            print("[-] Failed to get account info")
-            return False
-    else:
-        print(f"[-] MT5 login failed, error code = {mt5.last_error()}")
-        return False
+    if not authorized:
+        bot_logger.error("[-] MT5 login failed, error code = {}".format(mt5.last_error()))
+        return None
+    account_info = mt5.account_info()
+    if not account_info:
+        bot_logger.error("[-] Failed to get account info")
+        return None
+    bot_logger.info("[+] MT5 login successful")
+    bot_logger.info("    Account: {}, Server: {}, Balance: {}".format(account_info.login, account_info.server, account_info.balance))
+    return mt5
 
 
-def download_monthly_data(symbol, interval, month, year, output_dir):
-    """Download historical data for a specific month."""
-    tf = TIMEFRAME_MAP.get(interval)
-    if tf is None:
-        print(f"[-] Unsupported interval: {interval}")
-        return False
-    
-    # Calculate date range for the month
-    from_date = datetime(year, month, 1).replace(tzinfo=timezone.utc).timestamp()
-    last_day = calendar.monthrange(year, month)[1]
-    to_date = datetime(year, month, last_day, 23, 59, 59).replace(tzinfo=timezone.utc).timestamp()
-    
-    try:
-        # Download data from MT5
-        rates = mt5.copy_rates_range(symbol, tf, from_date, to_date)
-        
-        if rates is None or len(rates) == 0:
-            print(f"    [-] No data available for {symbol} {interval} {year}-{month:02d}")
-            return False
-        
-        # Convert to DataFrame
-        df = pd.DataFrame(rates)
-        
-        # Adjust timezone
-        df["time"] += -time.timezone
-        df["time"] = pd.to_datetime(df["time"], unit="s")
-        
-        # Rename columns to match project format
-        df.columns = ["Open time", "Open", "High", "Low", "Close", "Volume", "Spread", "Real_Volume"]
-        df = df[["Open time", "Open", "High", "Low", "Close", "Volume"]]
-        
-        # Create output directory if it doesn't exist
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # Save to CSV
-        filename = f"{symbol}-{interval}-{year}-{month:02d}.csv"
-        filepath = os.path.join(output_dir, filename)
-        df.to_csv(filepath, index=False)
-        
-        print(f"    [+] Downloaded: {filename} ({len(df)} bars, {df.iloc[0]['Open time']} to {df.iloc[-1]['Open time']})")
-        return True
-        
-    except Exception as e:
-        print(f"    [-] Error downloading {symbol} {interval} {year}-{month:02d}: {e}")
-        return False
+def get_required_files(symbols_config, intrabar=False, resample=False):
+    """Get sorted list of data files needed to backtest a symbols config: (symbol, interval, year, month).
+    With resample only 1m files are downloaded, the other timeframes are built from them."""
+    required_files = set()
+    for symbol_cfg in symbols_config:
+        intervals = {tf for strategy in symbol_cfg["strategies"] for tf in strategy["tfs"].values()}
+        if resample:
+            intervals = {BASE_TF}
+        if intrabar:
+            intervals.add("1m")
+        for interval in intervals:
+            for year, month in get_months(symbol_cfg):
+                required_files.add((symbol_cfg["symbol"], interval, year, month))
+    return sorted(required_files)
+
+
+def get_data_file(output_dir, symbol, interval, year, month):
+    return os.path.join(output_dir, "{}-{}-{}-{:02d}.csv".format(symbol, interval, year, month))
+
+
+def rates_to_klines(rates):
+    """Convert MT5 rates to klines in project format, Open time in local time."""
+    df = pd.DataFrame(rates)
+    df["time"] += -time.timezone
+    df["time"] = pd.to_datetime(df["time"], unit="s")
+    df.columns = ["Open time", "Open", "High", "Low", "Close", "Volume", "Spread", "Real_Volume"]
+    return df[KLINE_COLUMNS]
+
+
+def to_mt5_time(open_time):
+    """Timestamp for MT5 range requests of a kline Open time, inverse of the shift in rates_to_klines."""
+    return pd.Timestamp(open_time).replace(tzinfo=timezone.utc).timestamp() + time.timezone
+
+
+def read_last_kline(filepath):
+    """(byte offset, Open time) of the last kline line of a csv file, None if the file has no kline."""
+    with open(filepath, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        tail_start = max(f.tell() - TAIL_BYTES, 0)
+        f.seek(tail_start)
+        tail = f.read().rstrip(b"\r\n")
+    line_start = tail.rfind(b"\n") + 1
+    line = tail[line_start:].decode()
+    if line == "" or line.startswith("Open time"):
+        return None
+    return tail_start + line_start, pd.Timestamp(line.split(",")[0])
+
 
+def get_missing_from(filepath, interval, year, month):
+    """Time to download the month's klines from: month start if the file is missing or empty, the last stored
+    Open time if the file misses its tail, None if its last kline closes at the end of the month."""
+    month_start = datetime(year, month, 1)
+    if not os.path.exists(filepath):
+        return month_start
+    last_kline = read_last_kline(filepath)
+    if last_kline is None:
+        return month_start
+    month_end = month_start + timedelta(days=calendar.monthrange(year, month)[1])
+    last_close = last_kline[1] + tf_to_timedelta(interval)
+    if last_close >= month_end:
+        return None
+    if datetime.now() >= month_end and last_close >= month_end - COMPLETE_MARGIN and is_weekend_close(last_close):
+        return None
+    # klines may be missing, write appends whatever the terminal returns after the last stored kline
+    return last_kline[1]
 
-def download_from_config(exchange_config_file, symbols_config_file, output_dir):
+
+def is_weekend_close(close_time):
+    """True if the market is closed from close_time until next week: Friday evening or the weekend."""
+    weekday = close_time.weekday()
+    return weekday >= 5 or (weekday == 4 and close_time.hour >= FRIDAY_CLOSE_HOUR)
+
+
+class KlinesDownloader:
+    """Download monthly kline files, terminal calls on the calling thread, csv writes on a thread pool."""
+
+    def __init__(self, mt5, output_dir, workers=4):
+        self.mt5 = mt5
+        self.output_dir = output_dir
+        self.workers = workers
+
+    def fetch(self, symbol, interval, year, month, from_time):
+        # rates with from_time <= Open time < next month
+        month_end = datetime(year, month, 1) + timedelta(days=calendar.monthrange(year, month)[1])
+        return self.mt5.copy_rates_range(
+            symbol, TIMEFRAME_MAP[interval], to_mt5_time(from_time), to_mt5_time(month_end) - 1
+        )
+
+    def write(self, filepath, rates, append):
+        # return number of klines written
+        df = rates_to_klines(rates)
+        if not append:
+            tmp_file = filepath + ".tmp"
+            df.to_csv(tmp_file, index=False)
+            os.replace(tmp_file, filepath)
+            return len(df)
+        # rates start at the last stored kline, it may have been written before it closed so it is replaced
+        offset, last_time = read_last_kline(filepath)
+        df = df[df["Open time"] >= last_time]
+        if len(df) == 0:
+            return 0
+        with open(filepath, "r+b") as f:
+            f.truncate(offset)
+        df.to_csv(filepath, mode="a", header=False, index=False)
+        return len(df)
+
+    def download(self, files):
+        """Download missing files and tails of incomplete ones, return number of files that are up to date."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        up_to_date = 0
+        futures = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for symbol, interval, year, month in files:
+                if interval not in TIMEFRAME_MAP:
+                    bot_logger.error("    [-] Unsupported interval: {}".format(interval))
+                    continue
+                filepath = get_data_file(self.output_dir, symbol, interval, year, month)
+                from_time = get_missing_from(filepath, interval, year, month)
+                if from_time is None:
+                    up_to_date += 1
+                    continue
+                try:
+                    rates = self.fetch(symbol, interval, year, month, from_time)
+                except Exception as e:
+                    bot_logger.error("    [-] Error downloading {} {} {}-{:02d}: {}".format(symbol, interval, year, month, e))
+                    continue
+                if rates is None or len(rates) == 0:
+                    if os.path.exists(filepath):
+                        up_to_date += 1
+                    else:
+                        bot_logger.warning(
+                            "    [-] No data available for {} {} {}-{:02d}".format(symbol, interval, year, month)
+                        )
+                    continue
+                append = os.path.exists(filepath) and read_last_kline(filepath) is not None
+                futures[executor.submit(self.write, filepath, rates, append)] = (filepath, append)
+            for future, (filepath, append) in futures.items():
+                try:
+                    num_klines = future.result()
+                except Exception as e:
+                    bot_logger.error("    [-] Error writing {}: {}".format(filepath, e))
+                    continue
+                up_to_date += 1
+                bot_logger.info(
+                    "    [+] {}: {} ({} klines)".format(
+                        "Appended" if append else "Downloaded", os.path.basename(filepath), num_klines
+                    )
+                )
+        return up_to_date
+
+
+def download_from_config(exchange_config_file, symbols_config_file, output_dir, workers=4, intrabar=False, resample=False):
     """Download data based on symbols trading configuration."""
     # Load exchange config
     with open(exchange_config_file) as f:
         exchange_configs = json.load(f)
-    
+
     # Initialize MT5 (use 'mt5' key from config)
     if "mt5" not in exchange_configs:
-        print("[-] MT5 configuration not found in exchange config")
+        bot_logger.error("[-] MT5 configuration not found in exchange config")
         return False
-    
-    if not initialize_mt5(exchange_configs["mt5"]):
+
+    mt5 = initialize_mt5(exchange_configs["mt5"])
+    if mt5 is None:
         return False
-    
+
     # Load symbols config
     with open(symbols_config_file) as f:
         symbols_config = json.load(f)
-    
-    print(f"\n[*] Starting data download...")
-    print(f"    Output directory: {output_dir}\n")
-    
-    total_files = 0
-    successful = 0
-    
-    for symbol_cfg in symbols_config:
-        symbol = symbol_cfg["symbol"]
-        year = symbol_cfg["year"]
-        months = symbol_cfg["months"]
-        
-        print(f"[+] Downloading data for {symbol} ({year}, months: {months})")
-        
-        # Get unique intervals from all strategies
-        intervals = set()
-        for strategy in symbol_cfg["strategies"]:
-            tf = strategy["tfs"].get("tf")
-            if tf:
-                intervals.add(tf)
-        
-        # Download data for each interval and month
-        for interval in intervals:
-            for month in sorted(months):
-                total_files += 1
-                if download_monthly_data(symbol, interval, month, year, output_dir):
-                    successful += 1
-        
-        print()
-    
-    print(f"[*] Download complete: {successful}/{total_files} files downloaded successfully")
-    
+
+    files = get_required_files(symbols_config, intrabar, resample)
+    bot_logger.info("[*] Starting data download of {} files...".format(len(files)))
+    bot_logger.info("    Output directory: {}".format(output_dir))
+    start_time = time.perf_counter()
+    up_to_date = KlinesDownloader(mt5, output_dir, workers).download(files)
+    bot_logger.info(
+        "[*] Download complete: {}/{} files up to date in {:.1f}s".format(
+            up_to_date, len(files), time.perf_counter() - start_time
+        )
+    )
+
     mt5.shutdown()
-    return successful == total_files
+    if resample:
+        return build_resampled_files(output_dir, get_resampled_files(symbols_config)) and up_to_date == len(files)
+    return up_to_date == len(files)
 
 
 def main():
     parser = argparse.ArgumentParser(description="Download historical data from MT5 for backtesting")
-    parser.add_argument("--exch_cfg_file", required=True, type=str, 
+    parser.add_argument("--exch_cfg_file", required=True, type=str,
                        help="Path to exchange config file (e.g., configs/exchange_config.json)")
     parser.add_argument("--sym_cfg_file", required=True, type=str,
                        help="Path to symbols trading config file (e.g., configs/symbols_trading_config.json)")
     parser.add_argument("--output_dir", required=True, type=str,
                        help="Output directory for CSV files (e.g., ./data)")
-    
+    parser.add_argument("--workers", required=False, type=int, default=4,
+                       help="Threads writing CSV files while klines are fetched")
+    parser.add_argument("--intrabar", action="store_true",
+                       help="Also download 1m klines used by backtest --intrabar")
+    parser.add_argument("--resample", action="store_true",
+                       help="Download only 1m klines and build the other timeframes from them")
+
     args = parser.parse_args()
-    
-    download_from_config(args.exch_cfg_file, args.sym_cfg_file, args.output_dir)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    download_from_config(
+        args.exch_cfg_file, args.sym_cfg_file, args.output_dir, args.workers, args.intrabar, args.resample
+    )
 
 
 if __name__ == "__main__":
     main()
-
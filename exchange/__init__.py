@@ -1,2 +1,3 @@
 from .mt5_api import MT5API
-from .mt5_oms import MT5OMS
\ No newline at end of file
+from .mt5_oms import MT5OMS
+from .mt5_sim import SimAPI
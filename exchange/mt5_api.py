@@ -2,28 +2,31 @@ import time
 import logging
 from datetime import datetime, timedelta
 import pandas as pd
-import MetaTrader5 as mt5
 
 bot_logger = logging.getLogger("bot_logger")
 
 
 class MT5API:
-    def __init__(self, config):
+    def __init__(self, config, terminal=None):
         self.config = config
+        # MetaTrader5 module, or a simulated terminal exposing the same functions and constants
+        if terminal is None:
+            import MetaTrader5 as terminal
+        self.mt5 = terminal
 
     def initialize(self):
         # connect to MetaTrader 5
-        if not mt5.initialize():
-            mt5.shutdown()
+        if not self.mt5.initialize():
+            self.mt5.shutdown()
             return False
         return True
 
     def login(self):
         # connect to the trade account specifying a server
-        authorized = mt5.login(self.config["account"], server=self.config["server"])
+        authorized = self.mt5.login(self.config["account"], server=self.config["server"])
         if authorized:
             bot_logger.info("[+] Login success, account info: ")
-            account_info = mt5.account_info()._asdict()
+            account_info = self.mt5.account_info()._asdict()
             bot_logger.info(account_info)
             return True
         else:
@@ -31,7 +34,7 @@ class MT5API:
             return False
 
     def round_price(self, symbol, price):
-        symbol_info = mt5.symbol_info(symbol)
+        symbol_info = self.mt5.symbol_info(symbol)
         return round(price, symbol_info.digits)
     
     def get_filling_mode(self, symbol):
@@ -42,10 +45,10 @@ class MT5API:
         - SYMBOL_FILLING_IOC = 2 (bit 1)
         - SYMBOL_FILLING_RETURN = 4 (bit 2)
         """
-        symbol_info = mt5.symbol_info(symbol)
+        symbol_info = self.mt5.symbol_info(symbol)
         if symbol_info is None:
             bot_logger.warning("[-] Cannot get symbol info for {}, using default FOK".format(symbol))
-            return mt5.ORDER_FILLING_FOK
+            return self.mt5.ORDER_FILLING_FOK
         
         # Check which filling modes are supported
         # filling_mode is a bitmask where:
@@ -56,29 +59,33 @@ class MT5API:
         
         # Try in order of preference: IOC, FOK, RETURN
         if filling_mode & 2:  # SYMBOL_FILLING_IOC
-            return mt5.ORDER_FILLING_IOC
+            return self.mt5.ORDER_FILLING_IOC
         elif filling_mode & 1:  # SYMBOL_FILLING_FOK
-            return mt5.ORDER_FILLING_FOK
+            return self.mt5.ORDER_FILLING_FOK
         elif filling_mode & 4:  # SYMBOL_FILLING_RETURN
-            return mt5.ORDER_FILLING_RETURN
+            return self.mt5.ORDER_FILLING_RETURN
         else:
             # Default to FOK if unknown
             bot_logger.warning("[-] Unknown filling mode for {}, using FOK".format(symbol))
-            return mt5.ORDER_FILLING_FOK
+            return self.mt5.ORDER_FILLING_FOK
+
+    def get_time(self):
+        # time of the terminal, klines and deals are stamped with it
+        return datetime.now()
 
     def get_assets_balance(self, assets=["USD"]):
         assets = {}
         return assets
 
     def tick_ask_price(self, symbol):
-        return mt5.symbol_info_tick(symbol).ask
+        return self.mt5.symbol_info_tick(symbol).ask
 
     def tick_bid_price(self, symbol):
-        return mt5.symbol_info_tick(symbol).bid
+        return self.mt5.symbol_info_tick(symbol).bid
 
     def klines(self, symbol: str, interval: str, **kwargs):
-        symbol_rates = mt5.copy_rates_from_pos(
-            symbol, getattr(mt5, "TIMEFRAME_" + (interval[-1:] + interval[:-1]).upper()), 0, kwargs["limit"]
+        symbol_rates = self.mt5.copy_rates_from_pos(
+            symbol, getattr(self.mt5, "TIMEFRAME_" + (interval[-1:] + interval[:-1]).upper()), 0, kwargs["limit"]
         )
         df = pd.DataFrame(symbol_rates)
         df["time"] += -time.timezone
@@ -88,7 +95,13 @@ class MT5API:
         return df
 
     def place_order(self, params):
-        return mt5.order_send(params)
+        return self.mt5.order_send(params)
+
+    def history_deals_get(self, date_from, date_to):
+        return self.mt5.history_deals_get(date_from, date_to)
+
+    def positions_get(self, **kwargs):
+        return self.mt5.positions_get(**kwargs)
 
-    def history_deals_get(self, position_id):
-        return mt5.history_deals_get(position=position_id)
+    def orders_get(self, **kwargs):
+        return self.mt5.orders_get(**kwargs)
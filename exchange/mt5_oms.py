@@ -1,15 +1,14 @@
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
 from trade import Trade
 from order import Order, OrderType, OrderSide, OrderType
-import MetaTrader5 as mt5
 
 bot_logger = logging.getLogger("bot_logger")
 
 
 class MT5OrderTemplate:
-    def __init__(self, symbol, volume, entry, tp, sl, order_side: OrderSide, order_type: OrderType, mt5_api=None):
+    def __init__(self, symbol, volume, entry, tp, sl, order_side: OrderSide, order_type: OrderType, mt5_api):
         self.symbol = symbol
         self.volume = volume
         self.price = entry
@@ -20,12 +19,10 @@ class MT5OrderTemplate:
         self.mt5_api = mt5_api
 
     def get_main_order(self):
+        mt5 = self.mt5_api.mt5
         # Get appropriate filling mode for this symbol
-        if self.mt5_api:
-            filling_mode = self.mt5_api.get_filling_mode(self.symbol)
-        else:
-            filling_mode = mt5.ORDER_FILLING_FOK  # Default fallback
-        
+        filling_mode = self.mt5_api.get_filling_mode(self.symbol)
+
         params = {
             "symbol": self.symbol,
             "volume": self.volume,
@@ -46,12 +43,10 @@ class MT5OrderTemplate:
         return params
 
     def get_close_order(self):
+        mt5 = self.mt5_api.mt5
         # Get appropriate filling mode for this symbol
-        if self.mt5_api:
-            filling_mode = self.mt5_api.get_filling_mode(self.symbol)
-        else:
-            filling_mode = mt5.ORDER_FILLING_FOK  # Default fallback
-        
+        filling_mode = self.mt5_api.get_filling_mode(self.symbol)
+
         params = {
             "action": mt5.TRADE_ACTION_DEAL,
             "symbol": self.symbol,
@@ -68,9 +63,39 @@ class MT5OrderTemplate:
 class MT5OMS:
     def __init__(self, exchange):
         self.mt5_api = exchange
+        self.mt5 = exchange.mt5
         self.active_trades = {}
         self.closed_trades = {}
-        self.start_time = datetime.now()
+        # order/position ticket -> trade_id of active trades
+        self.active_tickets = {}
+        # position ticket -> trade_id of closed trades
+        self.closed_tickets = {}
+        # deal ticket -> deal of closed trades
+        self.deals = {}
+        self.journal = None
+        # LiveMetrics timing order_send and counting its retcodes, None when not measured
+        self.metrics = None
+        self.start_time = self.mt5_api.get_time()
+
+    def attach_journal(self, journal):
+        self.journal = journal
+
+    def attach_metrics(self, metrics):
+        self.metrics = metrics
+
+    def place_order(self, params):
+        result = self.mt5_api.place_order(params)
+        if self.metrics:
+            self.metrics.inc("order_send", retcode=str(result.retcode) if result is not None else "none")
+        return result
+
+    def get_open_trades(self):
+        # {(("symbol", symbol),): number of active trades}, gauge of LiveMetrics
+        open_trades = {}
+        for trade in list(self.active_trades.values()):
+            key = (("symbol", trade.order["symbol"]),)
+            open_trades[key] = open_trades.get(key, 0) + 1
+        return open_trades
 
     def create_trade(self, order: Order, volume):
         # round tp/sl price
@@ -81,7 +106,7 @@ class MT5OMS:
         order.entry = self.mt5_api.round_price(order["symbol"], order.entry)
 
         trade = Trade(order, volume)
-        bot_logger.info("   [*] create trade, trade_id: {}".format(trade.trade_id))
+        bot_logger.info("   [*] create trade, trade_id: %s", trade.trade_id)
         order_tpl = MT5OrderTemplate(order["symbol"], volume, order.entry, order.tp, order.sl, order.side, order.type, self.mt5_api)
         trade.main_order_params = order_tpl.get_main_order()
         trade.close_order_params = order_tpl.get_close_order()
@@ -92,17 +117,24 @@ class MT5OMS:
             else:
                 trade.main_order_params["price"] = self.mt5_api.tick_bid_price(order["symbol"])
         trade.main_order_params["comment"] = order["description"]
-        result = self.mt5_api.place_order(trade.main_order_params)
+        if self.metrics:
+            self.metrics.mark(order["symbol"], "order_sent")
+        result = self.place_order(trade.main_order_params)
+        if self.metrics:
+            self.metrics.mark(order["symbol"], "order_result")
         result_dict = result._asdict()
         result_dict["request"] = result_dict["request"]._asdict()
         trade.main_order = result_dict
         trade.close_order_params["position"] = result_dict["order"]
-        if result.retcode == mt5.TRADE_RETCODE_DONE:
+        if result.retcode == self.mt5.TRADE_RETCODE_DONE:
             bot_logger.info("       [+] create main order success")
             self.active_trades[trade.trade_id] = trade
+            self.active_tickets[result.order] = trade.trade_id
+            if self.journal:
+                self.journal.open_trade(trade)
             return trade.trade_id
         else:
-            bot_logger.info("       [+] create main order failed: {}".format(result_dict))
+            bot_logger.info("       [+] create main order failed: %s", result_dict)
             self.closed_trades[trade.trade_id] = trade
             return None
 
@@ -110,52 +142,93 @@ class MT5OMS:
         return self.active_trades.get(trade_id)
 
     def close_trade(self, trade_id):
-        bot_logger.debug("  [*] close trade: {}".format(trade_id))
+        bot_logger.debug("  [*] close trade: %s", trade_id)
         trade = self.get_trade(trade_id)
         if trade is None:
-            bot_logger.debug("  [*] trade: {} not exist or already closed".format(trade_id))
+            bot_logger.debug("  [*] trade: %s not exist or already closed", trade_id)
             return
         # check if order is type limit and pending
-        result = mt5.orders_get(ticket=trade.main_order["order"])
-        if len(result) > 0:
+        result = self.mt5_api.orders_get(ticket=trade.main_order["order"])
+        if result is not None and len(result) > 0:
             pending_order = result[0]
-            if pending_order.state == mt5.ORDER_STATE_PLACED:
+            if pending_order.state == self.mt5.ORDER_STATE_PLACED:
                 request = {
-                    "action": mt5.TRADE_ACTION_REMOVE,
+                    "action": self.mt5.TRADE_ACTION_REMOVE,
                     "symbol": trade.order["symbol"],
                     "order": trade.main_order["order"],
                 }
-                result = self.mt5_api.place_order(request)
-                if result.retcode == mt5.TRADE_RETCODE_DONE:
+                result = self.place_order(request)
+                if result.retcode == self.mt5.TRADE_RETCODE_DONE:
                     bot_logger.info("       [+] close limit trade success")
                 else:
-                    bot_logger.info("       [+] close limit trade failed: {}".format(result._asdict()))
+                    bot_logger.info("       [+] close limit trade failed: %s", result._asdict())
         else:
             # update ask/bid price for market order
             if trade.order.side == OrderSide.BUY:
                 trade.close_order_params["price"] = self.mt5_api.tick_bid_price(trade.order["symbol"])
             else:
                 trade.close_order_params["price"] = self.mt5_api.tick_ask_price(trade.order["symbol"])
-            result = self.mt5_api.place_order(trade.close_order_params)
+            result = self.place_order(trade.close_order_params)
             result_dict = result._asdict()
             result_dict["request"] = result_dict["request"]._asdict()
             trade.close_order = result_dict
-            if result.retcode == mt5.TRADE_RETCODE_DONE:
+            if result.retcode == self.mt5.TRADE_RETCODE_DONE:
                 bot_logger.info("       [+] close trade success")
             else:
-                bot_logger.info("       [+] close trade failed: {}".format(result_dict))
-        self.closed_trades[trade_id] = self.active_trades[trade_id]
-        del self.active_trades[trade_id]
+                bot_logger.info("       [+] close trade failed: %s", result_dict)
+        self.deactivate_trade(trade_id, "CLOSED_BY_BOT")
+
+    def deactivate_trade(self, trade_id, reason):
+        # move trade from active to closed, trade may already be moved by monitor_trades
+        trade = self.active_trades.pop(trade_id, None)
+        if trade is None:
+            return None
+        self.active_tickets.pop(trade.main_order["order"], None)
+        self.closed_tickets[trade.main_order["order"]] = trade_id
+        self.closed_trades[trade_id] = trade
+        if self.journal:
+            self.journal.close_trade(trade_id, reason)
+        return trade
+
+    def restore_trades(self, trades, open_tickets):
+        # re-activate journaled trades whose position/order is still open in terminal
+        # return restored trades, the others were closed while bot was down
+        restored_trades = []
+        for trade_id, trade in trades.items():
+            Trade.__trade_id__ = max(Trade.__trade_id__, trade_id + 1)
+            Order.__order_id__ = max(Order.__order_id__, trade.order.order_id + 1)
+            ticket = trade.main_order["order"]
+            self.active_trades[trade_id] = trade
+            self.active_tickets[ticket] = trade_id
+            if ticket in open_tickets:
+                trade.trace.append({"event": "RESTORED", "time": datetime.now()})
+                restored_trades.append(trade)
+            else:
+                self.deactivate_trade(trade_id, "CLOSED_OFFLINE")
+        bot_logger.info(
+            "[+] Restore trades: {} active, {} closed while offline".format(
+                len(restored_trades), len(trades) - len(restored_trades)
+            )
+        )
+        # opened by hand, by another EA or by a run whose journal was lost, they are left to their owner
+        orphan_tickets = open_tickets - set(trade.main_order["order"] for trade in trades.values())
+        if len(orphan_tickets) > 0:
+            bot_logger.warning(
+                "[-] {} open positions/orders not in trade journal, not managed: {}".format(
+                    len(orphan_tickets), sorted(orphan_tickets)
+                )
+            )
+        return restored_trades
 
     def adjust_sl(self, trade_id, sl):
-        bot_logger.debug("  [+] adjust sl, trade: {}, sl: {}".format(trade_id, sl))
+        bot_logger.debug("  [+] adjust sl, trade: %s, sl: %s", trade_id, sl)
         trade = self.get_trade(trade_id)
         if trade is None:
-            bot_logger.debug("  [*] trade: {} not exist or already closed".format(trade_id))
+            bot_logger.debug("  [*] trade: %s not exist or already closed", trade_id)
             return
         sl = self.mt5_api.round_price(trade.order["symbol"], sl)
         params = {
-            "action": mt5.TRADE_ACTION_SLTP,
+            "action": self.mt5.TRADE_ACTION_SLTP,
             "symbol": trade.order["symbol"],
             "position": trade.main_order["order"],
             "sl": sl,
@@ -163,22 +236,24 @@ class MT5OMS:
         if trade.order.tp:
             params["tp"] = trade.order.tp
 
-        result = self.mt5_api.place_order(params)
-        if result.retcode == mt5.TRADE_RETCODE_DONE:
+        result = self.place_order(params)
+        if result.retcode == self.mt5.TRADE_RETCODE_DONE:
             bot_logger.info("       [+] adjust sl success")
             trade.order.sl = sl
+            if self.journal:
+                self.journal.adjust_sl(trade_id, sl)
         else:
             bot_logger.info("       [+] adjust sl failed")
 
     def adjust_tp(self, trade_id, tp):
-        bot_logger.debug("  [+] adjust tp, trade: {}, tp: {}".format(trade_id, tp))
+        bot_logger.debug("  [+] adjust tp, trade: %s, tp: %s", trade_id, tp)
         trade = self.get_trade(trade_id)
         if trade is None:
-            bot_logger.debug("  [*] trade: {} not exist or already closed".format(trade_id))
+            bot_logger.debug("  [*] trade: %s not exist or already closed", trade_id)
             return
         tp = self.mt5_api.round_price(trade.order["symbol"], tp)
         params = {
-            "action": mt5.TRADE_ACTION_SLTP,
+            "action": self.mt5.TRADE_ACTION_SLTP,
             "symbol": trade.order["symbol"],
             "position": trade.main_order["order"],
             "tp": tp,
@@ -186,29 +261,76 @@ class MT5OMS:
         if trade.order.sl:
             params["sl"] = trade.order.sl
 
-        result = self.mt5_api.place_order(params)
-        if result.retcode == mt5.TRADE_RETCODE_DONE:
+        result = self.place_order(params)
+        if result.retcode == self.mt5.TRADE_RETCODE_DONE:
             bot_logger.info("       [+] adjust tp success")
             trade.order.tp = tp
+            if self.journal:
+                self.journal.adjust_tp(trade_id, tp)
         else:
             bot_logger.info("       [+] adjust tp failed")
 
+    def get_open_tickets(self):
+        # tickets of all open positions and pending orders, one positions_get and one orders_get call
+        positions = self.mt5_api.positions_get()
+        orders = self.mt5_api.orders_get()
+        if positions is None or orders is None:
+            return None
+        open_tickets = set(position.identifier for position in positions)
+        open_tickets.update(order.ticket for order in orders)
+        return open_tickets
+
     def monitor_trades(self):
+        # reconcile active trades with terminal, trades closed by broker side SL/TP are moved to closed trades
         if len(self.active_trades) == 0:
             return
+        # snapshot index before querying terminal, trades created meanwhile are checked next cycle
+        active_tickets = list(self.active_tickets.items())
+        open_tickets = self.get_open_tickets()
+        if open_tickets is None:
+            bot_logger.warning("   [-] Monitor trades failed, cannot get positions/orders: {}".format(self.mt5.last_error()))
+            return
+        closed_trade_ids = [trade_id for ticket, trade_id in active_tickets if ticket not in open_tickets]
+        if len(closed_trade_ids) == 0:
+            return
+        curr_time = datetime.now()
+        for trade_id in closed_trade_ids:
+            trade = self.deactivate_trade(trade_id, "CLOSED_BY_EXCHANGE")
+            if trade is not None:
+                trade.trace.append({"event": "CLOSED_BY_EXCHANGE", "time": curr_time})
+        bot_logger.info("   [*] Monitor trades, closed by exchange: %s", closed_trade_ids)
 
     def close_all_trade(self):
         bot_logger.debug("  [*] close all trade")
         for trade_id in list(self.active_trades.keys()):
             self.close_trade(trade_id)
 
+    def sync_income_history(self):
+        # fetch deals of the session in one range query, join them with closed trades by position ticket
+        # return deals not synced before
+        if len(self.closed_tickets) == 0:
+            return pd.DataFrame()
+        # deal time is server time, widen the window one day each side, deals of other positions are dropped by join
+        result = self.mt5_api.history_deals_get(
+            self.start_time - timedelta(days=1), self.mt5_api.get_time() + timedelta(days=1)
+        )
+        if result is None:
+            bot_logger.warning("   [-] Sync income history failed: {}".format(self.mt5.last_error()))
+            return pd.DataFrame()
+        new_deals = []
+        for deal in result:
+            trade_id = self.closed_tickets.get(deal.position_id)
+            if trade_id is None or deal.ticket in self.deals:
+                continue
+            deal_dict = deal._asdict()
+            deal_dict["trade_id"] = trade_id
+            self.deals[deal.ticket] = deal_dict
+            new_deals.append(deal_dict)
+        return pd.DataFrame(new_deals)
+
     def get_income_history(self):
-        total_deals = []
-        for _, trade in self.closed_trades.items():
-            result = self.mt5_api.history_deals_get(trade.main_order["order"])
-            if result:
-                total_deals.extend([res._asdict() for res in result])
-        return pd.DataFrame(total_deals)
+        # deals synced so far, call sync_income_history to fetch new deals
+        return pd.DataFrame(list(self.deals.values()))
 
     def get_trades(self):
         return self.closed_trades, self.active_trades
@@ -0,0 +1,581 @@
+import os
+import glob
+import time
+import random
+import fnmatch
+import threading
+import logging
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from .mt5_api import MT5API
+
+bot_logger = logging.getLogger("bot_logger")
+
+AccountInfo = namedtuple("AccountInfo", ["login", "server", "balance", "equity", "currency", "leverage"])
+SymbolInfo = namedtuple("SymbolInfo", ["name", "digits", "point", "filling_mode", "trade_contract_size"])
+Tick = namedtuple("Tick", ["time", "bid", "ask", "last", "volume", "time_msc"])
+TradeRequest = namedtuple(
+    "TradeRequest",
+    [
+        "action",
+        "magic",
+        "order",
+        "symbol",
+        "volume",
+        "price",
+        "stoplimit",
+        "sl",
+        "tp",
+        "deviation",
+        "type",
+        "type_filling",
+        "type_time",
+        "expiration",
+        "comment",
+        "position",
+        "position_by",
+    ],
+)
+OrderSendResult = namedtuple(
+    "OrderSendResult",
+    ["retcode", "deal", "order", "volume", "price", "bid", "ask", "comment", "request_id", "retcode_external", "request"],
+)
+TradePosition = namedtuple(
+    "TradePosition",
+    [
+        "ticket",
+        "time",
+        "type",
+        "magic",
+        "identifier",
+        "volume",
+        "price_open",
+        "sl",
+        "tp",
+        "price_current",
+        "profit",
+        "symbol",
+        "comment",
+    ],
+)
+TradeOrder = namedtuple(
+    "TradeOrder",
+    ["ticket", "time_setup", "type", "state", "magic", "volume_current", "price_open", "sl", "tp", "symbol", "comment"],
+)
+TradeDeal = namedtuple(
+    "TradeDeal",
+    [
+        "ticket",
+        "order",
+        "time",
+        "type",
+        "entry",
+        "magic",
+        "position_id",
+        "reason",
+        "volume",
+        "price",
+        "commission",
+        "swap",
+        "profit",
+        "symbol",
+        "comment",
+    ],
+)
+
+RATES_DTYPE = [
+    ("time", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("tick_volume", "<u8"),
+    ("spread", "<i4"),
+    ("real_volume", "<u8"),
+]
+
+
+class SimTerminal:
+    # Simulated MetaTrader5 terminal, exposes the subset of MetaTrader5 functions and constants used by MT5API/MT5OMS.
+    # Klines are served from the local monthly kline csv files ({symbol}-{tf}-{year}-{month}.csv) on a clock
+    # started at config "start_time" and running "speed" times faster than wall clock.
+    # Market orders fill at current bar open +/- spread, after "fill_latency_ms" and up to "slippage_points"
+    # adverse slippage. Pending orders and SL/TP are matched against closed bars of the smallest timeframe.
+
+    # constants, same values as MetaTrader5
+    TIMEFRAME_M1 = 1
+    TIMEFRAME_M3 = 3
+    TIMEFRAME_M5 = 5
+    TIMEFRAME_M15 = 15
+    TIMEFRAME_M30 = 30
+    TIMEFRAME_H1 = 16385
+    TIMEFRAME_H2 = 16386
+    TIMEFRAME_H4 = 16388
+    TIMEFRAME_D1 = 16408
+    TIMEFRAME_W1 = 32769
+    TIMEFRAME_MN1 = 49153
+    ORDER_TYPE_BUY = 0
+    ORDER_TYPE_SELL = 1
+    ORDER_TYPE_BUY_LIMIT = 2
+    ORDER_TYPE_SELL_LIMIT = 3
+    ORDER_FILLING_FOK = 0
+    ORDER_FILLING_IOC = 1
+    ORDER_FILLING_RETURN = 2
+    ORDER_TIME_GTC = 0
+    ORDER_STATE_PLACED = 1
+    ORDER_STATE_CANCELED = 2
+    ORDER_STATE_FILLED = 4
+    TRADE_ACTION_DEAL = 1
+    TRADE_ACTION_PENDING = 5
+    TRADE_ACTION_SLTP = 6
+    TRADE_ACTION_REMOVE = 8
+    TRADE_RETCODE_DONE = 10009
+    TRADE_RETCODE_INVALID = 10013
+    TRADE_RETCODE_MARKET_CLOSED = 10018
+    TRADE_RETCODE_POSITION_CLOSED = 10036
+    POSITION_TYPE_BUY = 0
+    POSITION_TYPE_SELL = 1
+    DEAL_TYPE_BUY = 0
+    DEAL_TYPE_SELL = 1
+    DEAL_ENTRY_IN = 0
+    DEAL_ENTRY_OUT = 1
+    DEAL_REASON_EXPERT = 3
+    DEAL_REASON_SL = 4
+    DEAL_REASON_TP = 5
+
+    # timeframe constant -> kline csv interval, from small to large
+    TIMEFRAME_INTERVALS = {
+        TIMEFRAME_M1: "1m",
+        TIMEFRAME_M3: "3m",
+        TIMEFRAME_M5: "5m",
+        TIMEFRAME_M15: "15m",
+        TIMEFRAME_M30: "30m",
+        TIMEFRAME_H1: "1h",
+        TIMEFRAME_H2: "2h",
+        TIMEFRAME_H4: "4h",
+        TIMEFRAME_D1: "1d",
+    }
+
+    def __init__(self, config):
+        self.config = config
+        self.data_dir = config.get("data_dir", "data")
+        self.speed = config.get("speed", 1)
+        self.fill_latency = config.get("fill_latency_ms", 0) / 1000
+        self.slippage_points = config.get("slippage_points", 0)
+        self.spread_points = config.get("spread_points", 0)
+        self.contract_size = config.get("contract_size", 100000)
+        # symbol pattern -> symbol of the kline files, lets many simulated symbols share one data set
+        self.symbol_data = config.get("symbol_data", {})
+        self.random = random.Random(config.get("seed"))
+        self.lock = threading.RLock()
+        self.start_time = pd.Timestamp(config["start_time"])
+        self.wall_start_time = None
+        self.account = config.get("account", 0)
+        self.server = config.get("server", "sim")
+        self.balance = config.get("balance", 10000)
+        # (symbol, interval) -> dict of numpy arrays, loaded on first use
+        self.bars = {}
+        self.symbol_infos = {}
+        self.ticket = 0
+        self.positions = {}
+        self.orders = {}
+        self.deals = []
+        # symbol -> index of the last bar matched against pending orders and SL/TP
+        self.matched_index = {}
+        self.error = (1, "Success")
+
+    def initialize(self):
+        self.wall_start_time = time.time()
+        bot_logger.info(
+            "[+] Sim terminal start at: {}, speed: x{}, data dir: {}".format(self.start_time, self.speed, self.data_dir)
+        )
+        return True
+
+    def shutdown(self):
+        pass
+
+    def login(self, account, server=None):
+        self.account = account
+        self.server = server
+        return True
+
+    def last_error(self):
+        return self.error
+
+    def now(self):
+        if self.wall_start_time is None:
+            return self.start_time.to_pydatetime()
+        elapsed = (time.time() - self.wall_start_time) * self.speed
+        return (self.start_time + pd.Timedelta(seconds=elapsed)).to_pydatetime()
+
+    def account_info(self):
+        return AccountInfo(self.account, self.server, self.balance, self.balance, "USD", 100)
+
+    def get_data_symbol(self, symbol):
+        for pattern, data_symbol in self.symbol_data.items():
+            if fnmatch.fnmatch(symbol, pattern):
+                return data_symbol
+        return symbol
+
+    def get_bars(self, symbol, interval):
+        key = (symbol, interval)
+        if key not in self.bars:
+            data_symbol = self.get_data_symbol(symbol)
+            files = sorted(glob.glob(os.path.join(self.data_dir, "{}-{}-*.csv".format(data_symbol, interval))))
+            if len(files) == 0:
+                self.bars[key] = None
+                return None
+            df = pd.concat([pd.read_csv(f) for f in files], ignore_index=True)
+            df["Open time"] = pd.to_datetime(df["Open time"])
+            df = df.sort_values("Open time").drop_duplicates("Open time")
+            self.bars[key] = {
+                "time": df["Open time"].values.astype("datetime64[ns]"),
+                "open": df["Open"].values.astype(float),
+                "high": df["High"].values.astype(float),
+                "low": df["Low"].values.astype(float),
+                "close": df["Close"].values.astype(float),
+                "volume": df["Volume"].values.astype(np.uint64),
+            }
+            bot_logger.info("   [+] Sim load {} {}: {} bars from {} files".format(symbol, interval, len(df), len(files)))
+        return self.bars[key]
+
+    def get_price_bars(self, symbol):
+        # bars of the smallest timeframe available, used for ticks and order matching
+        for interval in self.TIMEFRAME_INTERVALS.values():
+            bars = self.get_bars(symbol, interval)
+            if bars is not None:
+                return bars
+        return None
+
+    def current_index(self, bars, curr_time):
+        # index of the bar forming at curr_time
+        return int(np.searchsorted(bars["time"], np.datetime64(curr_time, "ns"), side="right")) - 1
+
+    def symbol_info(self, symbol):
+        with self.lock:
+            return self.get_symbol_info(symbol)
+
+    def get_symbol_info(self, symbol):
+        if symbol not in self.symbol_infos:
+            bars = self.get_price_bars(symbol)
+            if bars is None:
+                return None
+            # smallest number of decimals representing every sampled price
+            sample = bars["close"][-1000:]
+            digits = next(d for d in range(9) if d == 8 or np.allclose(np.round(sample, d), sample, rtol=0, atol=1e-10))
+            self.symbol_infos[symbol] = SymbolInfo(symbol, digits, 10**-digits, 3, self.contract_size)
+        return self.symbol_infos[symbol]
+
+    def symbol_info_tick(self, symbol):
+        with self.lock:
+            curr_time = self.now()
+            self.match_orders(symbol, curr_time)
+            return self.get_tick(symbol, curr_time)
+
+    def get_tick(self, symbol, curr_time):
+        bars = self.get_price_bars(symbol)
+        if bars is None:
+            return None
+        index = self.current_index(bars, curr_time)
+        if index < 0:
+            return None
+        # only the open of the forming bar is known at curr_time
+        bid = bars["open"][index]
+        ask = bid + self.spread_points * self.get_symbol_info(symbol).point
+        return Tick(self.to_server_time(curr_time), bid, ask, bid, 0, self.to_server_time(curr_time) * 1000)
+
+    def to_server_time(self, dt):
+        # kline files store local time, MT5API.klines converts server time back with -time.timezone
+        return int(pd.Timestamp(dt).value // 10**9) + time.timezone
+
+    def copy_rates_from_pos(self, symbol, timeframe, start_pos, count):
+        with self.lock:
+            return self.get_rates(symbol, timeframe, start_pos, count)
+
+    def get_rates(self, symbol, timeframe, start_pos, count):
+        interval = self.TIMEFRAME_INTERVALS.get(timeframe)
+        bars = self.get_bars(symbol, interval) if interval else None
+        if bars is None:
+            self.error = (-2, "Invalid params: no klines for {} {}".format(symbol, interval))
+            return None
+        end = self.current_index(bars, self.now()) + 1 - start_pos
+        start = max(end - count, 0)
+        if end <= start:
+            return np.empty(0, dtype=RATES_DTYPE)
+        rates = np.empty(end - start, dtype=RATES_DTYPE)
+        rates["time"] = bars["time"][start:end].astype("datetime64[s]").astype(np.int64) + time.timezone
+        for field in ["open", "high", "low", "close"]:
+            rates[field] = bars[field][start:end]
+        rates["tick_volume"] = bars["volume"][start:end]
+        rates["spread"] = self.spread_points
+        rates["real_volume"] = 0
+        return rates
+
+    def next_ticket(self):
+        self.ticket += 1
+        return self.ticket
+
+    def get_request(self, request):
+        return TradeRequest(**{field: request.get(field, 0) for field in TradeRequest._fields})
+
+    def get_result(self, request, retcode, order=0, deal=0, price=0.0, tick=None, comment=""):
+        return OrderSendResult(
+            retcode,
+            deal,
+            order,
+            request.get("volume", 0),
+            price,
+            tick.bid if tick else 0.0,
+            tick.ask if tick else 0.0,
+            comment,
+            0,
+            0,
+            self.get_request(request),
+        )
+
+    def order_send(self, request):
+        if self.fill_latency > 0:
+            time.sleep(self.fill_latency)
+        with self.lock:
+            curr_time = self.now()
+            symbol = request["symbol"]
+            self.match_orders(symbol, curr_time)
+            tick = self.get_tick(symbol, curr_time)
+            if tick is None:
+                return self.get_result(request, self.TRADE_RETCODE_MARKET_CLOSED, comment="Market closed")
+            action = request["action"]
+            if action == self.TRADE_ACTION_DEAL and not request.get("position"):
+                return self.open_position(request, tick, curr_time)
+            elif action == self.TRADE_ACTION_DEAL:
+                return self.close_position(request, tick, curr_time)
+            elif action == self.TRADE_ACTION_PENDING:
+                return self.place_pending_order(request, tick, curr_time)
+            elif action == self.TRADE_ACTION_REMOVE:
+                return self.remove_pending_order(request, tick)
+            elif action == self.TRADE_ACTION_SLTP:
+                return self.modify_position(request, tick)
+            return self.get_result(request, self.TRADE_RETCODE_INVALID, tick=tick, comment="Invalid request")
+
+    def slippage(self, symbol):
+        return self.random.randint(0, self.slippage_points) * self.get_symbol_info(symbol).point
+
+    def open_position(self, request, tick, curr_time):
+        is_buy = request["type"] == self.ORDER_TYPE_BUY
+        slippage = self.slippage(request["symbol"])
+        price = tick.ask + slippage if is_buy else tick.bid - slippage
+        ticket = self.next_ticket()
+        deal = self.add_position(ticket, request, price, curr_time)
+        return self.get_result(request, self.TRADE_RETCODE_DONE, ticket, deal, price, tick, "Request executed")
+
+    def add_position(self, ticket, request, price, curr_time):
+        # position identifier is the ticket of the order opening it, as in MT5
+        is_buy = request["type"] in (self.ORDER_TYPE_BUY, self.ORDER_TYPE_BUY_LIMIT)
+        self.positions[ticket] = {
+            "ticket": ticket,
+            "time": curr_time,
+            "type": self.POSITION_TYPE_BUY if is_buy else self.POSITION_TYPE_SELL,
+            "magic": request.get("magic", 0),
+            "identifier": ticket,
+            "volume": request["volume"],
+            "price_open": price,
+            "sl": request.get("sl", 0.0),
+            "tp": request.get("tp", 0.0),
+            "symbol": request["symbol"],
+            "comment": request.get("comment", ""),
+        }
+        deal_type = self.DEAL_TYPE_BUY if is_buy else self.DEAL_TYPE_SELL
+        return self.add_deal(self.positions[ticket], deal_type, self.DEAL_ENTRY_IN, self.DEAL_REASON_EXPERT, price, 0.0, curr_time)
+
+    def add_deal(self, position, deal_type, entry, reason, price, profit, curr_time):
+        ticket = self.next_ticket()
+        deal = TradeDeal(
+            ticket,
+            position["ticket"],
+            self.to_server_time(curr_time),
+            deal_type,
+            entry,
+            position["magic"],
+            position["identifier"],
+            reason,
+            position["volume"],
+            price,
+            0.0,
+            0.0,
+            profit,
+            position["symbol"],
+            position["comment"],
+        )
+        self.deals.append((curr_time, deal))
+        return ticket
+
+    def get_profit(self, position, price):
+        direction = 1 if position["type"] == self.POSITION_TYPE_BUY else -1
+        return round((price - position["price_open"]) * direction * position["volume"] * self.contract_size, 2)
+
+    def remove_position(self, position, reason, price, curr_time):
+        del self.positions[position["ticket"]]
+        profit = self.get_profit(position, price)
+        self.balance += profit
+        deal_type = self.DEAL_TYPE_SELL if position["type"] == self.POSITION_TYPE_BUY else self.DEAL_TYPE_BUY
+        return self.add_deal(position, deal_type, self.DEAL_ENTRY_OUT, reason, price, profit, curr_time)
+
+    def close_position(self, request, tick, curr_time):
+        position = self.positions.get(request["position"])
+        if position is None:
+            return self.get_result(request, self.TRADE_RETCODE_POSITION_CLOSED, tick=tick, comment="Position doesn't exist")
+        slippage = self.slippage(request["symbol"])
+        price = tick.bid - slippage if position["type"] == self.POSITION_TYPE_BUY else tick.ask + slippage
+        deal = self.remove_position(position, self.DEAL_REASON_EXPERT, price, curr_time)
+        return self.get_result(request, self.TRADE_RETCODE_DONE, position["ticket"], deal, price, tick, "Request executed")
+
+    def place_pending_order(self, request, tick, curr_time):
+        ticket = self.next_ticket()
+        self.orders[ticket] = {
+            "ticket": ticket,
+            "time_setup": curr_time,
+            "type": request["type"],
+            "state": self.ORDER_STATE_PLACED,
+            "magic": request.get("magic", 0),
+            "volume_current": request["volume"],
+            "price_open": request["price"],
+            "sl": request.get("sl", 0.0),
+            "tp": request.get("tp", 0.0),
+            "symbol": request["symbol"],
+            "comment": request.get("comment", ""),
+            "request": request,
+        }
+        return self.get_result(request, self.TRADE_RETCODE_DONE, ticket, 0, request["price"], tick, "Request executed")
+
+    def remove_pending_order(self, request, tick):
+        if self.orders.pop(request["order"], None) is None:
+            return self.get_result(request, self.TRADE_RETCODE_INVALID, tick=tick, comment="Order doesn't exist")
+        return self.get_result(request, self.TRADE_RETCODE_DONE, request["order"], tick=tick, comment="Request executed")
+
+    def modify_position(self, request, tick):
+        position = self.positions.get(request["position"])
+        if position is None:
+            return self.get_result(request, self.TRADE_RETCODE_POSITION_CLOSED, tick=tick, comment="Position doesn't exist")
+        position["sl"] = request.get("sl", 0.0)
+        position["tp"] = request.get("tp", 0.0)
+        return self.get_result(request, self.TRADE_RETCODE_DONE, position["ticket"], tick=tick, comment="Request executed")
+
+    def match_orders(self, symbol, curr_time):
+        # fill pending orders and close positions hitting SL/TP on bars closed since last match
+        bars = self.get_price_bars(symbol)
+        if bars is None:
+            return
+        end = self.current_index(bars, curr_time)
+        start = self.matched_index.get(symbol, end)
+        self.matched_index[symbol] = end
+        if end <= start:
+            return
+        times = bars["time"]
+        for order in [order for order in self.orders.values() if order["symbol"] == symbol]:
+            # bars opened before order setup may have traded before it
+            first = max(start, int(np.searchsorted(times, np.datetime64(order["time_setup"], "ns"), side="right")))
+            if order["type"] == self.ORDER_TYPE_BUY_LIMIT:
+                hits = bars["low"][first:end] <= order["price_open"]
+            else:
+                hits = bars["high"][first:end] >= order["price_open"]
+            if hits.any():
+                index = first + int(np.argmax(hits))
+                del self.orders[order["ticket"]]
+                self.add_position(order["ticket"], order["request"], order["price_open"], pd.Timestamp(times[index]).to_pydatetime())
+        for position in [position for position in self.positions.values() if position["symbol"] == symbol]:
+            self.match_position(position, bars, start, end)
+
+    def match_position(self, position, bars, start, end):
+        first = max(start, int(np.searchsorted(bars["time"], np.datetime64(position["time"], "ns"), side="right")))
+        is_buy = position["type"] == self.POSITION_TYPE_BUY
+        sl, tp = position["sl"], position["tp"]
+        lows, highs = bars["low"][first:end], bars["high"][first:end]
+        sl_hits = np.zeros(len(lows), dtype=bool)
+        tp_hits = np.zeros(len(lows), dtype=bool)
+        if sl:
+            sl_hits = lows <= sl if is_buy else highs >= sl
+        if tp:
+            tp_hits = highs >= tp if is_buy else lows <= tp
+        hits = sl_hits | tp_hits
+        if not hits.any():
+            return
+        i = int(np.argmax(hits))
+        index = first + i
+        bar_open = bars["open"][index]
+        # SL first when both are hit in one bar, a bar opening through the level fills at its open
+        if sl_hits[i]:
+            reason = self.DEAL_REASON_SL
+            price = min(sl, bar_open) if is_buy else max(sl, bar_open)
+        else:
+            reason = self.DEAL_REASON_TP
+            price = max(tp, bar_open) if is_buy else min(tp, bar_open)
+        self.remove_position(position, reason, price, pd.Timestamp(bars["time"][index]).to_pydatetime())
+
+    def match_all_orders(self, curr_time):
+        symbols = set(position["symbol"] for position in self.positions.values())
+        symbols.update(order["symbol"] for order in self.orders.values())
+        for symbol in symbols:
+            self.match_orders(symbol, curr_time)
+
+    def positions_get(self, symbol=None, ticket=None):
+        with self.lock:
+            curr_time = self.now()
+            self.match_all_orders(curr_time)
+            positions = []
+            for position in self.positions.values():
+                if (symbol is None or position["symbol"] == symbol) and (ticket is None or position["ticket"] == ticket):
+                    tick = self.get_tick(position["symbol"], curr_time)
+                    price = tick.bid if position["type"] == self.POSITION_TYPE_BUY else tick.ask
+                    positions.append(
+                        TradePosition(
+                            position["ticket"],
+                            self.to_server_time(position["time"]),
+                            position["type"],
+                            position["magic"],
+                            position["identifier"],
+                            position["volume"],
+                            position["price_open"],
+                            position["sl"],
+                            position["tp"],
+                            price,
+                            self.get_profit(position, price),
+                            position["symbol"],
+                            position["comment"],
+                        )
+                    )
+            return tuple(positions)
+
+    def orders_get(self, symbol=None, ticket=None):
+        with self.lock:
+            self.match_all_orders(self.now())
+            return tuple(
+                TradeOrder(
+                    order["ticket"],
+                    self.to_server_time(order["time_setup"]),
+                    order["type"],
+                    order["state"],
+                    order["magic"],
+                    order["volume_current"],
+                    order["price_open"],
+                    order["sl"],
+                    order["tp"],
+                    order["symbol"],
+                    order["comment"],
+                )
+                for order in self.orders.values()
+                if (symbol is None or order["symbol"] == symbol) and (ticket is None or order["ticket"] == ticket)
+            )
+
+    def history_deals_get(self, date_from, date_to):
+        with self.lock:
+            self.match_all_orders(self.now())
+            return tuple(deal for deal_time, deal in self.deals if date_from <= deal_time <= date_to)
+
+
+class SimAPI(MT5API):
+    # MT5API backed by SimTerminal, for running TradeEngine end to end without a MetaTrader 5 terminal
+    def __init__(self, config):
+        super().__init__(config, terminal=SimTerminal(config))
+
+    def get_time(self):
+        return self.mt5.now()
@@ -6,6 +6,7 @@ class ExchangeLoader:
     __exchanges__ = {}
     __exchanges_map__ = {
         "mt5": "MT5API",
+        "sim": "SimAPI",
     }
 
     def __init__(self, exc_cfg_file):
@@ -26,6 +27,7 @@ class OMSLoader:
     __oms__ = {}
     __oms_map__ = {
         "mt5": "MT5OMS",
+        "sim": "MT5OMS",
     }
 
     def get_oms(self, exchange_name, exchange):
@@ -0,0 +1,92 @@
+import logging
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from order import OrderSide, OrderStatus
+from klines_loader import KlinesLoader
+from utils import tf_to_timedelta
+
+bot_logger = logging.getLogger("bot_logger")
+
+
+def first_true(hits):
+    # index of first True, len(hits) if none
+    return int(np.argmax(hits)) if hits.any() else len(hits)
+
+
+class IntrabarResolver:
+    # Resolve bars where an order's fill/SL/TP order can't be told from the bar's High/Low,
+    # by searching the first touch of each level in the 1m bars inside the bar.
+    # 1m klines are loaded a month at a time on ambiguous bars, months before the bar are released.
+    def __init__(self, data_dir, symbol, months):
+        self.loader = KlinesLoader(data_dir, symbol, "1m", months, usecols=["Open time", "High", "Low"])
+        self.symbol = symbol
+        # (year, month) -> (times, highs, lows)
+        self.loaded = {}
+
+    def __getstate__(self):
+        # don't pickle loaded klines, they are loaded again on use
+        state = self.__dict__.copy()
+        state["loaded"] = {}
+        return state
+
+    def load(self, year, month):
+        df = self.loader.load_month(year, month)
+        if df is None:
+            bot_logger.warning(
+                "   [-] No 1m klines of {} in {}-{:02d} for intrabar resolution, use bar High/Low".format(
+                    self.symbol, year, month
+                )
+            )
+            df = pd.DataFrame(columns=["Open time", "High", "Low"])
+        self.loaded[(year, month)] = (
+            df["Open time"].values.astype("datetime64[ns]"),
+            df["High"].values.astype(float),
+            df["Low"].values.astype(float),
+        )
+        bot_logger.info("   [+] Load {} 1m klines of {} for intrabar resolution".format(len(df), self.symbol))
+
+    def get_bars(self, open_time, tf):
+        # High/Low of the 1m bars inside bar [open_time, open_time + tf)
+        close_time = open_time + tf_to_timedelta(tf)
+        months = [
+            (p.year, p.month) for p in pd.period_range(open_time, close_time - timedelta(microseconds=1), freq="M")
+        ]
+        # backtest only moves forward
+        for key in [key for key in self.loaded if key < months[0]]:
+            del self.loaded[key]
+        highs, lows = [], []
+        for key in months:
+            if key not in self.loaded:
+                self.load(*key)
+            times, month_highs, month_lows = self.loaded[key]
+            start, end = np.searchsorted(times, [np.datetime64(open_time, "ns"), np.datetime64(close_time, "ns")])
+            highs.append(month_highs[start:end])
+            lows.append(month_lows[start:end])
+        highs, lows = np.concatenate(highs), np.concatenate(lows)
+        if len(highs) == 0:
+            return None
+        return highs, lows
+
+    def resolve(self, order, open_time, tf, pending):
+        # return order status at the end of the bar, None if bar has no 1m klines
+        # pending: order was pending at bar open, it fills at first 1m bar touching entry
+        bars = self.get_bars(open_time, tf)
+        if bars is None:
+            return None
+        highs, lows = bars
+        if pending:
+            start = first_true((highs >= order.entry) & (lows <= order.entry))
+            if start == len(highs):
+                return None
+            highs, lows = highs[start:], lows[start:]
+        is_buy = order.side == OrderSide.BUY
+        # first 1m bar trading through each level, SL wins when both are hit in the same 1m bar
+        sl_idx = tp_idx = len(highs)
+        if order.has_sl():
+            sl_idx = first_true(lows <= order.sl if is_buy else highs >= order.sl)
+        if order.has_tp():
+            tp_idx = first_true(highs >= order.tp if is_buy else lows <= order.tp)
+        if sl_idx == len(highs) and tp_idx == len(highs):
+            return OrderStatus.FILLED
+        return OrderStatus.HIT_SL if sl_idx <= tp_idx else OrderStatus.HIT_TP
@@ -0,0 +1,160 @@
+import os
+import logging
+import itertools
+from datetime import timedelta
+import pandas as pd
+from utils import NUM_KLINE_INIT
+
+bot_logger = logging.getLogger("bot_logger")
+
+KLINE_COLUMNS = ["Open time", "Open", "High", "Low", "Close", "Volume"]
+
+
+def get_date_range(symbol_cfg):
+    # klines with start <= Open time < end are used, (None, None) when config uses "year" and "months"
+    if "start" not in symbol_cfg:
+        return None, None
+    return pd.Timestamp(symbol_cfg["start"]), pd.Timestamp(symbol_cfg["end"])
+
+
+def get_months(symbol_cfg):
+    # [(year, month)] of a symbol config in order, from "start"/"end" dates (may span years) or "year" and "months"
+    start, end = get_date_range(symbol_cfg)
+    if start is not None:
+        return [(p.year, p.month) for p in pd.period_range(start, end - timedelta(microseconds=1), freq="M")]
+    return [(symbol_cfg["year"], month) for month in sorted(symbol_cfg["months"])]
+
+
+class KlinesLoader:
+    # Klines of a symbol and timeframe from the monthly csv files ({symbol}-{tf}-{year}-{month}.csv) of a list of
+    # months, read one month at a time so long ranges don't have to be loaded at once
+    def __init__(self, data_dir, symbol, tf, months, start=None, end=None, usecols=None):
+        self.data_dir = data_dir
+        self.symbol = symbol
+        self.tf = tf
+        self.months = months
+        self.start = start
+        self.end = end
+        self.usecols = usecols
+
+    def get_file(self, year, month):
+        return os.path.join(self.data_dir, "{}-{}-{}-{:02d}.csv".format(self.symbol, self.tf, year, month))
+
+    def filter(self, df):
+        df["Open time"] = pd.to_datetime(df["Open time"])
+        if self.start is not None:
+            df = df[(df["Open time"] >= self.start) & (df["Open time"] < self.end)]
+        return df
+
+    def load_month(self, year, month):
+        # klines of the month inside the date range, None if file is missing or has no kline in range
+        csv_data_path = self.get_file(year, month)
+        if not os.path.exists(csv_data_path):
+            bot_logger.warning("    [-] Data file not found: {}".format(csv_data_path))
+            return None
+        df = pd.read_csv(csv_data_path, usecols=self.usecols)
+        if len(df) == 0:
+            bot_logger.warning("    [-] Empty data file: {}".format(csv_data_path))
+            return None
+        df = self.filter(df)
+        if len(df) == 0:
+            return None
+        return df.sort_values("Open time").reset_index(drop=True)
+
+    def iter_chunks(self):
+        # monthly klines in order, a month is read only when the previous one is consumed
+        for year, month in self.months:
+            df = self.load_month(year, month)
+            if df is not None:
+                yield df
+
+    def load(self):
+        chunks = list(self.iter_chunks())
+        if len(chunks) == 0:
+            return pd.DataFrame(columns=self.usecols or KLINE_COLUMNS)
+        return pd.concat(chunks, ignore_index=True)
+
+    def get_end_time(self):
+        # Open time of the last kline, only Open time of the last month with klines is read
+        for year, month in reversed(self.months):
+            csv_data_path = self.get_file(year, month)
+            if not os.path.exists(csv_data_path):
+                continue
+            df = self.filter(pd.read_csv(csv_data_path, usecols=["Open time"]))
+            if len(df) > 0:
+                return df["Open time"].max()
+        return None
+
+
+class KlinesStream:
+    # Klines of a timeframe fed one by one to Trader.replay, only the current monthly chunk is held in memory
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.chunk = None
+        self.pos = 0
+
+    def empty(self):
+        # move to next chunk when current one is consumed, the consumed chunk is released
+        while self.chunk is None or self.pos >= len(self.chunk):
+            self.chunk = next(self.chunks, None)
+            self.pos = 0
+            if self.chunk is None:
+                return True
+        return False
+
+    def pop(self):
+        # next kline as one row frame, call empty() first
+        kline = self.chunk[self.pos : self.pos + 1]
+        self.pos += 1
+        return kline
+
+
+def load_replay_charts(loaders, stream=True):
+    # split klines of each tf into the warm up chart, last NUM_KLINE_INIT klines up to the time all tfs have
+    # NUM_KLINE_INIT klines, and the klines to replay after it.
+    # loaders: {tf: KlinesLoader}
+    # return tfs_chart_init, tfs_chart ({tf: KlinesStream}, {tf: DataFrame} when stream is False), start time, end time
+    tfs_chunks = {}
+    tfs_head = {}
+    for tf, loader in loaders.items():
+        # read months until warm up is covered
+        tfs_chunks[tf] = loader.iter_chunks()
+        head = []
+        while sum(len(chunk) for chunk in head) < NUM_KLINE_INIT:
+            chunk = next(tfs_chunks[tf], None)
+            if chunk is None:
+                break
+            head.append(chunk)
+        if len(head) == 0:
+            raise ValueError(
+                "No data available for {} {}: Please download historical data using download_data.py".format(
+                    loader.symbol, tf
+                )
+            )
+        tfs_head[tf] = pd.concat(head, ignore_index=True)
+        if len(tfs_head[tf]) < NUM_KLINE_INIT:
+            raise ValueError(
+                "Insufficient data for {} {}: need at least {} candles, found {}".format(
+                    loader.symbol, tf, NUM_KLINE_INIT, len(tfs_head[tf])
+                )
+            )
+    max_time = max([head.iloc[NUM_KLINE_INIT - 1]["Open time"] for head in tfs_head.values()])
+    tfs_chart_init = {}
+    tfs_chart = {}
+    for tf, head in tfs_head.items():
+        # smaller tfs need more months to reach max_time
+        chunks = [head]
+        while chunks[-1].iloc[-1]["Open time"] <= max_time:
+            chunk = next(tfs_chunks[tf], None)
+            if chunk is None:
+                break
+            chunks.append(chunk)
+        head = pd.concat(chunks, ignore_index=True)
+        tfs_chart_init[tf] = head[head["Open time"] <= max_time][-NUM_KLINE_INIT:].reset_index(drop=True)
+        rest = head[head["Open time"] > max_time]
+        if stream:
+            tfs_chart[tf] = KlinesStream(itertools.chain([rest], tfs_chunks[tf]))
+        else:
+            tfs_chart[tf] = pd.concat([rest] + list(tfs_chunks[tf]), ignore_index=True)
+    end_time = max([loader.get_end_time() for loader in loaders.values()])
+    return tfs_chart_init, tfs_chart, max_time, end_time
@@ -4,9 +4,8 @@ from datetime import datetime
 import argparse
 import logging
 import logging.config
-from trade_engine import TradeEngine
-from backtest import BackTest
 from utils import datetime_to_filename
+from queue_logging import start_queue_logging
 
 
 def config_logging(exchange):
@@ -18,6 +17,8 @@ def config_logging(exchange):
         defaults={"logfilename": "logs/{}/bot_{}.log".format(exchange, datetime_to_filename(curr_time))},
     )
     logging.getLogger().setLevel(logging.WARNING)
+    # file and console writes happen on a listener thread
+    start_queue_logging()
 
 
 if __name__ == "__main__":
@@ -27,17 +28,34 @@ if __name__ == "__main__":
     parser.add_argument("--exch_cfg_file", required=True, type=str)
     parser.add_argument("--sym_cfg_file", required=True, type=str)
     parser.add_argument("--data_dir", required=False, type=str)
+    parser.add_argument("--intrabar", action="store_true")
+    parser.add_argument("--vectorized", action="store_true")
+    parser.add_argument("--workers", required=False, type=int)
+    parser.add_argument("--journal", action="store_true")
+    parser.add_argument("--fast_plot", action="store_true")
+    parser.add_argument("--no_report", action="store_true")
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--cprofile", action="store_true")
+    parser.add_argument("--metrics_port", required=False, type=int)
+    parser.add_argument("--quiet", action="store_true")
+    parser.add_argument("--resample", action="store_true")
     args = parser.parse_args()
 
     os.environ["DEBUG_DIR"] = "debug"
     os.environ["LOG_DIR"] = "logs"
+    os.environ["STATE_DIR"] = "state"
     config_logging(args.exch)
 
     if not os.path.isdir(os.environ["DEBUG_DIR"]):
         os.mkdir(os.environ["DEBUG_DIR"])
+    if not os.path.isdir(os.environ["STATE_DIR"]):
+        os.mkdir(os.environ["STATE_DIR"])
 
+    # import only the engine of the mode, backtest doesn't need MetaTrader5 or the scheduler
     if args.mode == "live":
-        trade_engine = TradeEngine(args.exch, args.exch_cfg_file, args.sym_cfg_file)
+        from trade_engine import TradeEngine
+
+        trade_engine = TradeEngine(args.exch, args.exch_cfg_file, args.sym_cfg_file, args.metrics_port)
         if trade_engine.init():
             trade_engine.start()
             try:
@@ -50,8 +68,25 @@ if __name__ == "__main__":
                 time.sleep(3)  # Wait for exchange return income
                 trade_engine.log_income_history()
     elif args.mode == "test":
+        from backtest import BackTest
+
         start_time = time.time()
-        backtest_engine = BackTest(args.exch, args.sym_cfg_file, args.data_dir, args.exch_cfg_file)
+        backtest_engine = BackTest(
+            args.exch,
+            args.sym_cfg_file,
+            args.data_dir,
+            args.exch_cfg_file,
+            args.intrabar,
+            args.vectorized,
+            args.workers,
+            args.journal,
+            args.fast_plot,
+            not args.no_report,
+            args.profile,
+            args.cprofile,
+            args.quiet,
+            args.resample,
+        )
         backtest_engine.start()
         backtest_engine.summary_trade_result()
         backtest_engine.stop()
@@ -0,0 +1,240 @@
+import os
+import sys
+import time
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas as pd
+from profiler import LatencyHistogram
+
+bot_logger = logging.getLogger("bot_logger")
+
+# live stage of a bar -> stage its latency is measured from, bar_close is the minute boundary the cron job fired for
+STAGES = {
+    "cron_fire": "bar_close",
+    "kline_received": "cron_fire",
+    "order_sent": "kline_received",
+    "order_result": "order_sent",
+    "strategy_updated": "kline_received",
+}
+# exported metric names are prefixed with this
+PREFIX = "monn_"
+# counter name -> help, exported as <PREFIX><name>_total
+COUNTERS = {
+    "bars": "Klines processed per symbol and timeframe",
+    "order_send": "order_send results per retcode",
+    "kline_retries": "Kline fetches retried while waiting for a new kline",
+    "kline_timeouts": "Kline fetches given up after retrying",
+}
+QUANTILES = [0.5, 0.95, 0.99]
+
+
+class LiveMetrics:
+    # Latency histograms per (symbol, stage) of the live engine, from bar close to MT5 order result.
+    # Stages are marked by the scheduler thread, snapshots may be taken from any thread
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        # stage -> time.time() of the bar being processed, shared by all symbols
+        self.bar_marks = {}
+        # symbol -> stage -> time.time() of the bar being processed
+        self.marks = {}
+        # (counter name, labels) -> value, labels is a sorted tuple of (label, value as str)
+        self.counters = {}
+        # gauge name -> (help, function returning {labels: value}), read when rendered
+        self.gauges = {}
+        self.last_cron_fire_lag = 0.0
+        self.add_gauge("scheduler_lag_seconds", "Delay of the last kline cron job after bar close", self.get_scheduler_lag)
+        self.add_gauge("process_resident_memory_bytes", "Resident memory of the engine process", get_rss)
+
+    def observe(self, symbol, stage, seconds):
+        key = (symbol, stage)
+        if key not in self.histograms:
+            self.histograms[key] = LatencyHistogram()
+        self.histograms[key].add(seconds)
+
+    def start_bar(self, fire_time):
+        # cron job fired at fire_time (time.time()), klines of this minute's timeframes are about to be fetched
+        with self.lock:
+            self.bar_marks = {"bar_close": fire_time - fire_time % 60, "cron_fire": fire_time}
+            self.marks = {}
+            self.last_cron_fire_lag = fire_time - self.bar_marks["bar_close"]
+            self.observe("ALL", "cron_fire", self.last_cron_fire_lag)
+
+    def mark(self, symbol, stage):
+        now = time.time()
+        with self.lock:
+            if len(self.bar_marks) == 0:
+                return
+            marks = self.marks.setdefault(symbol, dict(self.bar_marks))
+            since = marks.get(STAGES[stage])
+            marks[stage] = now
+            if since is None:
+                return
+            self.observe(symbol, stage, now - since)
+            if stage == "order_result":
+                self.observe(symbol, "bar_to_result", now - marks["bar_close"])
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted((label, str(value)) for label, value in labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def add_gauge(self, name, help, func):
+        self.gauges[name] = (help, func)
+
+    def get_scheduler_lag(self):
+        return {(): self.last_cron_fire_lag}
+
+    def snapshot(self):
+        # {symbol: {stage: stats}}, latencies in us since the engine started
+        with self.lock:
+            stats = {}
+            for (symbol, stage), histogram in sorted(self.histograms.items()):
+                stats.setdefault(symbol, {})[stage] = histogram.get_stats()
+        return stats
+
+    def summary(self):
+        rows = []
+        for symbol, stages in self.snapshot().items():
+            for stage, stats in stages.items():
+                rows.append({"SYMBOL": symbol, "STAGE": stage, **stats})
+        return pd.DataFrame(rows)
+
+    def get_log_lines(self):
+        # one line per symbol: p50/p99 of each stage in ms
+        lines = []
+        for symbol, stages in self.snapshot().items():
+            lines.append(
+                "{}: {}".format(
+                    symbol,
+                    ", ".join(
+                        "{} {:.1f}/{:.1f}ms".format(stage, stats["P50(us)"] / 1e3, stats["P99(us)"] / 1e3)
+                        for stage, stats in stages.items()
+                    ),
+                )
+            )
+        return lines
+
+    def render(self):
+        # Prometheus text exposition of counters, gauges and stage latencies
+        lines = []
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: histogram.get_stats() for key, histogram in self.histograms.items()}
+            quantiles = {
+                key: [histogram.percentile(100 * q) for q in QUANTILES] for key, histogram in self.histograms.items()
+            }
+        for name, help in COUNTERS.items():
+            lines.append("# HELP {}{}_total {}".format(PREFIX, name, help))
+            lines.append("# TYPE {}{}_total counter".format(PREFIX, name))
+            for (counter, labels), value in sorted(counters.items()):
+                if counter == name:
+                    lines.append("{}{}_total{} {}".format(PREFIX, name, format_labels(labels), value))
+        for name, (help, func) in self.gauges.items():
+            try:
+                values = func()
+            except Exception as e:
+                bot_logger.warning("[-] Read gauge {} failed: {}".format(name, e))
+                continue
+            lines.append("# HELP {}{} {}".format(PREFIX, name, help))
+            lines.append("# TYPE {}{} gauge".format(PREFIX, name))
+            for labels, value in sorted(values.items()):
+                lines.append("{}{}{} {}".format(PREFIX, name, format_labels(labels), value))
+        name = PREFIX + "stage_latency_seconds"
+        lines.append("# HELP {} Latency of each live stage of a bar, see metrics.STAGES".format(name))
+        lines.append("# TYPE {} summary".format(name))
+        for (symbol, stage), stats in sorted(histograms.items()):
+            labels = (("symbol", symbol), ("stage", stage))
+            for q, value in zip(QUANTILES, quantiles[(symbol, stage)]):
+                lines.append("{}{} {}".format(name, format_labels(labels + (("quantile", q),)), value))
+            lines.append("{}_sum{} {}".format(name, format_labels(labels), stats["TOTAL(s)"]))
+            lines.append("{}_count{} {}".format(name, format_labels(labels), stats["CALLS"]))
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if len(labels) == 0:
+        return ""
+    values = [
+        '{}="{}"'.format(label, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for label, value in labels
+    ]
+    return "{" + ",".join(values) + "}"
+
+
+def get_rss():
+    # {(): resident memory in bytes} of this process, {} where it can't be read
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (field, ctypes.c_size_t)
+                for field in [
+                    "PeakWorkingSetSize",
+                    "WorkingSetSize",
+                    "QuotaPeakPagedPoolUsage",
+                    "QuotaPagedPoolUsage",
+                    "QuotaPeakNonPagedPoolUsage",
+                    "QuotaNonPagedPoolUsage",
+                    "PagefileUsage",
+                    "PeakPagefileUsage",
+                ]
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        get_current_process = ctypes.windll.kernel32.GetCurrentProcess
+        get_current_process.restype = wintypes.HANDLE
+        get_memory_info = ctypes.windll.psapi.GetProcessMemoryInfo
+        get_memory_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+        if not get_memory_info(get_current_process(), ctypes.byref(counters), counters.cb):
+            return {}
+        return {(): counters.WorkingSetSize}
+    try:
+        with open("/proc/self/statm") as f:
+            return {(): int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")}
+    except (OSError, ValueError):
+        return {}
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        try:
+            body = self.server.metrics.render().encode()
+        except Exception as e:
+            bot_logger.warning("[-] Render metrics failed: {}".format(e))
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # scrapes are not logged
+        pass
+
+
+class MetricsServer(ThreadingHTTPServer):
+    # serve LiveMetrics at http://<host>:<port>/metrics from a daemon thread
+    daemon_threads = True
+
+    def __init__(self, metrics, port, host="127.0.0.1"):
+        super().__init__((host, port), MetricsHandler)
+        self.metrics = metrics
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        bot_logger.info("[+] Serve metrics at http://{}:{}/metrics".format(*self.server_address[:2]))
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
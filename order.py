@@ -1,4 +1,6 @@
 from enum import Enum
+from typing import List
+import numpy as np
 
 
 class OrderType(Enum):
@@ -167,44 +169,43 @@ class Order:
         self.entry = entry
         self.calc_stats()
 
-    def update_status(self, kline):
+    def update_status(self, kline, intrabar=None, tf=None):
+        # intrabar: IntrabarResolver, when set it resolves bars where fill/SL/TP order is ambiguous from High/Low
         open_time = kline["Open time"]
-        ohlc = kline[["Open", "High", "Low", "Close"]]
-        if self.status == OrderStatus.PENDING:
+        high, low = kline["High"], kline["Low"]
+        pending = self.status == OrderStatus.PENDING
+        if pending:
             # limit order
-            if (ohlc["High"] - self.entry) * (ohlc["Low"] - self.entry) <= 0:
-                self.status = OrderStatus.FILLED
-                self.__attrs__["FILL_TIME"] = open_time
-            if (
-                self.status == OrderStatus.FILLED
-                and self.has_sl()
-                and (ohlc["High"] - self.sl) * (ohlc["Low"] - self.sl) <= 0
-            ):
-                # order hit sl
-                self.status = OrderStatus.HIT_SL
-                self.__attrs__["STOP_TIME"] = open_time
-            if (
-                self.status == OrderStatus.FILLED
-                and self.has_tp()
-                and (ohlc["High"] - self.tp) * (ohlc["Low"] - self.tp) <= 0
-            ):
-                # order hit tp
-                self.status = OrderStatus.HIT_TP
-                self.__attrs__["STOP_TIME"] = open_time
+            if (high - self.entry) * (low - self.entry) > 0:
+                return
+            self.status = OrderStatus.FILLED
+            self.__attrs__["FILL_TIME"] = open_time
+            hit_sl = self.has_sl() and (high - self.sl) * (low - self.sl) <= 0
+            hit_tp = self.has_tp() and (high - self.tp) * (low - self.tp) <= 0
+            ambiguous = hit_sl or hit_tp
         elif self.status == OrderStatus.FILLED:
-            if (
-                self.has_sl()
-                and (ohlc["High"] - self.sl) * (ohlc["Low"] - self.sl) <= 0
-                or (self.side == OrderSide.SELL and ohlc["High"] >= self.sl)
-                or (self.side == OrderSide.BUY and ohlc["Low"] <= self.sl)
-            ):
-                # order hit sl
-                self.status = OrderStatus.HIT_SL
-                self.__attrs__["STOP_TIME"] = open_time
-            elif self.has_tp() and (ohlc["High"] - self.tp) * (ohlc["Low"] - self.tp) <= 0:
-                # order hit tp
-                self.status = OrderStatus.HIT_TP
-                self.__attrs__["STOP_TIME"] = open_time
+            hit_sl = self.has_sl() and (
+                (high - self.sl) * (low - self.sl) <= 0
+                or (self.side == OrderSide.SELL and high >= self.sl)
+                or (self.side == OrderSide.BUY and low <= self.sl)
+            )
+            hit_tp = self.has_tp() and (high - self.tp) * (low - self.tp) <= 0
+            ambiguous = hit_sl and hit_tp
+        else:
+            return
+        if ambiguous and intrabar is not None:
+            status = intrabar.resolve(self, open_time, tf, pending)
+            if status is not None:
+                hit_sl = status == OrderStatus.HIT_SL
+                hit_tp = status == OrderStatus.HIT_TP
+        if hit_sl:
+            # order hit sl
+            self.status = OrderStatus.HIT_SL
+            self.__attrs__["STOP_TIME"] = open_time
+        elif hit_tp:
+            # order hit tp
+            self.status = OrderStatus.HIT_TP
+            self.__attrs__["STOP_TIME"] = open_time
 
     def close(self, kline):
         if self.status == OrderStatus.FILLED:
@@ -218,6 +219,9 @@ class Order:
         return self.status in [OrderStatus.HIT_SL, OrderStatus.HIT_TP, OrderStatus.STOPPED]
 
     def get_PnL(self):
+        # PnL is fixed once the order is closed, it is set by close or when the strategy records the closed order
+        if "PnL" in self.__attrs__:
+            return self.__attrs__["PnL"]
         if self.status == OrderStatus.HIT_SL:
             pnl = round(abs(self.sl - self.entry) / self.entry, 4)
             if (self.side == OrderSide.SELL and self.sl <= self.entry) or (
@@ -257,3 +261,48 @@ class Order:
 
     def __str__(self) -> str:
         return self.__to_dict__().__str__()
+
+
+class OrderBatch:
+    # Columnar view of open orders (entry, sl, tp, side, status arrays) to evaluate fill/SL/TP
+    # of all orders on a kline with a few numpy operations, same rules as Order.update_status.
+    # Built for each kline, strategies keep reading and adjusting the Order objects directly.
+    def __init__(self, orders: List[Order]):
+        self.orders = orders
+        self.entry = np.array([order.entry for order in orders], dtype=float)
+        # missing sl/tp are NaN, comparisons with NaN are False
+        self.sl = np.array([np.nan if order.sl is None else order.sl for order in orders], dtype=float)
+        self.tp = np.array([np.nan if order.tp is None else order.tp for order in orders], dtype=float)
+        self.is_buy = np.array([order.side == OrderSide.BUY for order in orders], dtype=bool)
+        self.pending = np.array([order.status == OrderStatus.PENDING for order in orders], dtype=bool)
+        self.filled = np.array([order.status == OrderStatus.FILLED for order in orders], dtype=bool)
+
+    def update_status(self, kline, intrabar=None, tf=None):
+        open_time = kline["Open time"]
+        high, low = kline["High"], kline["Low"]
+        fill = self.pending & ((high - self.entry) * (low - self.entry) <= 0)
+        touch_sl = (high - self.sl) * (low - self.sl) <= 0
+        touch_tp = (high - self.tp) * (low - self.tp) <= 0
+        beyond_sl = np.where(self.is_buy, low <= self.sl, high >= self.sl)
+        hit_sl = (fill & touch_sl) | (self.filled & (touch_sl | beyond_sl))
+        hit_tp = (fill | self.filled) & touch_tp
+        changed = fill | hit_sl | hit_tp
+        if intrabar is not None:
+            # ambiguous orders go through Order.update_status to be resolved on 1m klines
+            ambiguous = (fill & (touch_sl | touch_tp)) | (hit_sl & hit_tp)
+            for i in np.flatnonzero(ambiguous):
+                self.orders[i].update_status(kline, intrabar, tf)
+            changed &= ~ambiguous
+        for i in np.flatnonzero(changed):
+            order = self.orders[i]
+            if fill[i]:
+                order.status = OrderStatus.FILLED
+                order.__attrs__["FILL_TIME"] = open_time
+            if hit_sl[i]:
+                # order hit sl
+                order.status = OrderStatus.HIT_SL
+                order.__attrs__["STOP_TIME"] = open_time
+            elif hit_tp[i]:
+                # order hit tp
+                order.status = OrderStatus.HIT_TP
+                order.__attrs__["STOP_TIME"] = open_time
@@ -0,0 +1,61 @@
+import os
+import pandas as pd
+
+JOURNAL_COLUMNS = [
+    "order_id",
+    "type",
+    "side",
+    "entry",
+    "tp",
+    "sl",
+    "status",
+    "reward_ratio",
+    "risk_ratio",
+    "rr",
+    "PnL",
+    "FILL_TIME",
+    "STOP_TIME",
+    "STOP_PRICE",
+    "description",
+]
+
+
+class OrderJournal:
+    # Closed orders of a strategy appended to a csv file in chunks of chunk_size orders, so long backtests
+    # don't keep every Order (with its attrs and description objects) in memory.
+    # Only the scalar fields in JOURNAL_COLUMNS are written.
+    def __init__(self, journal_file, chunk_size=1000):
+        self.journal_file = journal_file
+        self.chunk_size = chunk_size
+        self.rows = []
+        self.num_flushed = 0
+        if os.path.exists(journal_file):
+            os.remove(journal_file)
+
+    def add(self, order):
+        row = {column: value for column, value in order.__to_dict__().items() if column in JOURNAL_COLUMNS}
+        row["PnL"] = order.get_PnL()
+        for attr in ["FILL_TIME", "STOP_TIME", "STOP_PRICE", "description"]:
+            row[attr] = order[attr] if attr in order else None
+        self.rows.append(row)
+        if len(self.rows) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.rows) == 0:
+            return
+        pd.DataFrame(self.rows, columns=JOURNAL_COLUMNS).to_csv(
+            self.journal_file, mode="a", header=self.num_flushed == 0, index=False
+        )
+        self.num_flushed += len(self.rows)
+        self.rows = []
+
+    def __len__(self):
+        return self.num_flushed + len(self.rows)
+
+    def load(self):
+        # all journaled orders, for reports on a finished backtest
+        self.flush()
+        if self.num_flushed == 0:
+            return pd.DataFrame(columns=JOURNAL_COLUMNS)
+        return pd.read_csv(self.journal_file, parse_dates=["FILL_TIME", "STOP_TIME"])
@@ -0,0 +1,119 @@
+import math
+import time
+import pandas as pd
+
+# histogram buckets per doubling of latency, percentiles are within ~9% of the exact value
+BUCKETS_PER_OCTAVE = 8
+
+
+class LatencyHistogram:
+    # Fixed size log-scale histogram of latencies in seconds, cheap to update on hot paths and to merge
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        idx = int(math.log2(max(seconds * 1e9, 1.0)) * BUCKETS_PER_OCTAVE)
+        self.buckets[idx] = self.buckets.get(idx, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        for idx, count in other.buckets.items():
+            self.buckets[idx] = self.buckets.get(idx, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q):
+        # upper bound of the bucket holding the q-th percentile, in seconds
+        if self.count == 0:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for idx in sorted(self.buckets):
+            seen += self.buckets[idx]
+            if seen >= rank:
+                return min(2 ** ((idx + 1) / BUCKETS_PER_OCTAVE) / 1e9, self.max)
+        return self.max
+
+    def get_stats(self):
+        return {
+            "CALLS": self.count,
+            "TOTAL(s)": self.total,
+            "MEAN(us)": 1e6 * self.total / self.count if self.count > 0 else 0,
+            "P50(us)": 1e6 * self.percentile(50),
+            "P95(us)": 1e6 * self.percentile(95),
+            "P99(us)": 1e6 * self.percentile(99),
+            "MAX(us)": 1e6 * self.max,
+        }
+
+
+class TimedMethod:
+    # Replace a method on an instance and record each call's latency, picklable with the instance
+    def __init__(self, obj, name, histogram):
+        self.obj = obj
+        self.func = getattr(type(obj), name)
+        self.histogram = histogram
+
+    def __call__(self, *args, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            return self.func(self.obj, *args, **kwargs)
+        finally:
+            self.histogram.add(time.perf_counter() - start_time)
+
+
+class Profiler:
+    # Latency histograms per (symbol, strategy, phase) of a trader's hot path:
+    # Trader.on_kline and update/update_indicators/check_signal of each strategy
+    PHASES = ["update", "update_indicators", "check_signal"]
+
+    def __init__(self):
+        self.histograms = {}
+
+    def get_histogram(self, key):
+        if key not in self.histograms:
+            self.histograms[key] = LatencyHistogram()
+        return self.histograms[key]
+
+    def wrap(self, obj, name, key):
+        setattr(obj, name, TimedMethod(obj, name, self.get_histogram(key)))
+
+    def attach(self, bot_trader):
+        symbol = bot_trader.get_symbol_name()
+        self.wrap(bot_trader, "on_kline", (symbol, "ALL", "on_kline"))
+        for strategy in bot_trader.strategies:
+            for phase in self.PHASES:
+                if hasattr(type(strategy), phase):
+                    self.wrap(strategy, phase, (symbol, strategy.description, phase))
+
+    def detach(self, bot_trader):
+        for obj in [bot_trader] + bot_trader.strategies:
+            for name, value in list(vars(obj).items()):
+                if isinstance(value, TimedMethod):
+                    delattr(obj, name)
+
+    def merge(self, other):
+        for key, histogram in other.histograms.items():
+            self.get_histogram(key).merge(histogram)
+
+    def summary(self):
+        rows = []
+        for (symbol, strategy, phase), histogram in sorted(self.histograms.items()):
+            rows.append({"SYMBOL": symbol, "STRATEGY": strategy, "PHASE": phase, **histogram.get_stats()})
+        return pd.DataFrame(rows)
+
+
+def summary_profile(bot_traders):
+    # merged latency table of profiled traders, None when no trader was profiled
+    profiler = Profiler()
+    profilers = [bot_trader.profiler for bot_trader in bot_traders if bot_trader.profiler is not None]
+    if len(profilers) == 0:
+        return None
+    for other in profilers:
+        profiler.merge(other)
+    return profiler.summary()
@@ -0,0 +1,42 @@
+import atexit
+import logging
+import multiprocessing
+from logging.handlers import QueueHandler, QueueListener
+
+# queue of records written by the listener thread, None until start_queue_logging is called
+__log_queue__ = None
+
+
+def start_queue_logging(logger_name="bot_logger"):
+    # move handlers of the logger (file, console) to a listener thread, logging calls only put records in a queue
+    # so disk or console stalls don't stall strategy processing. The queue is shared with worker processes
+    # through init_worker_logging
+    global __log_queue__
+    logger = logging.getLogger(logger_name)
+    handlers = logger.handlers[:]
+    __log_queue__ = multiprocessing.Queue(-1)
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(QueueHandler(__log_queue__))
+    listener = QueueListener(__log_queue__, *handlers, respect_handler_level=True)
+    listener.start()
+    # write queued records before exit
+    atexit.register(listener.stop)
+    return listener
+
+
+def get_log_queue():
+    return __log_queue__
+
+
+def init_worker_logging(log_queue, level, logger_name="bot_logger"):
+    # ProcessPoolExecutor initializer: send records of a worker process to the listener of the main process,
+    # level is the logger's level in main process, spawned workers don't read logging_config.ini
+    if log_queue is None:
+        return
+    logger = logging.getLogger(logger_name)
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+    logger.addHandler(QueueHandler(log_queue))
+    logger.setLevel(level)
+    logger.propagate = False
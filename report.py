@@ -0,0 +1,29 @@
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from trader import plot_strategy
+from queue_logging import get_log_queue, init_worker_logging
+
+bot_logger = logging.getLogger("bot_logger")
+
+
+def write_reports(bot_traders, workers=None, plot=True, fast_plot=False):
+    # orders csv of each symbol, then one html job per (symbol, strategy)
+    # workers: number of processes writing html, None for cpu count, 1 to write in this process
+    for bot_trader in bot_traders:
+        bot_trader.log_orders()
+    if not plot:
+        return
+    jobs = [job for bot_trader in bot_traders for job in bot_trader.get_plot_jobs(fast_plot)]
+    workers = min(workers or os.cpu_count(), len(jobs))
+    bot_logger.info("[*] Write {} strategy plots in {} processes".format(len(jobs), max(workers, 1)))
+    if workers <= 1:
+        for strategy, html_file in jobs:
+            plot_strategy(strategy, html_file)
+        return
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker_logging, initargs=(get_log_queue(), bot_logger.level)
+    ) as executor:
+        futures = [executor.submit(plot_strategy, strategy, html_file) for strategy, html_file in jobs]
+        for future in futures:
+            future.result()
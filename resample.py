@@ -0,0 +1,118 @@
+import os
+import logging
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from klines_loader import KLINE_COLUMNS, get_months
+from utils import tf_cron, tf_to_timedelta
+
+bot_logger = logging.getLogger("bot_logger")
+
+# timeframe the others are built from
+BASE_TF = "1m"
+# built files are kept apart from the downloaded ones, in this directory of the data dir
+RESAMPLED_DIR = "resampled"
+
+
+def get_tf_offset(tf):
+    # shift of tf's bar open times from multiples of tf since epoch, taken from the cron of bar closes in tf_cron,
+    # e.g. 4h bars close at 3, 7, ..., 23h so they open at 23, 3, 7, ...h (broker session boundaries)
+    cron_time = tf_cron[tf]
+    minutes = cron_time.get("hour", [0])[0] * 60 + cron_time.get("minute", [0])[0]
+    return timedelta(minutes=minutes) % tf_to_timedelta(tf)
+
+
+def resample_klines(df, tf):
+    # klines of tf from sorted klines of a smaller tf, bars without klines are skipped like in MT5
+    if len(df) == 0:
+        return pd.DataFrame(columns=KLINE_COLUMNS)
+    step = np.int64(tf_to_timedelta(tf) // timedelta(microseconds=1)) * 1000
+    offset = np.int64(get_tf_offset(tf) // timedelta(microseconds=1)) * 1000
+    times = pd.to_datetime(df["Open time"]).values.astype("datetime64[ns]").astype(np.int64)
+    buckets = (times - offset) // step
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(df)] - 1
+    return pd.DataFrame(
+        {
+            "Open time": pd.to_datetime(buckets[starts] * step + offset),
+            "Open": df["Open"].values[starts],
+            "High": np.maximum.reduceat(df["High"].values, starts),
+            "Low": np.minimum.reduceat(df["Low"].values, starts),
+            "Close": df["Close"].values[ends],
+            "Volume": np.add.reduceat(df["Volume"].values, starts),
+        }
+    )
+
+
+def get_file(data_dir, symbol, tf, year, month):
+    return os.path.join(data_dir, "{}-{}-{}-{:02d}.csv".format(symbol, tf, year, month))
+
+
+def get_resampled_dir(data_dir):
+    return os.path.join(data_dir, RESAMPLED_DIR)
+
+
+def get_resampled_files(symbols_config):
+    # sorted [(symbol, tf, year, month)] of the timeframes built from BASE_TF klines
+    files = set()
+    for symbol_cfg in symbols_config:
+        for strategy in symbol_cfg["strategies"]:
+            for tf in strategy["tfs"].values():
+                if tf != BASE_TF:
+                    for year, month in get_months(symbol_cfg):
+                        files.add((symbol_cfg["symbol"], tf, year, month))
+    return sorted(files)
+
+
+def is_cache_fresh(tf_file, source_files):
+    # built file is newer than every existing source file
+    if not os.path.exists(tf_file):
+        return False
+    mtime = os.path.getmtime(tf_file)
+    return all(os.path.getmtime(source) <= mtime for source in source_files if os.path.exists(source))
+
+
+def build_month(data_dir, symbol, tf, year, month):
+    # write tf klines opened in the month from BASE_TF klines of the month and the head of the next one
+    # (bars opened before midnight close in the next month), return number of klines, None if source is missing
+    month_start = datetime(year, month, 1)
+    next_month = (pd.Timestamp(month_start) + pd.DateOffset(months=1)).to_pydatetime()
+    source = get_file(data_dir, symbol, BASE_TF, year, month)
+    next_source = get_file(data_dir, symbol, BASE_TF, next_month.year, next_month.month)
+    tf_file = get_file(get_resampled_dir(data_dir), symbol, tf, year, month)
+    if not os.path.exists(source):
+        return None
+    if is_cache_fresh(tf_file, [source, next_source]):
+        return 0
+    dfs = [pd.read_csv(source, usecols=KLINE_COLUMNS)]
+    if os.path.exists(next_source):
+        num_base_klines = tf_to_timedelta(tf) // tf_to_timedelta(BASE_TF)
+        dfs.append(pd.read_csv(next_source, usecols=KLINE_COLUMNS, nrows=num_base_klines))
+    df = pd.concat(dfs, ignore_index=True)
+    df["Open time"] = pd.to_datetime(df["Open time"])
+    df = resample_klines(df.sort_values("Open time"), tf)
+    df = df[(df["Open time"] >= month_start) & (df["Open time"] < next_month)]
+    tmp_file = tf_file + ".tmp"
+    df.to_csv(tmp_file, index=False)
+    os.replace(tmp_file, tf_file)
+    return len(df)
+
+
+def build_resampled_files(data_dir, files):
+    # build (symbol, tf, year, month) files in the resampled dir from BASE_TF files of data_dir,
+    # files newer than their sources are kept, return True if all files are available
+    os.makedirs(get_resampled_dir(data_dir), exist_ok=True)
+    built = 0
+    available = 0
+    for symbol, tf, year, month in files:
+        num_klines = build_month(data_dir, symbol, tf, year, month)
+        if num_klines is None:
+            bot_logger.warning(
+                "    [-] No {} data to build {} {} {}-{:02d}".format(BASE_TF, symbol, tf, year, month)
+            )
+            continue
+        available += 1
+        if num_klines > 0:
+            built += 1
+    bot_logger.info("[+] Resampled {} files from {} klines, {} up to date".format(built, BASE_TF, available - built))
+    return available == len(files)
@@ -1,8 +1,20 @@
-from .ma_cross_strategy import MACross
-from .ma_heikin_ashi import MAHeikinAshi
-from .rsi_hidden_divergence import RSIDivergence
-from .macd_divergence import MACDDivergence
-from .rsi_regular_divergence import RSIRegularDivergence
-from .break_strategy import BreakStrategy
-from .price_action import PriceAction
-from .trend_following import TrendFollowing
+import importlib
+
+# strategy class -> module, imported on first access so loading one strategy doesn't import all of them
+__strategy_modules__ = {
+    "MACross": ".ma_cross_strategy",
+    "MAHeikinAshi": ".ma_heikin_ashi",
+    "RSIDivergence": ".rsi_hidden_divergence",
+    "MACDDivergence": ".macd_divergence",
+    "RSIRegularDivergence": ".rsi_regular_divergence",
+    "BreakStrategy": ".break_strategy",
+    "PriceAction": ".price_action",
+    "TrendFollowing": ".trend_following",
+}
+__all__ = list(__strategy_modules__.keys())
+
+
+def __getattr__(name):
+    if name not in __strategy_modules__:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    return getattr(importlib.import_module(__strategy_modules__[name], __name__), name)
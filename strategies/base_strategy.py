@@ -1,8 +1,10 @@
 from datetime import datetime
 from typing import List
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-from order import Order, OrderSide, OrderStatus
+import numpy as np
+from order import Order, OrderSide, OrderStatus, OrderType
+
+# fast plot mode: candles are merged down to about this many bars
+MAX_PLOT_CANDLES = 5000
 
 
 class BaseStrategy:
@@ -10,11 +12,32 @@ class BaseStrategy:
         self.name = name
         self.params = params
         self.tfs = tfs
+        # index of the strategy in its symbol config, tags the trades it creates
+        self.strategy_id = None
         # orders in activate created by the strategy
         self.orders_opening: List[Order] = []
-        # orders closed created by the strategy
+        # orders closed created by the strategy, kept in memory when no journal is attached
         self.orders_closed: List[Order] = []
+        # OrderJournal closed orders are written to instead of orders_closed
+        self.journal = None
+        # running sums of closed orders for summary_PnL
+        self.pnl_stats = {
+            "LONG": 0,
+            "LONG_PnL": 0,
+            "LONG_TP": 0,
+            "LONG_TP_PnL": 0,
+            "LONG_SL_PnL": 0,
+            "SHORT": 0,
+            "SHORT_PnL": 0,
+            "SHORT_TP": 0,
+            "SHORT_TP_PnL": 0,
+            "SHORT_SL_PnL": 0,
+        }
         self.start_trading_time = None
+        # IntrabarResolver for backtest, None to resolve SL/TP on bar High/Low
+        self.intrabar = None
+        # plot orders batched in a few WebGL traces and decimated candles, set by Trader before plotting
+        self.fast_plot = False
         self.set_description()
 
     def attach(self, tfs_chart):
@@ -32,12 +55,48 @@ class BaseStrategy:
     def set_max_sl_pct(self, max_sl_pct):
         self.max_sl_pct = max_sl_pct
 
+    def set_strategy_id(self, strategy_id):
+        self.strategy_id = strategy_id
+
     def get_name(self):
         return self.name
 
     def attach_trader(self, trader):
         self.trader = trader
 
+    def attach_intrabar(self, intrabar):
+        self.intrabar = intrabar
+
+    def attach_journal(self, journal):
+        self.journal = journal
+
+    def add_closed_order(self, order: Order):
+        # update running sums once per closed order, summary_PnL is O(1) and can be sampled any time
+        pnl = order.get_PnL()
+        order["PnL"] = pnl
+        side = "LONG" if order.side == OrderSide.BUY else "SHORT"
+        self.pnl_stats[side] += 1
+        self.pnl_stats[side + "_PnL"] += pnl
+        if pnl > 0:
+            self.pnl_stats[side + "_TP"] += 1
+            self.pnl_stats[side + "_TP_PnL"] += pnl
+        elif pnl < 0:
+            self.pnl_stats[side + "_SL_PnL"] += pnl
+        if self.journal is not None:
+            self.journal.add(order)
+        else:
+            self.orders_closed.append(order)
+
+    def drop_orders_without_trade(self):
+        # orders opened while klines were streamed without OMS (snapshot catch-up) have no trade in terminal,
+        # drop them and leave the position state so the strategy can enter again, return number of dropped orders
+        orders = [order for order in self.orders_opening if order.__attrs__.get("trade_id") is not None]
+        num_dropped = len(self.orders_opening) - len(orders)
+        self.orders_opening = orders
+        if num_dropped > 0 and len(orders) == 0 and getattr(self, "state", None) is not None:
+            self.state = None
+        return num_dropped
+
     def init_indicators(self):
         pass
 
@@ -50,12 +109,16 @@ class BaseStrategy:
     def is_params_valid(self):
         return False
 
-    def update_orders_status(self, last_kline):
+    def update_orders_status(self, last_kline, tf=None):
+        for order in self.orders_opening:
+            order.update_status(last_kline, self.intrabar, tf)
+        self.move_closed_orders()
+
+    def move_closed_orders(self):
         for i in range(len(self.orders_opening) - 1, -1, -1):
             order = self.orders_opening[i]
-            order.update_status(last_kline)
             if order.is_closed():
-                self.orders_closed.append(order)
+                self.add_closed_order(order)
                 del self.orders_opening[i]
 
     def close_order_by_side(self, last_kline, order_side: OrderSide):
@@ -65,7 +128,7 @@ class BaseStrategy:
                 order.close(last_kline)
                 self.trader.close_trade(order)
                 if order.is_closed():
-                    self.orders_closed.append(order)
+                    self.add_closed_order(order)
                 del self.orders_opening[i]
 
     def close_opening_orders(self, last_kline):
@@ -74,68 +137,132 @@ class BaseStrategy:
             order.close(last_kline)
             self.trader.close_trade(order)
             if order.is_closed():
-                self.orders_closed.append(order)
+                self.add_closed_order(order)
             del self.orders_opening[i]
 
-    def summary_PnL(self):
-        num_long_order = 0
-        num_short_order = 0
-        num_long_profit = 0
-        num_short_profit = 0
-        long_PnL = 0
-        long_tp_profit = 0
-        long_sl_loss = 0
-        short_PnL = 0
-        short_tp_profit = 0
-        short_sl_loss = 0
+    def run_vectorized(self, tfs_chart):
+        # vectorized backtest over attached chart + tfs_chart, strategies exposing signal arrays
+        # compute them and call run_signals, return False to be updated bar by bar
+        return False
+
+    def create_signal_order(self, side: OrderSide, chart, i, desc):
+        # market order at close of kline i, same as created in check_signal
+        order = Order(OrderType.MARKET, side, chart["Close"].values[i], status=OrderStatus.FILLED)
+        order = self.trader.fix_order(order, self.params["sl_fix_mode"], self.max_sl_pct)
+        if order:
+            if order.type == OrderType.MARKET:
+                order["FILL_TIME"] = chart["Open time"].iloc[i]
+            order["strategy"] = self.name
+            order["description"] = self.description
+            order["desc"] = desc(i) if desc else {}
+            self.trader.create_trade(order, self.volume, self.strategy_id)
+        return order
+
+    def run_signals(self, chart, start, signals, reset_on_close, desc=None):
+        # simulate a single position strategy from bool signal arrays over chart, from kline start:
+        #   long_entry/short_entry: open market order at kline close when not in position
+        #   long_exit/short_exit: close order at kline close
+        # checks on each kline follow the bar by bar update: SL of open order, then exit signal, then entry.
+        # reset_on_close: strategy may enter again once SL closes its order, else it waits for exit signal
+        # jumps from signal to signal, SL is searched only between entry and exit signal
+        n = len(chart)
+        times = chart["Open time"]
+        closes = chart["Close"].values
+        highs = chart["High"].values
+        lows = chart["Low"].values
+        entries = {
+            OrderSide.BUY: np.flatnonzero(signals["long_entry"]),
+            OrderSide.SELL: np.flatnonzero(signals["short_entry"]),
+        }
+        exits = {
+            OrderSide.BUY: np.flatnonzero(signals["long_exit"]),
+            OrderSide.SELL: np.flatnonzero(signals["short_exit"]),
+        }
 
+        def next_signal(indexes, idx):
+            pos = np.searchsorted(indexes, idx)
+            return indexes[pos] if pos < len(indexes) else n
+
+        state, order, idx = None, None, start
+        while idx < n:
+            if state is None:
+                buy_idx = next_signal(entries[OrderSide.BUY], idx)
+                sell_idx = next_signal(entries[OrderSide.SELL], idx)
+                i = min(buy_idx, sell_idx)
+                if i >= n:
+                    break
+                side = OrderSide.BUY if buy_idx <= sell_idx else OrderSide.SELL
+                order = self.create_signal_order(side, chart, i, desc)
+                if order:
+                    state = side
+                idx = i + 1
+                continue
+            exit_idx = next_signal(exits[state], idx)
+            sl_idx = n
+            if order is not None and order.has_sl():
+                end = min(exit_idx + 1, n)
+                hits = lows[idx:end] <= order.sl if state == OrderSide.BUY else highs[idx:end] >= order.sl
+                if hits.any():
+                    sl_idx = idx + int(np.argmax(hits))
+            if sl_idx <= exit_idx and sl_idx < n:
+                # order hit sl
+                order.status = OrderStatus.HIT_SL
+                order["STOP_TIME"] = times.iloc[sl_idx]
+                self.add_closed_order(order)
+                order = None
+                if reset_on_close:
+                    state = None
+                idx = sl_idx
+                continue
+            if exit_idx >= n:
+                break
+            if order is not None:
+                order.close({"Open time": times.iloc[exit_idx], "Close": closes[exit_idx]})
+                self.add_closed_order(order)
+            state, order, idx = None, None, exit_idx + 1
+        if order is not None:
+            self.orders_opening.append(order)
+        self.state = state
+
+    def summary_PnL(self):
         def get_percent(x, y):
             return x / y * 100 if y > 0 else 0
 
-        for order in self.orders_closed:
-            pnl = order.get_PnL()
-            if order.side == OrderSide.BUY:
-                num_long_order += 1
-                long_PnL += pnl
-                if pnl > 0:
-                    num_long_profit += 1
-                    long_tp_profit += pnl
-                elif pnl < 0:
-                    long_sl_loss += pnl
-            else:
-                num_short_order += 1
-                short_PnL += pnl
-                if pnl > 0:
-                    num_short_profit += 1
-                    short_tp_profit += pnl
-                elif pnl < 0:
-                    short_sl_loss += pnl
+        stats = self.pnl_stats
+        num_order = stats["LONG"] + stats["SHORT"]
+        total_PnL = stats["LONG_PnL"] + stats["SHORT_PnL"]
         return {
             "NAME": self.get_name(),
-            "LONG": num_long_order,
-            "LONG_TP_PnL(%)": 100 * long_tp_profit,
-            "LONG_SL_PnL(%)": 100 * long_sl_loss,
-            "LONG_PnL(%)": 100 * long_PnL,
-            "NUM_LONG_TP": num_long_profit,
-            "LONG_TP_PCT": get_percent(num_long_profit, num_long_order),
-            "SHORT": num_short_order,
-            "SHORT_TP_PnL(%)": 100 * short_tp_profit,
-            "SHORT_SL_PnL(%)": 100 * short_sl_loss,
-            "SHORT_PnL(%)": 100 * short_PnL,
-            "NUM_SHORT_TP": num_short_profit,
-            "SHORT_TP_PCT": get_percent(num_short_profit, num_short_order),
-            "TOTAL": num_long_order + num_short_order,
-            "TOTAL_TP_PCT": get_percent(num_long_profit + num_short_profit, num_long_order + num_short_order),
-            "TOTAL_PnL(%)": 100 * (long_PnL + short_PnL),
-            "AVG(%)": get_percent(long_PnL + short_PnL, num_long_order + num_short_order),
+            "LONG": stats["LONG"],
+            "LONG_TP_PnL(%)": 100 * stats["LONG_TP_PnL"],
+            "LONG_SL_PnL(%)": 100 * stats["LONG_SL_PnL"],
+            "LONG_PnL(%)": 100 * stats["LONG_PnL"],
+            "NUM_LONG_TP": stats["LONG_TP"],
+            "LONG_TP_PCT": get_percent(stats["LONG_TP"], stats["LONG"]),
+            "SHORT": stats["SHORT"],
+            "SHORT_TP_PnL(%)": 100 * stats["SHORT_TP_PnL"],
+            "SHORT_SL_PnL(%)": 100 * stats["SHORT_SL_PnL"],
+            "SHORT_PnL(%)": 100 * stats["SHORT_PnL"],
+            "NUM_SHORT_TP": stats["SHORT_TP"],
+            "SHORT_TP_PCT": get_percent(stats["SHORT_TP"], stats["SHORT"]),
+            "TOTAL": num_order,
+            "TOTAL_TP_PCT": get_percent(stats["LONG_TP"] + stats["SHORT_TP"], num_order),
+            "TOTAL_PnL(%)": 100 * total_PnL,
+            "AVG(%)": get_percent(total_PnL, num_order),
         }
 
     def update(self, tf):
         self.update_indicators(tf)
-        self.update_orders_status(self.tfs_chart[tf].iloc[-1])
+        # order status on the kline was updated in batch by Trader.on_kline
+        self.move_closed_orders()
+
+    def get_described_orders(self):
+        # closed orders whose description (trend lines, zigzag points...) is plotted, none in fast plot mode
+        return [] if self.fast_plot else self.orders_closed
+
+    def plot_candles(self, fig, df, row, col, dt2idx=None):
+        import plotly.graph_objects as go
 
-    def plot_orders(self, fig, tf, row, col, dt2idx=None):
-        df = self.tfs_chart[tf]
         fig.add_trace(
             go.Candlestick(
                 x=df["Open time"],
@@ -150,6 +277,123 @@ class BaseStrategy:
             row=row,
             col=col,
         )
+
+    def plot_decimated_candles(self, fig, df, row, col, dt2idx=None):
+        import plotly.graph_objects as go
+
+        # merge each k consecutive klines into one candle
+        k = -(-len(df) // MAX_PLOT_CANDLES)
+        starts = np.arange(0, len(df), k)
+        ends = np.minimum(starts + k, len(df)) - 1
+        fig.add_trace(
+            go.Candlestick(
+                x=df["Open time"].values[starts],
+                open=df["Open"].values[starts],
+                high=np.maximum.reduceat(df["High"].values, starts),
+                low=np.minimum.reduceat(df["Low"].values, starts),
+                close=df["Close"].values[ends],
+                text=np.array(list(dt2idx.keys()), dtype=object)[starts] if dt2idx else None,
+                increasing={"fillcolor": "rgb(8, 153, 129)"},
+                decreasing={"fillcolor": "rgb(242, 54, 69)"},
+            ),
+            row=row,
+            col=col,
+        )
+
+    def plot_orders_batched(self, fig, row, col, dt2idx=None):
+        # one WebGL trace per kind of order shape, shapes of a trace are separated by None
+        import plotly.graph_objects as go
+
+        def get_x(t):
+            return t if dt2idx is None else dt2idx[t]
+
+        def add_box(shape, x0, x1, y0, y1):
+            shape[0].extend([x0, x1, x1, x0, x0, None])
+            shape[1].extend([y0, y0, y1, y1, y0, None])
+
+        def add_line(shape, x0, x1, y):
+            shape[0].extend([x0, x1, None])
+            shape[1].extend([y, y, None])
+
+        sl_boxes, sl_hit_boxes, tp_boxes, win_lines, loss_lines, limit_lines = [([], []) for _ in range(6)]
+        labels = ([], [], [])
+        for order in self.orders_closed:
+            x0, x1 = get_x(order.__attrs__["FILL_TIME"]), get_x(order.__attrs__["STOP_TIME"])
+            y = order.entry
+            if order.has_sl():
+                if order.risk_ratio > 0:
+                    add_box(sl_boxes, x0, x1, order.entry, order.sl)
+                elif order.status == OrderStatus.HIT_SL:
+                    add_box(sl_hit_boxes, x0, x1, order.entry, order.sl)
+                y = max(y, order.sl)
+            if order.has_tp():
+                add_box(tp_boxes, x0, x1, order.entry, order.tp)
+                y = max(y, order.tp)
+            if order.status == OrderStatus.STOPPED:
+                add_box(sl_hit_boxes, x0, x1, order.entry, order.__attrs__["STOP_PRICE"])
+                y = max(y, order.__attrs__["STOP_PRICE"])
+            add_line(win_lines if order.get_PnL() > 0 else loss_lines, x0, x1, order.entry)
+            if "LIMIT_TIME" in order.__attrs__:
+                add_line(limit_lines, x0, get_x(order.__attrs__["LIMIT_TIME"]), order.entry)
+            labels[0].append(x0)
+            labels[1].append(y)
+            labels[2].append(
+                "risk: {}<br>reward: {}<br>rr: {}<br>PnL: {}<br>id: {}".format(
+                    order.risk_ratio, order.reward_ratio, order.rr, order.get_PnL(), order.order_id
+                )
+            )
+        for (xs, ys), fillcolor in [
+            (sl_boxes, "rgba(242, 54, 69, 0.2)"),
+            (sl_hit_boxes, "rgba(0, 0, 200, 0.2)"),
+            (tp_boxes, "rgba(8, 153, 129, 0.2)"),
+        ]:
+            fig.add_trace(
+                go.Scattergl(
+                    x=xs,
+                    y=ys,
+                    mode="lines",
+                    line=dict(width=0),
+                    fill="toself",
+                    fillcolor=fillcolor,
+                    hoverinfo="skip",
+                    showlegend=False,
+                ),
+                row=row,
+                col=col,
+            )
+        for (xs, ys), line, name in [
+            (win_lines, dict(width=2, color="rgba(0, 255, 0, 1.0)"), "win_orders"),
+            (loss_lines, dict(width=2, color="rgba(255, 0, 0, 1.0)"), "loss_orders"),
+            (limit_lines, dict(width=1, dash="dash", color="rgba(255, 255, 255, 0.7)"), "limit_orders"),
+        ]:
+            fig.add_trace(
+                go.Scattergl(x=xs, y=ys, mode="lines", line=line, hoverinfo="skip", name=name),
+                row=row,
+                col=col,
+            )
+        fig.add_trace(
+            go.Scattergl(
+                x=labels[0],
+                y=labels[1],
+                mode="markers",
+                marker=dict(size=4, color="rgba(255, 255, 255, 1.0)"),
+                hovertext=labels[2],
+                hoverinfo="text",
+                name="order_text",
+            ),
+            row=row,
+            col=col,
+        )
+
+    def plot_orders(self, fig, tf, row, col, dt2idx=None):
+        # plotly is slow to import, load it only when plotting
+        import plotly.graph_objects as go
+
+        df = self.tfs_chart[tf]
+        if self.fast_plot:
+            self.plot_decimated_candles(fig, df, row, col, dt2idx=dt2idx)
+        else:
+            self.plot_candles(fig, df, row, col, dt2idx=dt2idx)
         if self.start_trading_time:
             fig.add_shape(
                 type="line",
@@ -160,6 +404,9 @@ class BaseStrategy:
                 line=dict(width=1, color="orange"),
                 yref="y domain",
             )
+        if self.fast_plot:
+            self.plot_orders_batched(fig, row, col, dt2idx=dt2idx)
+            return
         for order in self.orders_closed:
             if order.get_PnL() > 0:
                 line_color = "rgba(0, 255, 0, 1.0)"
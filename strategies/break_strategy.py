@@ -2,8 +2,6 @@ import logging
 import pandas as pd
 from datetime import datetime
 import talib as ta
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 from .base_strategy import BaseStrategy
 import indicators as mta
 from order import Order, OrderType, OrderSide, OrderStatus
@@ -215,7 +213,7 @@ class BreakStrategy(BaseStrategy):
                 }
                 order = self.trader.fix_order(order, self.params["sl_fix_mode"], self.max_sl_pct)
                 if order:
-                    self.trader.create_trade(order, self.volume)
+                    self.trader.create_trade(order, self.volume, self.strategy_id)
                     self.orders_opening.append(order)
         else:
             # red kkline
@@ -241,7 +239,7 @@ class BreakStrategy(BaseStrategy):
                 }
                 order = self.trader.fix_order(order, self.params["sl_fix_mode"], self.max_sl_pct)
                 if order:
-                    self.trader.create_trade(order, self.volume)
+                    self.trader.create_trade(order, self.volume, self.strategy_id)
                     self.orders_opening.append(order)
 
     def check_close_signal(self):
@@ -268,7 +266,7 @@ class BreakStrategy(BaseStrategy):
                     order.close(last_kline)
                     self.trader.close_trade(order)
                     if order.is_closed():
-                        self.orders_closed.append(order)
+                        self.add_closed_order(order)
                     del self.orders_opening[i]
         else:
             # green kline, check close sell orders
@@ -288,7 +286,7 @@ class BreakStrategy(BaseStrategy):
                     order.close(last_kline)
                     self.trader.close_trade(order)
                     if order.is_closed():
-                        self.orders_closed.append(order)
+                        self.add_closed_order(order)
                     del self.orders_opening[i]
 
     def check_close_reverse(self):
@@ -311,7 +309,7 @@ class BreakStrategy(BaseStrategy):
                         order.close(last_kline)
                         self.trader.close_trade(order)
                         if order.is_closed():
-                            self.orders_closed.append(order)
+                            self.add_closed_order(order)
                         del self.orders_opening[i]
         else:
             if self.zz_points[self.main_zz_idx[-1]].pline.low > self.zz_points[self.main_zz_idx[-3]].pline.low:
@@ -327,7 +325,7 @@ class BreakStrategy(BaseStrategy):
                         order.close(last_kline)
                         self.trader.close_trade(order)
                         if order.is_closed():
-                            self.orders_closed.append(order)
+                            self.add_closed_order(order)
                         del self.orders_opening[i]
 
     def adjust_sl(self):
@@ -350,6 +348,9 @@ class BreakStrategy(BaseStrategy):
                     self.trader.adjust_sl(order, last_main_zz.pline.low)
 
     def plot_orders(self):
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+
         fig = make_subplots(2, 1, vertical_spacing=0.02, shared_xaxes=True, row_heights=[0.8, 0.2])
         fig.update_layout(
             xaxis_rangeslider_visible=False,
@@ -422,7 +423,7 @@ class BreakStrategy(BaseStrategy):
                 col=1,
             )
 
-        for order in self.orders_closed:
+        for order in self.get_described_orders():
             desc = order["desc"]
             up_trend = desc["up_trend_line"]
             down_trend = desc["down_trend_line"]
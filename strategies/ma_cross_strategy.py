@@ -1,9 +1,8 @@
 import logging
+import numpy as np
 import pandas as pd
 from datetime import datetime
 import talib as ta
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 from .base_strategy import BaseStrategy
 import indicators as mta
 from order import Order, OrderType, OrderSide, OrderStatus
@@ -25,8 +24,15 @@ class MACross(BaseStrategy):
         self.tf = self.tfs["tf"]
         self.state = None
         self.trend = None
-        self.ma_func = ta.SMA if self.params["type"] == "SMA" else ta.EMA
-        self.ma_stream_func = ta.stream.SMA if self.params["type"] == "SMA" else ta.stream.EMA
+
+    # resolved from params on access so the strategy stays picklable for snapshots
+    @property
+    def ma_func(self):
+        return ta.SMA if self.params["type"] == "SMA" else ta.EMA
+
+    @property
+    def ma_stream_func(self):
+        return ta.stream.SMA if self.params["type"] == "SMA" else ta.stream.EMA
 
     def attach(self, tfs_chart):
         self.tfs_chart = tfs_chart
@@ -70,6 +76,29 @@ class MACross(BaseStrategy):
     def close_opening_orders(self):
         super().close_opening_orders(self.tfs_chart[self.tf].iloc[-1])
 
+    def run_vectorized(self, tfs_chart):
+        # same signals as check_signal, computed over the whole chart
+        if self.params["sl_fix_mode"] == "ADJ_ENTRY":
+            # entries become pending limit orders, run_signals only simulates orders filled at signal close
+            return False
+        chart = pd.concat([self.tfs_chart[self.tf], tfs_chart[self.tf]], ignore_index=True)
+        start = len(self.tfs_chart[self.tf])
+        close, open = chart["Close"].values, chart["Open"].values
+        self.fast_ma = pd.Series(self.ma_func(chart["Close"], self.params["fast_ma"]))
+        self.slow_ma = pd.Series(self.ma_func(chart["Close"], self.params["slow_ma"]))
+        fast_ma, slow_ma = self.fast_ma.values, self.slow_ma.values
+        sma_100 = np.asarray(ta.SMA(chart["Close"], 100))
+        long_entry = (fast_ma > slow_ma) & (slow_ma > sma_100) & (close >= sma_100) & (close > open)
+        short_entry = ~long_entry & (fast_ma < slow_ma) & (slow_ma < sma_100) & (close <= sma_100) & (close < open)
+        signals = {
+            "long_entry": long_entry,
+            "short_entry": short_entry,
+            "long_exit": (close < open) & (fast_ma < slow_ma),
+            "short_exit": (close > open) & (fast_ma > slow_ma),
+        }
+        self.run_signals(chart, start, signals, reset_on_close=True)
+        return True
+
     def check_signal(self):
         chart = self.tfs_chart[self.tf]
         last_kline = chart.iloc[-1]
@@ -89,7 +118,7 @@ class MACross(BaseStrategy):
                     order["strategy"] = self.name
                     order["description"] = self.description
                     order["desc"] = {}
-                    self.trader.create_trade(order, self.volume)
+                    self.trader.create_trade(order, self.volume, self.strategy_id)
                     self.orders_opening.append(order)
                     self.state = IN_BUYING
             elif (
@@ -107,7 +136,7 @@ class MACross(BaseStrategy):
                     order["strategy"] = self.name
                     order["description"] = self.description
                     order["desc"] = {}
-                    self.trader.create_trade(order, self.volume)
+                    self.trader.create_trade(order, self.volume, self.strategy_id)
                     self.orders_opening.append(order)
                     self.state = IN_SELLING
         elif self.state == IN_BUYING and last_kline["Close"] < last_kline["Open"]:
@@ -122,6 +151,9 @@ class MACross(BaseStrategy):
                 self.state = None
 
     def plot_orders(self):
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+
         fig = make_subplots(2, 1, vertical_spacing=0.02, shared_xaxes=True, row_heights=[0.8, 0.2])
         fig.update_layout(
             xaxis_rangeslider_visible=False,
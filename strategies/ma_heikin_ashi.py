@@ -1,9 +1,8 @@
 import logging
+import numpy as np
 import pandas as pd
 from datetime import datetime
 import talib as ta
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 from .base_strategy import BaseStrategy
 import indicators as mta
 from order import Order, OrderType, OrderSide, OrderStatus
@@ -27,8 +26,15 @@ class MAHeikinAshi(BaseStrategy):
         self.tf = self.tfs["tf"]
         self.state = None
         self.trend = None
-        self.ma_func = ta.SMA if self.params["type"] == "SMA" else ta.EMA
-        self.ma_stream_func = ta.stream.SMA if self.params["type"] == "SMA" else ta.stream.EMA
+
+    # resolved from params on access so the strategy stays picklable for snapshots
+    @property
+    def ma_func(self):
+        return ta.SMA if self.params["type"] == "SMA" else ta.EMA
+
+    @property
+    def ma_stream_func(self):
+        return ta.stream.SMA if self.params["type"] == "SMA" else ta.stream.EMA
 
     def attach(self, tfs_chart):
         self.tfs_chart = tfs_chart
@@ -83,6 +89,48 @@ class MAHeikinAshi(BaseStrategy):
     def close_opening_orders(self):
         super().close_opening_orders(self.tfs_chart[self.tf].iloc[-1])
 
+    def run_vectorized(self, tfs_chart):
+        # same signals as check_signal, computed over the whole chart
+        # trend lines are still fitted on the last n_kline_trend klines of each kline
+        if self.params["sl_fix_mode"] == "ADJ_ENTRY":
+            # entries become pending limit orders, run_signals only simulates orders filled at signal close
+            return False
+        if len(tfs_chart[self.tf]) == 0:
+            # no replay klines to fit trend lines on, the init chart's trend lines are kept
+            return False
+        chart = pd.concat([self.tfs_chart[self.tf], tfs_chart[self.tf]], ignore_index=True)
+        start = len(self.tfs_chart[self.tf])
+        n_kline_trend = self.params["n_kline_trend"]
+        self.ha = mta.heikin_ashi(chart, self.params["ha_smooth"])
+        self.fast_ma = pd.Series(self.ma_func(chart["Close"], self.params["fast_ma"]))
+        self.slow_ma = pd.Series(self.ma_func(chart["Close"], self.params["slow_ma"]))
+        fast_ma, slow_ma = self.fast_ma.values, self.slow_ma.values
+        lows, highs = chart["Low"].values, chart["High"].values
+        up_pct = np.full(len(chart), np.nan)
+        down_pct = np.full(len(chart), np.nan)
+        trend_lines = {}
+        for i in range(start, len(chart)):
+            x = range(i + 1 - n_kline_trend, i + 1)
+            up_trend_line = find_uptrend_line(list(zip(x, lows[i + 1 - n_kline_trend : i + 1])))
+            down_trend_line = find_downtrend_line(list(zip(x, highs[i + 1 - n_kline_trend : i + 1])))
+            up_pct[i] = (up_trend_line[1][1] - up_trend_line[0][1]) / up_trend_line[0][1]
+            down_pct[i] = (down_trend_line[1][1] - down_trend_line[0][1]) / down_trend_line[0][1]
+            trend_lines[i] = {"up_trend_line": up_trend_line, "down_trend_line": down_trend_line}
+        self.up_trend_line = trend_lines[len(chart) - 1]["up_trend_line"]
+        self.down_trend_line = trend_lines[len(chart) - 1]["down_trend_line"]
+        self.up_pct, self.down_pct = up_pct[-1], down_pct[-1]
+        ha_open, ha_close = self.ha["Open"].values, self.ha["Close"].values
+        long_trend = (up_pct > 0.03) & (down_pct > 0) & (fast_ma > slow_ma)
+        short_trend = (down_pct < -0.03) & (up_pct < 0) & (fast_ma < slow_ma)
+        signals = {
+            "long_entry": long_trend & (ha_open < ha_close) & (ha_open == self.ha["Low"].values),
+            "short_entry": ~long_trend & short_trend & (ha_open > ha_close) & (ha_open == self.ha["High"].values),
+            "long_exit": (fast_ma < slow_ma) & (down_pct < 0),
+            "short_exit": (fast_ma > slow_ma) & (up_pct > 0),
+        }
+        self.run_signals(chart, start, signals, reset_on_close=False, desc=trend_lines.get)
+        return True
+
     def check_signal(self, last_kline):
         last_ha = self.ha.iloc[-1]
         if self.state is None:
@@ -97,7 +145,7 @@ class MAHeikinAshi(BaseStrategy):
                         order["strategy"] = self.name
                         order["description"] = self.description
                         order["desc"] = {"up_trend_line": self.up_trend_line, "down_trend_line": self.down_trend_line}
-                        self.trader.create_trade(order, self.volume)
+                        self.trader.create_trade(order, self.volume, self.strategy_id)
                         self.orders_opening.append(order)
                         self.state = IN_BUYING
             elif self.down_pct < -0.03 and self.up_pct < 0 and self.fast_ma.iloc[-1] < self.slow_ma.iloc[-1]:
@@ -111,7 +159,7 @@ class MAHeikinAshi(BaseStrategy):
                         order["strategy"] = self.name
                         order["description"] = self.description
                         order["desc"] = {"up_trend_line": self.up_trend_line, "down_trend_line": self.down_trend_line}
-                        self.trader.create_trade(order, self.volume)
+                        self.trader.create_trade(order, self.volume, self.strategy_id)
                         self.orders_opening.append(order)
                         self.state = IN_SELLING
         elif self.state == IN_BUYING:
@@ -126,6 +174,9 @@ class MAHeikinAshi(BaseStrategy):
                 self.state = None
 
     def plot_orders(self):
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+
         fig = make_subplots(3, 1, vertical_spacing=0.02, shared_xaxes=True, row_heights=[0.4, 0.4, 0.2])
         fig.update_layout(
             xaxis_rangeslider_visible=False,
@@ -144,7 +195,7 @@ class MAHeikinAshi(BaseStrategy):
         df["Open time"] = list(range(len(df)))
         super().plot_orders(fig, self.tf, 1, 1)
 
-        for order in self.orders_closed:
+        for order in self.get_described_orders():
             desc = order["desc"]
             up_trend = desc["up_trend_line"]
             down_trend = desc["down_trend_line"]
@@ -2,8 +2,6 @@ import logging
 import pandas as pd
 from datetime import datetime
 import talib as ta
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 from .base_strategy import BaseStrategy
 import indicators as mta
 from order import Order, OrderType, OrderSide, OrderStatus
@@ -256,7 +254,6 @@ class MACDDivergence(BaseStrategy):
                             order["FILL_TIME"] = last_kline["Open time"]
                         order["strategy"] = self.name
                         order["description"] = self.description
-                        self.trader.create_trade(order, self.volume)
                         order["desc"] = {
                             "type": "higher_low_lower_low",
                             "zz_point_1": zz_point,
@@ -269,6 +266,7 @@ class MACDDivergence(BaseStrategy):
                             "idx_1": low_1_idx,
                             "idx_2": low_2_idx,
                         }
+                        self.trader.create_trade(order, self.volume, self.strategy_id)
                         self.orders_opening.append(order)
                         self.checked_pidx.append(last_zz_point.pidx)
                         break
@@ -343,7 +341,6 @@ class MACDDivergence(BaseStrategy):
                             order["FILL_TIME"] = last_kline["Open time"]
                         order["strategy"] = self.name
                         order["description"] = self.description
-                        self.trader.create_trade(order, self.volume)
                         order["desc"] = {
                             "type": "lower_high_higher_high",
                             "zz_point_1": zz_point,
@@ -356,11 +353,15 @@ class MACDDivergence(BaseStrategy):
                             "idx_1": low_1_idx,
                             "idx_2": low_2_idx,
                         }
+                        self.trader.create_trade(order, self.volume, self.strategy_id)
                         self.orders_opening.append(order)
                         self.checked_pidx.append(last_zz_point.pidx)
                         break
 
     def plot_orders(self):
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+
         fig = make_subplots(2, 1, vertical_spacing=0.02, shared_xaxes=True, row_heights=[0.6, 0.4])
         fig.update_layout(
             xaxis_rangeslider_visible=False,
@@ -414,7 +415,7 @@ class MACDDivergence(BaseStrategy):
             go.Bar(x=df["Open time"], y=self.macdhist, marker_color=colors, name="MACD Histogram"), row=2, col=1
         )
 
-        for order in self.orders_closed:
+        for order in self.get_described_orders():
             desc = order["desc"]
             zz_point_1 = desc["zz_point_1"]
             zz_point_2 = desc["zz_point_2"]
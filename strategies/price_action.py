@@ -2,8 +2,6 @@ import logging
 import pandas as pd
 from datetime import datetime
 import talib as ta
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 from .base_strategy import BaseStrategy
 import indicators as mta
 from order import Order, OrderType, OrderSide, OrderStatus
@@ -193,7 +191,7 @@ class PriceAction(BaseStrategy):
                         order["desc"] = {}
                         order = self.trader.fix_order(order, self.params["sl_fix_mode"], self.max_sl_pct)
                         if order:
-                            self.trader.create_trade(order, self.volume)
+                            self.trader.create_trade(order, self.volume, self.strategy_id)
                             self.orders_opening.append(order)
                             self.checked_pidx.append(p_1.pidx)
                             self.close_order_by_side(last_kline, OrderSide.SELL)
@@ -216,7 +214,7 @@ class PriceAction(BaseStrategy):
                     order["desc"] = {}
                     order = self.trader.fix_order(order, self.params["sl_fix_mode"], self.max_sl_pct)
                     if order:
-                        self.trader.create_trade(order, self.volume)
+                        self.trader.create_trade(order, self.volume, self.strategy_id)
                         self.orders_opening.append(order)
                         self.checked_pidx.append(p_1.pidx)
                         self.close_order_by_side(last_kline, OrderSide.BUY)
@@ -236,6 +234,9 @@ class PriceAction(BaseStrategy):
                 return
 
     def plot_orders(self):
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+
         fig = make_subplots(2, 1, vertical_spacing=0.02, shared_xaxes=True, row_heights=[0.8, 0.2])
         fig.update_layout(
             xaxis_rangeslider_visible=False,
@@ -308,7 +309,7 @@ class PriceAction(BaseStrategy):
                 col=1,
             )
 
-        for order in self.orders_closed:
+        for order in self.get_described_orders():
             desc = order["desc"]
 
         colors = [
@@ -2,8 +2,6 @@ import logging
 import pandas as pd
 from datetime import datetime
 import talib as ta
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 from .base_strategy import BaseStrategy
 import indicators as mta
 from order import Order, OrderType, OrderSide, OrderStatus
@@ -212,7 +210,6 @@ class RSIDivergence(BaseStrategy):
                             order["FILL_TIME"] = last_kline["Open time"]
                         order["strategy"] = self.name
                         order["description"] = self.description
-                        self.trader.create_trade(order, self.volume)
                         order["desc"] = {
                             "type": "higher_low_lower_low",
                             "zz_point_1": zz_point,
@@ -225,6 +222,7 @@ class RSIDivergence(BaseStrategy):
                             "rsi_1": self.rsi[zz_point.pidx],
                             "rsi_2": self.rsi[last_zz_point.pidx],
                         }
+                        self.trader.create_trade(order, self.volume, self.strategy_id)
                         self.orders_opening.append(order)
                         self.checked_pidx.append(last_zz_point.pidx)
                         break
@@ -283,7 +281,6 @@ class RSIDivergence(BaseStrategy):
                             order["FILL_TIME"] = last_kline["Open time"]
                         order["strategy"] = self.name
                         order["description"] = self.description
-                        self.trader.create_trade(order, self.volume)
                         order["desc"] = {
                             "type": "lower_high_higher_high",
                             "zz_point_1": zz_point,
@@ -296,11 +293,15 @@ class RSIDivergence(BaseStrategy):
                             "rsi_1": self.rsi[zz_point.pidx],
                             "rsi_2": self.rsi[last_zz_point.pidx],
                         }
+                        self.trader.create_trade(order, self.volume, self.strategy_id)
                         self.orders_opening.append(order)
                         self.checked_pidx.append(last_zz_point.pidx)
                         break
 
     def plot_orders(self):
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+
         fig = make_subplots(3, 1, vertical_spacing=0.02, shared_xaxes=True, row_heights=[0.6, 0.2, 0.2])
         fig.update_layout(
             xaxis_rangeslider_visible=False,
@@ -364,7 +365,7 @@ class RSIDivergence(BaseStrategy):
             row=2,
             col=1,
         )
-        for order in self.orders_closed:
+        for order in self.get_described_orders():
             desc = order["desc"]
             zz_point_1 = desc["zz_point_1"]
             zz_point_2 = desc["zz_point_2"]
@@ -2,8 +2,6 @@ import logging
 import pandas as pd
 from datetime import datetime
 import talib as ta
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 from .base_strategy import BaseStrategy
 import indicators as mta
 from order import Order, OrderType, OrderSide, OrderStatus
@@ -240,7 +238,6 @@ class RSIRegularDivergence(BaseStrategy):
                     order["FILL_TIME"] = last_kline["Open time"]
                 order["strategy"] = self.name
                 order["description"] = self.description
-                self.trader.create_trade(order, self.volume)
                 order["desc"] = {
                     "type": "higher_high_lower_high",
                     "zz_point_1": last_diverg_seg[0],
@@ -248,6 +245,7 @@ class RSIRegularDivergence(BaseStrategy):
                     "rsi_1": last_rsi_diverg[0],
                     "rsi_2": last_rsi_diverg[1],
                 }
+                self.trader.create_trade(order, self.volume, self.strategy_id)
                 self.orders_opening.append(order)
                 self.checked_seg.append(last_diverg_seg[1].pidx)
 
@@ -271,7 +269,6 @@ class RSIRegularDivergence(BaseStrategy):
                     order["FILL_TIME"] = last_kline["Open time"]
                 order["strategy"] = self.name
                 order["description"] = self.description
-                self.trader.create_trade(order, self.volume)
                 order["desc"] = {
                     "type": "lower_low_higher_low",
                     "zz_point_1": last_diverg_seg[0],
@@ -279,6 +276,7 @@ class RSIRegularDivergence(BaseStrategy):
                     "rsi_1": last_rsi_diverg[0],
                     "rsi_2": last_rsi_diverg[1],
                 }
+                self.trader.create_trade(order, self.volume, self.strategy_id)
                 self.orders_opening.append(order)
                 self.checked_seg.append(last_diverg_seg[1].pidx)
 
@@ -304,6 +302,9 @@ class RSIRegularDivergence(BaseStrategy):
                     self.close_order_by_side(last_kline, OrderSide.BUY)
 
     def plot_orders(self):
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+
         fig = make_subplots(3, 1, vertical_spacing=0.02, shared_xaxes=True, row_heights=[0.6, 0.2, 0.2])
         fig.update_layout(
             xaxis_rangeslider_visible=False,
@@ -368,7 +369,7 @@ class RSIRegularDivergence(BaseStrategy):
             row=2,
             col=1,
         )
-        for order in self.orders_closed:
+        for order in self.get_described_orders():
             desc = order["desc"]
             zz_point_1 = desc["zz_point_1"]
             zz_point_2 = desc["zz_point_2"]
@@ -4,8 +4,6 @@ import pandas as pd
 from datetime import datetime
 from typing import List
 import talib as ta
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 from .base_strategy import BaseStrategy
 import indicators as mta
 from order import Order, OrderType, OrderSide, OrderStatus
@@ -333,7 +331,7 @@ class TrendFollowing(BaseStrategy):
                         order["FILL_TIME"] = last_kline["Open time"]
                     else:
                         order["LIMIT_TIME"] = last_kline["Open time"]
-                    self.trader.create_trade(order, self.volume)
+                    self.trader.create_trade(order, self.volume, self.strategy_id)
                     self.orders_opening.append(order)
                     break
             if i >= 2 * self.max_last_trend_line - 1:
@@ -380,6 +378,9 @@ class TrendFollowing(BaseStrategy):
                             self.trader.adjust_sl(order, new_sl)
 
     def plot_orders(self):
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+
         fig = make_subplots(2, 1, vertical_spacing=0.02, shared_xaxes=True, row_heights=[0.8, 0.2])
         fig.update_layout(
             xaxis_rangeslider_visible=False,
@@ -487,7 +488,7 @@ class TrendFollowing(BaseStrategy):
                 )
             )
 
-        for i, order in enumerate(self.orders_closed):
+        for i, order in enumerate(self.get_described_orders()):
             trend_line = order["desc"]["trend_line"]
             pidx = order["desc"]["pidx"]
             trend_line_id = order["desc"]["trend_line_id"]
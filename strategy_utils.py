@@ -1,18 +1,24 @@
-from strategies import *
+import importlib
 
+# strategy name -> (module in strategies package, class), modules are imported on first use
 strategies = {
-    "ma_cross": "MACross",
-    "ma_heikin_ashi": "MAHeikinAshi",
-    "rsi_hidden_divergence": "RSIDivergence",
-    "macd_divergence": "MACDDivergence",
-    "rsi_regular_divergence": "RSIRegularDivergence",
-    "break_strategy": "BreakStrategy",
-    "price_action": "PriceAction",
-    "trend_following": "TrendFollowing",
-    "zigzag_follower": "ZigzagFollower",
+    "ma_cross": ("ma_cross_strategy", "MACross"),
+    "ma_heikin_ashi": ("ma_heikin_ashi", "MAHeikinAshi"),
+    "rsi_hidden_divergence": ("rsi_hidden_divergence", "RSIDivergence"),
+    "macd_divergence": ("macd_divergence", "MACDDivergence"),
+    "rsi_regular_divergence": ("rsi_regular_divergence", "RSIRegularDivergence"),
+    "break_strategy": ("break_strategy", "BreakStrategy"),
+    "price_action": ("price_action", "PriceAction"),
+    "trend_following": ("trend_following", "TrendFollowing"),
+    "zigzag_follower": ("zigzag_follower", "ZigzagFollower"),
 }
 
 
+def get_strategy_class(strategy_name):
+    module_name, class_name = strategies[strategy_name]
+    return getattr(importlib.import_module("strategies." + module_name), class_name)
+
+
 def load_strategy(strategy_def):
     strategy_name = strategy_def["name"]
-    return globals()[strategies[strategy_name]](strategy_name, strategy_def["params"], strategy_def["tfs"])
+    return get_strategy_class(strategy_name)(strategy_name, strategy_def["params"], strategy_def["tfs"])
@@ -1,23 +1,30 @@
 import os
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
 import json
+import threading
 from typing import List
 import pandas as pd
 import tzlocal
 from apscheduler.schedulers.background import BackgroundScheduler
 from trader import Trader
+from trade_journal import TradeJournal
+from report import write_reports
+from metrics import LiveMetrics, MetricsServer
 from exchange_loader import ExchangeLoader, OMSLoader
-from utils import tf_cron, NUM_KLINE_INIT
+from utils import tf_cron, tf_to_timedelta, NUM_KLINE_INIT
 from utils import get_pretty_table
 
 
 bot_logger = logging.getLogger("bot_logger")
+SNAPSHOT_INTERVAL_MINUTES = 15
+SUMMARY_INTERVAL_MINUTES = 60
+LATENCY_INTERVAL_MINUTES = 15
 
 
 class TradeEngine:
-    def __init__(self, exchange_name, exc_cfg_file, symbols_trading_cfg_file):
+    def __init__(self, exchange_name, exc_cfg_file, symbols_trading_cfg_file, metrics_port=None):
         self.exchange_name = exchange_name
         self.exc_cfg_file = exc_cfg_file
         self.symbols_trading_cfg_file = symbols_trading_cfg_file
@@ -25,6 +32,18 @@ class TradeEngine:
         self.required_tfs = []
         self.last_updated_tfs = {}
         self.bot_traders: List[Trader] = []
+        self.income_history_file = None
+        # serialize kline updates with snapshots
+        self.update_lock = threading.Lock()
+        # stage latencies from bar close to order result, counters and gauges of the engine
+        self.metrics = LiveMetrics()
+        # serve metrics in Prometheus text format on localhost, None to disable
+        self.metrics_port = metrics_port
+        self.metrics_server = None
+        # trade ids held by strategies restored from snapshots before catch-up, see restore_trades
+        self.snapshot_trade_ids = set()
+        # terminal clock minute of the last kline update, None before the first one
+        self.last_update_minute = None
 
     def init(self):
         self.mt5_api = ExchangeLoader(self.exc_cfg_file).get_exchange(exchange_name=self.exchange_name)
@@ -34,7 +53,12 @@ class TradeEngine:
             bot_logger.info("[-] Init MT5 API failed, stop")
             return False
         self.oms = OMSLoader().get_oms(self.exchange_name, self.mt5_api)
+        self.journal = TradeJournal(os.path.join(os.environ["STATE_DIR"], "{}_trades.db".format(self.exchange_name)))
+        self.oms.attach_journal(self.journal)
+        self.oms.attach_metrics(self.metrics)
+        self.metrics.add_gauge("open_trades", "Active trades per symbol", self.oms.get_open_trades)
         self.init_bot_traders(self.symbols_trading_cfg_file)
+        self.restore_trades()
         return True
 
     def init_bot_traders(self, symbols_trading_cfg_file):
@@ -42,20 +66,11 @@ class TradeEngine:
             symbols_config = json.load(f)
         for symbol_cfg in symbols_config:
             bot_logger.info("[+] Create trading bot for symbol: {}".format(symbol_cfg["symbol"]))
-            bot_trader = Trader(symbol_cfg)
-            bot_trader.init_strategies()
-            tfs_chart = {}
+            bot_trader = Trader.load_snapshot(self.get_snapshot_file(symbol_cfg["symbol"]), symbol_cfg)
+            if bot_trader is None or not self.catch_up_bot_trader(bot_trader):
+                bot_trader = self.init_bot_trader(symbol_cfg)
             for tf in bot_trader.get_required_tfs():
-                chart_df = self.mt5_api.klines(symbol_cfg["symbol"], tf, limit=NUM_KLINE_INIT + 1)
-                chart_df = chart_df[:-1]
-                tfs_chart[tf] = chart_df
-                bot_logger.info(
-                    "[+] Init bot symbol: {}, tf: {}, from: {} to: {}".format(
-                        symbol_cfg["symbol"], tf, chart_df.iloc[0]["Open time"], chart_df.iloc[-1]["Open time"]
-                    )
-                )
-                self.last_updated_tfs[tf] = chart_df.iloc[-1]["Open time"]
-            bot_trader.init_chart(tfs_chart)
+                self.last_updated_tfs[tf] = bot_trader.tfs_chart[tf].iloc[-1]["Open time"]
             bot_trader.attach_oms(self.oms)
             self.required_tfs.extend(bot_trader.get_required_tfs())
             self.bot_traders.append(bot_trader)
@@ -65,60 +80,211 @@ class TradeEngine:
         bot_logger.info("[+] Required timeframes: {}".format(self.required_tfs))
         bot_logger.info("[+] Last updated timeframes: {}".format(self.last_updated_tfs))
 
+    def init_bot_trader(self, symbol_cfg):
+        bot_trader = Trader(symbol_cfg)
+        bot_trader.init_strategies()
+        tfs_chart = {}
+        for tf in bot_trader.get_required_tfs():
+            chart_df = self.mt5_api.klines(symbol_cfg["symbol"], tf, limit=NUM_KLINE_INIT + 1)
+            chart_df = chart_df[:-1]
+            tfs_chart[tf] = chart_df
+            bot_logger.info(
+                "[+] Init bot symbol: {}, tf: {}, from: {} to: {}".format(
+                    symbol_cfg["symbol"], tf, chart_df.iloc[0]["Open time"], chart_df.iloc[-1]["Open time"]
+                )
+            )
+        bot_trader.init_chart(tfs_chart)
+        return bot_trader
+
+    def catch_up_bot_trader(self, bot_trader):
+        # stream klines closed after snapshot through on_kline, oms isn't attached yet so no trade is sent and entries
+        # opened meanwhile are dropped, closes and sl changes of snapshot trades are applied to terminal by restore_trades
+        # return False if snapshot is older than available klines
+        symbol = bot_trader.get_symbol_name()
+        tfs_order = list(tf_cron.keys())
+        curr_time = self.mt5_api.get_time()
+        missing_klines = []
+        for tf in bot_trader.get_required_tfs():
+            last_time = bot_trader.tfs_chart[tf].iloc[-1]["Open time"]
+            chart_df = self.get_closed_klines(symbol, tf, last_time, curr_time)
+            if chart_df.iloc[0]["Open time"] > last_time:
+                bot_logger.info("   [-] Snapshot of {} tf {} is too old ({}), re-init".format(symbol, tf, last_time))
+                return False
+            chart_df = chart_df[chart_df["Open time"] > last_time]
+            for i in range(len(chart_df)):
+                kline = chart_df[i : i + 1]
+                close_time = kline.iloc[0]["Open time"] + tf_to_timedelta(tf)
+                missing_klines.append((close_time, tfs_order.index(tf), tf, kline))
+        # replay in live order: by close time, larger timeframe first
+        missing_klines.sort(key=lambda x: (x[0], x[1]))
+        for strategy in bot_trader.strategies:
+            self.snapshot_trade_ids.update(order["trade_id"] for order in strategy.orders_opening if "trade_id" in order)
+        for _, _, tf, kline in missing_klines:
+            bot_trader.on_kline(tf, kline)
+        num_dropped = sum(strategy.drop_orders_without_trade() for strategy in bot_trader.strategies)
+        if num_dropped > 0:
+            bot_logger.info("   [-] Drop {} orders of {} opened while catching up, not sent".format(num_dropped, symbol))
+        bot_logger.info("[+] Restore bot symbol: {} from snapshot, {} klines streamed".format(symbol, len(missing_klines)))
+        return True
+
+    def get_closed_klines(self, symbol, tf, last_time, curr_time):
+        # closed klines from the one opened at last_time to curr_time, at most NUM_KLINE_INIT
+        num_klines = int((curr_time - last_time) / tf_to_timedelta(tf)) + 2
+        chart_df = self.mt5_api.klines(symbol, tf, limit=min(num_klines, NUM_KLINE_INIT + 1))
+        return chart_df[:-1]
+
+    def get_snapshot_file(self, symbol):
+        return os.path.join(os.environ["STATE_DIR"], "{}_{}.snapshot".format(self.exchange_name, symbol))
+
+    def save_snapshots(self):
+        with self.update_lock:
+            for bot_trader in self.bot_traders:
+                bot_trader.save_snapshot(self.get_snapshot_file(bot_trader.get_symbol_name()))
+        bot_logger.info("[+] Save snapshots of {} bots".format(len(self.bot_traders)))
+
+    def restore_trades(self):
+        # re-attach trades of previous run to their strategies, close positions no strategy owns anymore
+        trades = self.journal.replay()
+        open_tickets = self.oms.get_open_tickets()
+        if open_tickets is None:
+            bot_logger.warning("[-] Cannot get open positions, skip restore {} journaled trades".format(len(trades)))
+            return
+        # strategies sharing a description differ by their index in the symbol config
+        strategies = {}
+        for bot_trader in self.bot_traders:
+            for strategy in bot_trader.strategies:
+                strategies[(bot_trader.get_symbol_name(), strategy.strategy_id)] = strategy
+        for trade in self.oms.restore_trades(trades, open_tickets):
+            strategy_id = trade.order["strategy_id"] if "strategy_id" in trade.order else None
+            strategy = strategies.get((trade.order["symbol"], strategy_id))
+            if strategy is None or strategy.description != trade.order["description"]:
+                bot_logger.info("   [-] No strategy for restored trade: {}, close it".format(trade.trade_id))
+                self.oms.close_trade(trade.trade_id)
+                continue
+            # strategy restored from snapshot already holds the order, unless it closed it while catching up
+            orders = [order for order in strategy.orders_opening if order.__attrs__.get("trade_id") == trade.trade_id]
+            if len(orders) == 0 and trade.trade_id in self.snapshot_trade_ids:
+                bot_logger.info("   [-] Trade: {} closed by strategy while catching up, close it".format(trade.trade_id))
+                self.oms.close_trade(trade.trade_id)
+                continue
+            bot_logger.info(
+                "   [+] Restore trade: {} to {} {}".format(trade.trade_id, trade.order["symbol"], trade.order["description"])
+            )
+            if len(orders) > 0:
+                order = orders[0]
+                if order.has_sl() and self.mt5_api.round_price(order["symbol"], order.sl) != trade.order.sl:
+                    # sl moved by strategy while catching up
+                    self.oms.adjust_sl(trade.trade_id, order.sl)
+                trade.order = order
+            else:
+                strategy.orders_opening.append(trade.order)
+        self.journal.compact(self.oms.active_trades.values())
+
     def __update_next_kline__(self):
-        curr_time = datetime.now()
-        hour, minute = curr_time.hour, curr_time.minute
+        fire_time = time.time()
+        with self.update_lock:
+            # marks of the previous bar are reset only once its update released the lock
+            self.metrics.start_bar(fire_time)
+            self.update_next_kline()
+
+    def get_due_tfs(self, curr_time):
+        # required timeframes with a kline closed in the terminal clock minutes since the last update,
+        # more than one minute passes between updates when the simulated clock runs faster than wall clock
+        curr_minute = curr_time.replace(second=0, microsecond=0)
+        minute = curr_minute if self.last_update_minute is None else self.last_update_minute + timedelta(minutes=1)
+        self.last_update_minute = curr_minute
+        due_tfs = set()
+        while minute <= curr_minute:
+            for tf in self.required_tfs:
+                cron_time = tf_cron[tf]
+                if ("hour" not in cron_time or minute.hour in cron_time["hour"]) and (
+                    "minute" not in cron_time or minute.minute in cron_time["minute"]
+                ):
+                    due_tfs.add(tf)
+            minute += timedelta(minutes=1)
+        return [tf for tf in self.required_tfs if tf in due_tfs]
+
+    def update_next_kline(self):
+        # stream klines closed since the last update, several per timeframe when updates were skipped,
+        # in live order: by close time, larger timeframe first
+        curr_time = self.mt5_api.get_time()
+        tfs_order = list(tf_cron.keys())
+        due_tfs = self.get_due_tfs(curr_time)
+        last_updated_tfs = dict(self.last_updated_tfs)
         time_retry = 0
-        for tf in self.required_tfs:
-            cron_time = tf_cron[tf]
-            if ("hour" not in cron_time or hour in cron_time["hour"]) and (
-                "minute" not in cron_time or minute in cron_time["minute"]
-            ):
-                bot_logger.info("   [+] Update tf: {}, time: {}".format(tf, curr_time))
-                last_updated_tf = self.last_updated_tfs[tf]
-                for bot_trader in self.bot_traders:
-                    if tf in bot_trader.get_required_tfs():
-                        while True:
-                            chart_df = self.mt5_api.klines(bot_trader.get_symbol_name(), tf, limit=2)
-                            last_kline = chart_df[:1]
-                            if last_kline.iloc[0]["Open time"] > self.last_updated_tfs[tf]:
-                                break
-                            time_retry += 0.1
-                            time.sleep(0.1)
-                            if time_retry > 10:
-                                bot_logger.info("   [+] Update next kline timeout: {}".format(curr_time))
-                                break
-                        if last_kline.iloc[0]["Open time"] > self.last_updated_tfs[tf]:
-                            bot_logger.info(
-                                "       [+] {}, kline: {}".format(
-                                    bot_trader.get_symbol_name(), last_kline.iloc[0]["Open time"]
-                                )
-                            )
-                            bot_trader.on_kline(tf, last_kline)
-                            last_updated_tf = last_kline.iloc[0]["Open time"]
-                self.last_updated_tfs[tf] = last_updated_tf
+        for tf in due_tfs:
+            bot_logger.info("   [+] Update tf: %s, time: %s", tf, curr_time)
+        for bot_trader in self.bot_traders:
+            symbol = bot_trader.get_symbol_name()
+            new_klines = []
+            for tf in due_tfs:
+                if tf not in bot_trader.get_required_tfs():
+                    continue
+                while True:
+                    chart_df = self.get_closed_klines(symbol, tf, last_updated_tfs[tf], curr_time)
+                    chart_df = chart_df[chart_df["Open time"] > last_updated_tfs[tf]]
+                    if len(chart_df) > 0:
+                        break
+                    time_retry += 0.1
+                    time.sleep(0.1)
+                    self.metrics.inc("kline_retries", symbol=symbol, tf=tf)
+                    if time_retry > 10:
+                        bot_logger.info("   [+] Update next kline timeout: %s", curr_time)
+                        self.metrics.inc("kline_timeouts", symbol=symbol, tf=tf)
+                        break
+                for i in range(len(chart_df)):
+                    kline = chart_df[i : i + 1]
+                    close_time = kline.iloc[0]["Open time"] + tf_to_timedelta(tf)
+                    new_klines.append((close_time, tfs_order.index(tf), tf, kline))
+                if len(chart_df) > 0:
+                    self.last_updated_tfs[tf] = max(self.last_updated_tfs[tf], chart_df.iloc[-1]["Open time"])
+            if len(new_klines) == 0:
+                continue
+            new_klines.sort(key=lambda x: (x[0], x[1]))
+            self.metrics.mark(symbol, "kline_received")
+            for _, _, tf, kline in new_klines:
+                bot_logger.info("       [+] %s, tf: %s, kline: %s", symbol, tf, kline.iloc[0]["Open time"])
+                bot_trader.on_kline(tf, kline)
+                self.metrics.inc("bars", symbol=symbol, tf=tf)
+            self.metrics.mark(symbol, "strategy_updated")
 
     def __oms_loop__(self):
         self.oms.monitor_trades()
+        self.append_income_history(self.oms.sync_income_history())
 
     def start(self):
         bot_logger.info("[*] Start trading bot, time: {}".format(datetime.now()))
-        self.sched.add_job(
-            self.__update_next_kline__,
-            "cron",
-            args=[],
-            max_instances=1,
-            replace_existing=False,
-            minute="0-59",
-            second=1,
-        )
+        speed = self.mt5_api.config.get("speed", 1)
+        if speed > 1:
+            # simulated clock: update once per simulated minute
+            self.sched.add_job(self.__update_next_kline__, "interval", args=[], max_instances=1, seconds=60 / speed)
+        else:
+            self.sched.add_job(
+                self.__update_next_kline__,
+                "cron",
+                args=[],
+                max_instances=1,
+                replace_existing=False,
+                minute="0-59",
+                second=1,
+            )
         self.sched.add_job(self.__oms_loop__, "interval", seconds=15)
+        self.sched.add_job(self.save_snapshots, "interval", minutes=SNAPSHOT_INTERVAL_MINUTES)
+        self.sched.add_job(self.log_summary, "interval", minutes=SUMMARY_INTERVAL_MINUTES)
+        self.sched.add_job(self.log_latency, "interval", minutes=LATENCY_INTERVAL_MINUTES)
         self.sched.start()
+        if self.metrics_port is not None:
+            self.metrics_server = MetricsServer(self.metrics, self.metrics_port)
+            self.metrics_server.start()
 
     def stop(self):
         bot_logger.info("[*] Stop trading bot, time: {}".format(datetime.now()))
         self.oms.close_all_trade()
         self.sched.shutdown(wait=True)
+        self.save_snapshots()
+        self.journal.close()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
 
     def summary_trade_result(self):
         final_backtest_stats = []
@@ -130,16 +296,38 @@ class TradeEngine:
             summary = backtest_stats.loc[len(backtest_stats) - 1 :]
             final_backtest_stats.append(summary)
 
-            bot_trader.log_orders()
-            bot_trader.plot_strategy_orders()
-
         table_stats = pd.concat(final_backtest_stats, axis=0, ignore_index=True)
         s = table_stats.sum(axis=0)
         table_stats.loc[len(table_stats)] = s
         table_stats.loc[len(table_stats) - 1, "NAME"] = "TOTAL"
         bot_logger.info(get_pretty_table(table_stats, "SUMMARY", transpose=True, tran_col="NAME"))
+        df_latency = self.metrics.summary()
+        if len(df_latency) > 0:
+            bot_logger.info(get_pretty_table(df_latency, "LATENCY"))
+        # written in this process, forked workers would inherit the live MT5 session
+        write_reports(self.bot_traders, workers=1)
         return table_stats
 
+    def log_summary(self):
+        # running PnL of closed orders while trading, summaries read running sums of the strategies
+        with self.update_lock:
+            final_stats = []
+            for bot_trader in self.bot_traders:
+                stats = bot_trader.statistic_trade()
+                stats.loc[len(stats) - 1, "NAME"] = bot_trader.get_symbol_name()
+                final_stats.append(stats.loc[len(stats) - 1 :])
+        table_stats = pd.concat(final_stats, axis=0, ignore_index=True)
+        bot_logger.info(get_pretty_table(table_stats, "RUNNING SUMMARY", transpose=True, tran_col="NAME"))
+
+    def log_latency(self):
+        # p50/p99 of each stage since start, doesn't wait for kline updates
+        for line in self.metrics.get_log_lines():
+            bot_logger.info("[+] Latency {}".format(line))
+
+    def get_metrics(self):
+        # {symbol: {stage: stats}} of stage latencies, "ALL" holds the cron fire lag
+        return self.metrics.snapshot()
+
     def log_all_trades(self):
         closed_trades, active_trades = self.oms.get_trades()
         df_closed = pd.DataFrame([trade.__to_dict__() for trade in closed_trades.values()])
@@ -147,7 +335,18 @@ class TradeEngine:
         df_active = pd.DataFrame([trade.__to_dict__() for trade in active_trades.values()])
         df_active.to_csv(os.path.join(os.environ["DEBUG_DIR"], "active_trades.csv"))
 
+    def append_income_history(self, df_deals):
+        # write deals to income history file as they are synced during session
+        if len(df_deals) == 0:
+            return
+        if self.income_history_file is None:
+            self.income_history_file = os.path.join(os.environ["DEBUG_DIR"], "income_history.csv")
+            df_deals.to_csv(self.income_history_file, index=False)
+        else:
+            df_deals.to_csv(self.income_history_file, mode="a", header=False, index=False)
+
     def log_income_history(self):
+        self.append_income_history(self.oms.sync_income_history())
         df_ic = self.oms.get_income_history()
         if len(df_ic) > 0:
             bot_logger.info(get_pretty_table(df_ic, "INCOME SUMMARY"))
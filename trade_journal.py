@@ -0,0 +1,80 @@
+import time
+import pickle
+import sqlite3
+import threading
+import logging
+
+bot_logger = logging.getLogger("bot_logger")
+
+
+class TradeJournal:
+    # Append-only journal of trade lifecycle events, stored in a sqlite database in WAL mode
+    # so every event is durable once recorded and a crashed bot can rebuild its active trades.
+    #   OPEN      payload: Trade (order, main order result, close order params)
+    #   ADJUST_SL payload: sl
+    #   ADJUST_TP payload: tp
+    #   CLOSE     payload: reason
+    def __init__(self, journal_file):
+        self.journal_file = journal_file
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(journal_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, time REAL, event TEXT, trade_id INTEGER, payload BLOB)"
+        )
+        self.conn.commit()
+
+    def record(self, event, trade_id, payload=None):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO events (time, event, trade_id, payload) VALUES (?, ?, ?, ?)",
+                (time.time(), event, trade_id, pickle.dumps(payload)),
+            )
+            self.conn.commit()
+
+    def open_trade(self, trade):
+        self.record("OPEN", trade.trade_id, trade)
+
+    def adjust_sl(self, trade_id, sl):
+        self.record("ADJUST_SL", trade_id, sl)
+
+    def adjust_tp(self, trade_id, tp):
+        self.record("ADJUST_TP", trade_id, tp)
+
+    def close_trade(self, trade_id, reason):
+        self.record("CLOSE", trade_id, reason)
+
+    def replay(self):
+        # rebuild trades opened but not closed, return {trade_id: trade}
+        with self.lock:
+            rows = self.conn.execute("SELECT event, trade_id, payload FROM events ORDER BY seq").fetchall()
+        trades = {}
+        for event, trade_id, payload in rows:
+            if event == "OPEN":
+                trades[trade_id] = pickle.loads(payload)
+            elif trade_id not in trades:
+                continue
+            elif event == "ADJUST_SL":
+                trades[trade_id].order.adjust_sl(pickle.loads(payload))
+            elif event == "ADJUST_TP":
+                trades[trade_id].order.adjust_tp(pickle.loads(payload))
+            elif event == "CLOSE":
+                del trades[trade_id]
+        bot_logger.info("[+] Replay trade journal: {} events, {} open trades".format(len(rows), len(trades)))
+        return trades
+
+    def compact(self, active_trades):
+        # rewrite journal to one OPEN event per active trade
+        with self.lock:
+            with self.conn:
+                self.conn.execute("DELETE FROM events")
+                self.conn.executemany(
+                    "INSERT INTO events (time, event, trade_id, payload) VALUES (?, ?, ?, ?)",
+                    [(time.time(), "OPEN", trade.trade_id, pickle.dumps(trade)) for trade in active_trades],
+                )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
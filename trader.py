@@ -1,10 +1,18 @@
 import os
+import copy
 import logging
+import pickle
+from datetime import timedelta
 import pandas as pd
 from strategy_utils import load_strategy
-from order import Order, OrderSide, OrderStatus, OrderType
+from order import Order, OrderBatch, OrderSide, OrderStatus, OrderType
+from klines_loader import KlinesStream
+from order_journal import OrderJournal
+from utils import tf_cron
 
 bot_logger = logging.getLogger("bot_logger")
+# bump when Trader/strategy state layout changes, older snapshots are ignored
+SNAPSHOT_VERSION = 5
 
 
 class Trader:
@@ -35,6 +43,7 @@ class Trader:
     #         1
     #     ],
     #     "year": 2023
+    #     # or a date range, may span years: "start": "2023-11-01", "end": "2024-03-01" (klines with start <= Open time < end)
     # }
 
     def __init__(self, json_cfg):
@@ -42,9 +51,15 @@ class Trader:
         self.symbol_name = self.json_cfg["symbol"]
         self.required_tfs = {}
         self.strategies = []
+        # IntrabarResolver for backtest, None to resolve SL/TP on bar High/Low
+        self.intrabar = None
+        # backtest phase -> seconds
+        self.timings = {}
+        # Profiler timing on_kline and strategy updates, None when not profiling
+        self.profiler = None
         self.log_dir = os.path.join(os.environ["DEBUG_DIR"], self.symbol_name)
-        if not os.path.isdir(self.log_dir):
-            os.mkdir(self.log_dir)
+        # parallel walk-forward/backtest workers may create it at the same time
+        os.makedirs(self.log_dir, exist_ok=True)
 
     def init_chart(self, tfs_chart):
         # tfs_chart: {"1h": chart_1h, "15m": chart_15m}
@@ -54,7 +69,7 @@ class Trader:
             strategy.attach_trader(self)
 
     def init_strategies(self):
-        for strategy_def in self.json_cfg["strategies"]:
+        for i, strategy_def in enumerate(self.json_cfg["strategies"]):
             strategy = load_strategy(strategy_def)
             if strategy.is_params_valid():
                 bot_logger.info(
@@ -62,6 +77,7 @@ class Trader:
                 )
                 strategy.set_volume(strategy_def["volume"])
                 strategy.set_max_sl_pct(strategy_def.get("max_sl_pct"))
+                strategy.set_strategy_id(i)
                 self.strategies.append(strategy)
                 for tf in strategy_def["tfs"].values():
                     if tf in self.required_tfs:
@@ -78,13 +94,32 @@ class Trader:
     def attach_oms(self, oms):
         self.oms = oms
 
-    def create_trade(self, order: Order, volume):
+    def attach_intrabar(self, intrabar):
+        self.intrabar = intrabar
+        for strategy in self.strategies:
+            strategy.attach_intrabar(intrabar)
+
+    def attach_journal(self, chunk_size=1000):
+        # backtest: write closed orders of each strategy to a csv journal in log dir instead of keeping them
+        for i, strategy in enumerate(self.strategies):
+            journal_file = os.path.join(self.log_dir, "{}_{}_journal.csv".format(strategy.description, i))
+            strategy.attach_journal(OrderJournal(journal_file, chunk_size))
+
+    def attach_profiler(self, profiler):
+        self.profiler = profiler
+        profiler.attach(self)
+
+    def detach_profiler(self):
+        # restore plain methods, histograms stay in self.profiler
+        if self.profiler is not None:
+            self.profiler.detach(self)
+
+    def create_trade(self, order: Order, volume, strategy_id=None):
         if self.oms:
-            bot_logger.info(
-                "   [+] Create new order, symbol: {}, strategy: {}".format(self.symbol_name, order["description"])
-            )
-            bot_logger.info("    - {}".format(order))
+            bot_logger.info("   [+] Create new order, symbol: %s, strategy: %s", self.symbol_name, order["description"])
+            bot_logger.info("    - %s", order)
             order["symbol"] = self.symbol_name
+            order["strategy_id"] = strategy_id
             order["trade_id"] = self.oms.create_trade(order, volume)
 
     def close_trade(self, order: Order):
@@ -97,6 +132,18 @@ class Trader:
             if "trade_id" in order:
                 self.oms.adjust_sl(order["trade_id"], sl)
 
+    def run_vectorized(self, tfs_chart):
+        # backtest strategies supporting it over init chart + tfs_chart in one pass,
+        # they are removed from bar by bar updates, timeframes left without strategy aren't required anymore
+        for strategy in self.strategies:
+            if strategy.run_vectorized(tfs_chart):
+                bot_logger.info("   [+] Run {} vectorized".format(strategy.description))
+                for tf in strategy.tfs.values():
+                    self.required_tfs[tf] = [s for s in self.required_tfs[tf] if s is not strategy]
+        for tf in [tf for tf, strategies in self.required_tfs.items() if len(strategies) == 0]:
+            self.tfs_chart[tf] = pd.concat([self.tfs_chart[tf], tfs_chart[tf]], ignore_index=True)
+            del self.required_tfs[tf]
+
     def get_required_tfs(self):
         return list(self.required_tfs.keys())
 
@@ -140,7 +187,7 @@ class Trader:
                 order.adjust_sl(max_sl)
                 return order
             elif sl_fix_mode == "IGNORE":
-                bot_logger.info("   [-] IGNORE order: {}".format(order))
+                bot_logger.info("   [-] IGNORE order: %s", order)
                 return None
             elif sl_fix_mode == "ADJ_ENTRY":
                 adjusted_entry = (
@@ -155,21 +202,119 @@ class Trader:
     def log_orders(self):
         df_orders = []
         for strategy in self.strategies:
+            if strategy.journal is not None:
+                # closed orders are already in the strategy's journal
+                strategy.journal.flush()
+                bot_logger.info(
+                    "   [+] {} orders of {} in {}".format(
+                        len(strategy.journal), strategy.description, strategy.journal.journal_file
+                    )
+                )
+                continue
             df = pd.DataFrame([order.__to_dict__() for order in strategy.orders_closed])
             df_orders.append(df)
+        if len(df_orders) == 0:
+            return
         df_orders = pd.concat(df_orders)
         df_orders.to_csv(os.path.join(self.log_dir, "{}_orders.csv".format(self.symbol_name)))
 
-    def plot_strategy_orders(self):
-        for strategy in self.strategies:
-            fig = strategy.plot_orders()
-            fig.write_html(
-                os.path.join(self.log_dir, "{}.html".format(strategy.get_name())),
-                include_plotlyjs="https://cdn.plot.ly/plotly-latest.min.js",
-            )
+    def get_plot_jobs(self, fast=False):
+        # [(strategy, html file)] to pass to plot_strategy, strategy copies hold a trader copy without
+        # the other strategies so each job is cheap to send to a worker process
+        # fast: batch order shapes in WebGL traces and decimate candles, for backtests with many orders
+        trader = copy.copy(self)
+        trader.strategies = []
+        trader.required_tfs = {}
+        trader.intrabar = None
+        jobs = []
+        for i, strategy in enumerate(self.strategies):
+            strategy = copy.copy(strategy)
+            strategy.trader = trader
+            strategy.fast_plot = fast
+            # strategies may share a name or description, jobs run in parallel so each writes its own file
+            jobs.append((strategy, os.path.join(self.log_dir, "{}_{}.html".format(strategy.description, i))))
+        return jobs
+
+    def plot_strategy_orders(self, fast=False):
+        for strategy, html_file in self.get_plot_jobs(fast):
+            plot_strategy(strategy, html_file)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # oms holds terminal connection and journal, it is attached again after restore
+        state.pop("oms", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.oms = None
+
+    def save_snapshot(self, snapshot_file):
+        # write charts and strategies state, replace old snapshot atomically
+        snapshot = {"version": SNAPSHOT_VERSION, "strategies": self.json_cfg["strategies"], "trader": self}
+        with open(snapshot_file + ".tmp", "wb") as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(snapshot_file + ".tmp", snapshot_file)
+
+    @staticmethod
+    def load_snapshot(snapshot_file, json_cfg):
+        # return trader restored from snapshot, None if snapshot is missing or doesn't match config
+        if not os.path.exists(snapshot_file):
+            return None
+        try:
+            with open(snapshot_file, "rb") as f:
+                snapshot = pickle.load(f)
+        except Exception as e:
+            bot_logger.warning("   [-] Load snapshot {} failed: {}".format(snapshot_file, e))
+            return None
+        if snapshot.get("version") != SNAPSHOT_VERSION or snapshot["strategies"] != json_cfg["strategies"]:
+            bot_logger.info("   [-] Snapshot {} is outdated, ignore it".format(snapshot_file))
+            return None
+        bot_trader = snapshot["trader"]
+        bot_trader.json_cfg = json_cfg
+        os.makedirs(bot_trader.log_dir, exist_ok=True)
+        # keep new order ids unique
+        order_ids = [
+            order.order_id
+            for strategy in bot_trader.strategies
+            for order in strategy.orders_opening + strategy.orders_closed
+        ]
+        Order.__order_id__ = max([Order.__order_id__] + [order_id + 1 for order_id in order_ids])
+        return bot_trader
 
     def on_kline(self, tf, kline):
         # update strategies
         self.tfs_chart[tf] = pd.concat([self.tfs_chart[tf], kline], ignore_index=True)
+        # evaluate open orders of all strategies on tf in one batch, each strategy moves its closed orders in update
+        orders = list(dict.fromkeys(order for strategy in self.required_tfs[tf] for order in strategy.orders_opening))
+        if len(orders) > 0:
+            OrderBatch(orders).update_status(self.tfs_chart[tf].iloc[-1], self.intrabar, tf)
         for strategy in self.required_tfs[tf]:
             strategy.update(tf)
+
+    def replay(self, tfs_chart, timer, end_time):
+        # backtest: feed klines of tfs_chart (DataFrame or KlinesStream) to on_kline one minute at a time
+        # from timer to end_time, each tf gets its next kline at the minutes matching tf_cron, larger tf first
+        required_tfs = [tf for tf in tf_cron.keys() if tf in self.get_required_tfs()]
+        streams = {
+            tf: tfs_chart[tf] if isinstance(tfs_chart[tf], KlinesStream) else KlinesStream([tfs_chart[tf]])
+            for tf in required_tfs
+        }
+        while timer <= end_time:
+            timer += timedelta(seconds=60)
+            hour, minute = timer.hour, timer.minute
+            for tf in required_tfs:
+                cron_time = tf_cron[tf]
+                if ("hour" not in cron_time or hour in cron_time["hour"]) and (
+                    "minute" not in cron_time or minute in cron_time["minute"]
+                ):
+                    # klines of this tf already ran out
+                    if streams[tf].empty():
+                        continue
+                    self.on_kline(tf, streams[tf].pop())
+
+
+def plot_strategy(strategy, html_file):
+    fig = strategy.plot_orders()
+    fig.write_html(html_file, include_plotlyjs="https://cdn.plot.ly/plotly-latest.min.js")
+    return html_file
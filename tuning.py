@@ -1,6 +1,6 @@
 import os
 import argparse
-from datetime import datetime, timedelta
+from datetime import datetime
 import logging
 import logging.config
 import json
@@ -13,7 +13,10 @@ from multiprocessing.pool import ThreadPool as Pool
 from typing import List
 import pandas as pd
 from trader import Trader
-from utils import tf_cron, NUM_KLINE_INIT, CANDLE_COLUMNS
+from queue_logging import start_queue_logging
+from profiler import Profiler, summary_profile
+from klines_loader import KlinesLoader, get_date_range, get_months, load_replay_charts
+from utils import CANDLE_COLUMNS
 from utils import get_pretty_table, datetime_to_filename
 
 
@@ -30,61 +33,41 @@ bot_logger = logging.getLogger("bot_logger")
 
 
 class Tuning:
-    def __init__(self, symbols_trading_cfg_file, data_dir):
+    def __init__(self, symbols_trading_cfg_file, data_dir, vectorized=False, profile=False, quiet=False):
         self.data_dir = data_dir
+        # run strategies exposing signal arrays in one pass instead of bar by bar
+        self.vectorized = vectorized
+        # latency percentiles of on_kline and strategy update phases, merged over all trials
+        self.profile = profile
+        # drop info logs of each bar while trials run
+        self.quiet = quiet
         self.bot_traders: List[Trader] = []
         self.symbols_trading_cfg_file = symbols_trading_cfg_file
         self.debug_dir = os.environ["DEBUG_DIR"]
         self.temp_dir = tempfile.mkdtemp()
 
-    def load_mt5_klines_monthly_data(self, symbol, interval, month, year):
-        csv_data_path = os.path.join(self.data_dir, "{}-{}-{}-{:02d}.csv".format(symbol, interval, year, month))
-        df = pd.read_csv(csv_data_path)
-        df["Open time"] = pd.to_datetime(df["Open time"])
-        return df
-
-    def load_klines_monthly_data(self, symbol, interval, month, year):
-        return self.load_mt5_klines_monthly_data(symbol, interval, month, year)
+    def get_klines_loader(self, symbol_cfg, tf):
+        start, end = get_date_range(symbol_cfg)
+        return KlinesLoader(self.data_dir, symbol_cfg["symbol"], tf, get_months(symbol_cfg), start, end)
 
     def backtest_bot_trader(self, symbol_cfg):
         bot_trader = Trader(symbol_cfg)
         bot_trader.init_strategies()
-        tfs_chart = {}
-        # Load kline data for all required timeframes
-        for tf in bot_trader.get_required_tfs():
-            chart_df = pd.concat(
-                [
-                    self.load_klines_monthly_data(symbol_cfg["symbol"], tf, month, symbol_cfg["year"])
-                    for month in sorted(symbol_cfg["months"])
-                ],
-                ignore_index=True,
-            )
-            tfs_chart[tf] = chart_df
-        max_time = max([tf_chart.iloc[NUM_KLINE_INIT - 1]["Open time"] for tf_chart in tfs_chart.values()])
-        end_time = max([tf_chart.iloc[-1]["Open time"] for tf_chart in tfs_chart.values()])
-        tfs_chart_init = {}
-        for tf, tf_chart in tfs_chart.items():
-            tfs_chart_init[tf] = tf_chart[tf_chart["Open time"] <= max_time][-NUM_KLINE_INIT:]
-            tfs_chart[tf] = tf_chart[tf_chart["Open time"] > max_time]
+        loaders = {tf: self.get_klines_loader(symbol_cfg, tf) for tf in bot_trader.get_required_tfs()}
+        # stream klines month by month, vectorized strategies need the whole chart
+        tfs_chart_init, tfs_chart, max_time, end_time = load_replay_charts(loaders, stream=not self.vectorized)
         bot_trader.init_chart(tfs_chart_init)
         bot_trader.attach_oms(None)  # for backtesting don't need oms
+        if self.profile:
+            bot_trader.attach_profiler(Profiler())
+        if self.vectorized:
+            bot_trader.run_vectorized(tfs_chart)
 
         timer = max_time
         end_time = end_time
         bot_logger.info("Start timer from: {} to {}".format(timer, end_time))
-        required_tfs = [tf for tf in tf_cron.keys() if tf in bot_trader.get_required_tfs()]
-
-        while timer <= end_time:
-            timer += timedelta(seconds=60)
-            hour, minute = timer.hour, timer.minute
-            for tf in required_tfs:
-                cron_time = tf_cron[tf]
-                if ("hour" not in cron_time or hour in cron_time["hour"]) and (
-                    "minute" not in cron_time or minute in cron_time["minute"]
-                ):
-                    last_kline = tfs_chart[tf][:1]
-                    tfs_chart[tf] = tfs_chart[tf][1:]
-                    bot_trader.on_kline(tf, last_kline)
+        bot_trader.replay(tfs_chart, timer, end_time)
+        bot_trader.detach_profiler()
         return bot_trader
 
     def start(self):
@@ -117,16 +100,14 @@ class Tuning:
                     sb_cfg_tpl["strategies"] = sublist_strategy
                     args.append(sb_cfg_tpl)
         bot_logger.info("   [+] Run total {} trials".format(len(args)))
-        # preload data
-        for symbol_cfg in symbols_config:
-            symbols = symbol_cfg["symbols"]
-            for symbol in symbols:
-                for tf in symbol_cfg["tfs"].values():
-                    for mnt in symbol_cfg["months"]:
-                        self.load_klines_monthly_data(symbol, tf, mnt, symbol_cfg["year"])
-
-        with Pool(cpu_count()) as pool:
-            self.bot_traders.extend(pool.map(self.backtest_bot_trader, args))
+        level = bot_logger.level
+        if self.quiet:
+            bot_logger.setLevel(logging.WARNING)
+        try:
+            with Pool(cpu_count()) as pool:
+                self.bot_traders.extend(pool.map(self.backtest_bot_trader, args))
+        finally:
+            bot_logger.setLevel(level)
         bot_logger.info("   [*] Tuning finished")
 
     def summary_trade_result(self):
@@ -139,6 +120,10 @@ class Tuning:
             backtest_stats.insert(loc=2, column="params", value=bot_trader.get_strategy_params())
             final_backtest_stats.append(backtest_stats)
         table_stats = pd.concat(final_backtest_stats, axis=0, ignore_index=True)
+        if self.profile:
+            profile_stats = summary_profile(self.bot_traders)
+            if profile_stats is not None:
+                bot_logger.info(get_pretty_table(profile_stats, "PROFILE"))
         return table_stats
 
     def stop(self):
@@ -152,19 +137,23 @@ def config_logging(exchange):
         defaults={"logfilename": "logs/{}/bot_tuning_{}.log".format(exchange, datetime_to_filename(curr_time))},
     )
     logging.getLogger().setLevel(logging.WARNING)
+    start_queue_logging()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Monn auto trading bot")
     parser.add_argument("--sym_cfg_file", required=True, type=str)
     parser.add_argument("--data_dir", required=False, type=str)
+    parser.add_argument("--vectorized", action="store_true")
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--quiet", action="store_true")
     args = parser.parse_args()
 
     config_logging("binance")
     os.environ["DEBUG_DIR"] = "debug"
 
 
-    tun_engine = Tuning(args.sym_cfg_file, args.data_dir)
+    tun_engine = Tuning(args.sym_cfg_file, args.data_dir, args.vectorized, args.profile, args.quiet)
     tun_engine.start()
     table_stats = tun_engine.summary_trade_result()
     table_stats.to_csv(os.path.splitext(args.sym_cfg_file)[0] + ".csv")
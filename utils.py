@@ -1,7 +1,6 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from tabulate import tabulate
 import numpy as np
-from scipy.optimize import linprog
 
 
 tf_cron = {
@@ -39,6 +38,18 @@ tf_cron = {
 }
 
 NUM_KLINE_INIT = 300
+# interval -> MetaTrader5 TIMEFRAME_* constant, kept here so backtest doesn't need MetaTrader5 installed
+TIMEFRAME_MAP = {
+    "1m": 1,  # TIMEFRAME_M1
+    "5m": 5,  # TIMEFRAME_M5
+    "15m": 15,  # TIMEFRAME_M15
+    "30m": 30,  # TIMEFRAME_M30
+    "1h": 16385,  # TIMEFRAME_H1
+    "4h": 16388,  # TIMEFRAME_H4
+    "1d": 16408,  # TIMEFRAME_D1
+    "1w": 32769,  # TIMEFRAME_W1
+    "1mn": 49153,  # TIMEFRAME_MN1
+}
 CANDLE_COLUMNS = [
     "Open time",
     "Open",
@@ -55,6 +66,12 @@ CANDLE_COLUMNS = [
 ]
 
 
+def tf_to_timedelta(tf):
+    # "15m" -> 15 minutes, "4h" -> 4 hours
+    unit = {"m": "minutes", "h": "hours", "d": "days", "w": "weeks"}[tf[-1]]
+    return timedelta(**{unit: int(tf[:-1])})
+
+
 def datetime_to_filename(dt):
     return str(dt).replace(" ", "-").replace(":", "-")
 
@@ -109,6 +126,8 @@ def get_y_on_line(line, xi):
 def find_uptrend_line(poke_points):
     # poke_points: list (xi, yi)
     # return: ((x0d, y0d), (xnd, ynd))
+    # scipy is slow to import, load it on first trend line
+    from scipy.optimize import linprog
 
     X, Y = parse_line_coffs(poke_points)
     obj = [-X[:, 0].sum(), -X[:, 1].sum()]
@@ -128,6 +147,7 @@ def is_cross_line(line, kline):
 def find_downtrend_line(peak_points):
     # peak_points: list (xi, yi)
     # return: ((x0u, y0u), (xnu, ynu))
+    from scipy.optimize import linprog
 
     X, Y = parse_line_coffs(peak_points)
     obj = [X[:, 0].sum(), X[:, 1].sum()]
@@ -0,0 +1,262 @@
+import os
+import argparse
+from datetime import datetime, timedelta
+import logging
+import logging.config
+import json
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from trader import Trader
+from tuning import get_combination
+from klines_loader import KlinesLoader
+from queue_logging import start_queue_logging, get_log_queue, init_worker_logging
+from utils import NUM_KLINE_INIT, tf_to_timedelta
+from utils import get_pretty_table, datetime_to_filename
+
+
+bot_logger = logging.getLogger("bot_logger")
+
+# (symbol, tf) -> chart of the whole walk-forward range, shared by all windows of a worker
+__charts__ = {}
+
+
+class WalkForward:
+    # Walk-forward optimization: slide a train window and a test window over a date range,
+    # tune params on each train window, backtest the best params on the following test window
+    # and stitch the out-of-sample orders into one equity curve.
+    ### Example ###
+    # {
+    #     "symbols": ["EURUSD"],
+    #     "name": "ma_cross",
+    #     "params": {"fast_ma": [10, 20], "slow_ma": [50, 100], "type": ["EMA"], "sl_fix_mode": ["ADJ_SL"]},
+    #     "tfs": {"tf": "15m"},
+    #     "max_sl_pct": 0.5,
+    #     "volume": 0.01,
+    #     "start": "2023-01", # first month of first train window, NUM_KLINE_INIT klines before are used for warm up
+    #     "end": "2023-12",   # last month of last test window
+    #     "train_months": 3,
+    #     "test_months": 1,
+    #     "metric": "TOTAL_PnL(%)" # column of strategy summary_PnL to maximize, optional
+    # }
+    def __init__(self, wf_cfg_file, data_dir, workers=None, vectorized=False):
+        self.wf_cfg_file = wf_cfg_file
+        self.data_dir = data_dir
+        self.workers = workers
+        self.vectorized = vectorized
+        self.debug_dir = os.environ["DEBUG_DIR"]
+        self.results = []
+
+    def load_klines(self, symbol, tf, start, end):
+        # klines of months [start - warm up, end], missing months are skipped. Warm up spans NUM_KLINE_INIT klines
+        # of tf, stretched by 7/5 as markets are closed on weekends, plus a week for holidays
+        warm_up = NUM_KLINE_INIT * tf_to_timedelta(tf) * 7 / 5 + timedelta(weeks=1)
+        warm_up_start = (start.start_time - warm_up).to_period("M")
+        months = [(month.year, month.month) for month in pd.period_range(warm_up_start, end, freq="M")]
+        chart_df = KlinesLoader(self.data_dir, symbol, tf, months).load()
+        if len(chart_df) == 0:
+            raise ValueError("No data available for {} {} from {} to {}".format(symbol, tf, start, end))
+        return chart_df
+
+    def get_windows(self, wf_cfg):
+        # [(train_start, train_end, test_end)], month periods, end exclusive
+        start, end = pd.Period(wf_cfg["start"], freq="M"), pd.Period(wf_cfg["end"], freq="M")
+        windows = []
+        train_start = start
+        while train_start + wf_cfg["train_months"] + wf_cfg["test_months"] <= end + 1:
+            train_end = train_start + wf_cfg["train_months"]
+            windows.append((train_start, train_end, train_end + wf_cfg["test_months"]))
+            train_start += wf_cfg["test_months"]
+        return windows
+
+    def start(self):
+        with open(self.wf_cfg_file) as f:
+            wf_configs = json.load(f)
+        charts = {}
+        for wf_cfg in wf_configs:
+            start, end = pd.Period(wf_cfg["start"], freq="M"), pd.Period(wf_cfg["end"], freq="M")
+            for symbol in wf_cfg["symbols"]:
+                for tf in set(wf_cfg["tfs"].values()):
+                    if (symbol, tf) not in charts:
+                        charts[(symbol, tf)] = self.load_klines(symbol, tf, start, end)
+        bot_logger.info("[*] Start walk-forward, {} charts loaded".format(len(charts)))
+        # charts are sent once to each worker, windows slice them instead of reloading files
+        with ProcessPoolExecutor(
+            max_workers=self.workers, initializer=init_worker, initargs=(charts, get_log_queue(), bot_logger.level)
+        ) as executor:
+            for wf_cfg in wf_configs:
+                for symbol in wf_cfg["symbols"]:
+                    self.results.append(self.walk_forward_symbol(executor, wf_cfg, symbol))
+        bot_logger.info("[*] Walk-forward finished")
+
+    def walk_forward_symbol(self, executor, wf_cfg, symbol):
+        windows = self.get_windows(wf_cfg)
+        keys, combinations = get_combination(wf_cfg["params"])
+        strategies = [
+            {
+                "name": wf_cfg["name"],
+                "params": dict(zip(keys, params)),
+                "tfs": wf_cfg["tfs"],
+                "max_sl_pct": wf_cfg["max_sl_pct"],
+                "volume": wf_cfg["volume"],
+            }
+            for params in combinations
+        ]
+        bot_logger.info(
+            "[+] Walk-forward {} {}: {} windows, {} combinations".format(
+                symbol, wf_cfg["name"], len(windows), len(strategies)
+            )
+        )
+        # tune all train windows in parallel, 10 strategies per trader
+        train_futures = []
+        for train_start, train_end, _ in windows:
+            futures = []
+            for i in range(0, len(strategies), 10):
+                symbol_cfg = {"symbol": symbol, "strategies": strategies[i : i + 10]}
+                futures.append(
+                    executor.submit(
+                        run_window, symbol_cfg, train_start.start_time, train_end.start_time, self.vectorized, False
+                    )
+                )
+            train_futures.append(futures)
+        test_futures = []
+        folds = []
+        metric = wf_cfg.get("metric", "TOTAL_PnL(%)")
+        for (train_start, train_end, test_end), futures in zip(windows, train_futures):
+            train_stats = pd.DataFrame([stats for future in futures for stats, _ in future.result()])
+            best = train_stats.loc[train_stats[metric].idxmax()]
+            bot_logger.info(
+                "   [+] Train {} - {}: best {}: {}, params: {}".format(
+                    train_start, train_end - 1, metric, best[metric], best["params"]
+                )
+            )
+            folds.append(
+                {
+                    "TRAIN": "{} - {}".format(train_start, train_end - 1),
+                    "TEST": "{} - {}".format(train_end, test_end - 1),
+                    "params": best["params"],
+                    "TRAIN_" + metric: best[metric],
+                }
+            )
+            strategy = [strategy for strategy in strategies if strategy["params"] == best["params"]][0]
+            symbol_cfg = {"symbol": symbol, "strategies": [strategy]}
+            test_futures.append(
+                executor.submit(run_window, symbol_cfg, train_end.start_time, test_end.start_time, self.vectorized, True)
+            )
+        oos_orders = []
+        for fold, future in zip(folds, test_futures):
+            (stats, orders), = future.result()
+            fold["TEST_" + metric] = stats[metric]
+            fold["TEST_TOTAL"] = stats["TOTAL"]
+            for order in orders:
+                order["fold"] = fold["TEST"]
+            oos_orders.extend(orders)
+        df_folds = pd.DataFrame(folds)
+        df_orders = pd.DataFrame(oos_orders)
+        if len(df_orders) > 0:
+            # stitch out-of-sample orders into one equity curve, in % of PnL summed as in summary_PnL
+            df_orders = df_orders.sort_values("STOP_TIME").reset_index(drop=True)
+            df_orders["EQUITY(%)"] = 100 * df_orders["PnL"].cumsum()
+        file_prefix = os.path.join(self.debug_dir, "walk_forward_{}_{}".format(symbol, wf_cfg["name"]))
+        df_folds.to_csv(file_prefix + "_folds.csv", index=False)
+        df_orders.to_csv(file_prefix + "_equity.csv", index=False)
+        return symbol, wf_cfg["name"], df_folds, df_orders
+
+    def summary_trade_result(self):
+        summary = []
+        for symbol, name, df_folds, df_orders in self.results:
+            bot_logger.info(get_pretty_table(df_folds, "WALK-FORWARD {} {}".format(symbol, name)))
+            summary.append(
+                {
+                    "SYMBOL": symbol,
+                    "NAME": name,
+                    "FOLDS": len(df_folds),
+                    "OOS_TOTAL": len(df_orders),
+                    "OOS_PnL(%)": df_orders["EQUITY(%)"].iloc[-1] if len(df_orders) > 0 else 0,
+                }
+            )
+        table_stats = pd.DataFrame(summary)
+        bot_logger.info(get_pretty_table(table_stats, "WALK-FORWARD SUMMARY"))
+        return table_stats
+
+
+def init_worker(charts, log_queue, level):
+    global __charts__
+    __charts__ = charts
+    init_worker_logging(log_queue, level)
+
+
+def run_window(symbol_cfg, start_time, end_time, vectorized, with_orders):
+    # backtest symbol_cfg on klines in [start_time, end_time), klines before start_time warm up indicators
+    # return [(summary_PnL with params, closed orders)] of each strategy
+    bot_trader = Trader(symbol_cfg)
+    bot_trader.init_strategies()
+    tfs_chart_init = {}
+    tfs_chart = {}
+    for tf in bot_trader.get_required_tfs():
+        chart_df = __charts__[(symbol_cfg["symbol"], tf)]
+        tf_chart_init = chart_df[chart_df["Open time"] < start_time][-NUM_KLINE_INIT:]
+        if len(tf_chart_init) < NUM_KLINE_INIT:
+            raise ValueError(
+                "Insufficient warm up data for {} {} before {}: need {} candles, found {}".format(
+                    symbol_cfg["symbol"], tf, start_time, NUM_KLINE_INIT, len(tf_chart_init)
+                )
+            )
+        tfs_chart_init[tf] = tf_chart_init.reset_index(drop=True)
+        tfs_chart[tf] = chart_df[(chart_df["Open time"] >= start_time) & (chart_df["Open time"] < end_time)]
+    bot_trader.init_chart(tfs_chart_init)
+    bot_trader.attach_oms(None)  # for backtesting don't need oms
+    if vectorized:
+        bot_trader.run_vectorized(tfs_chart)
+    max_time = max([tf_chart.iloc[-1]["Open time"] for tf_chart in tfs_chart_init.values()])
+    end_time = max([tf_chart.iloc[-1]["Open time"] for tf_chart in tfs_chart.values() if len(tf_chart) > 0])
+    bot_trader.replay(tfs_chart, max_time, end_time)
+    bot_trader.close_opening_orders()
+    results = []
+    for strategy in bot_trader.strategies:
+        stats = strategy.summary_PnL()
+        stats["params"] = strategy.params
+        orders = []
+        if with_orders:
+            for order in strategy.orders_closed:
+                orders.append(
+                    {
+                        "FILL_TIME": order["FILL_TIME"] if "FILL_TIME" in order else None,
+                        "STOP_TIME": order["STOP_TIME"],
+                        "side": order.side.value,
+                        "entry": order.entry,
+                        "status": order.status.value,
+                        "PnL": order.get_PnL(),
+                    }
+                )
+        results.append((stats, orders))
+    return results
+
+
+def config_logging(exchange):
+    curr_time = datetime.now()
+    logging.config.fileConfig(
+        "logging_config.ini",
+        defaults={"logfilename": "logs/{}/bot_walk_forward_{}.log".format(exchange, datetime_to_filename(curr_time))},
+    )
+    logging.getLogger().setLevel(logging.WARNING)
+    start_queue_logging()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monn auto trading bot")
+    parser.add_argument("--wf_cfg_file", required=True, type=str)
+    parser.add_argument("--data_dir", required=True, type=str)
+    parser.add_argument("--workers", required=False, type=int)
+    parser.add_argument("--vectorized", action="store_true")
+    args = parser.parse_args()
+
+    os.environ["DEBUG_DIR"] = "debug"
+    os.environ["LOG_DIR"] = "logs"
+    os.makedirs(os.path.join(os.environ["LOG_DIR"], "mt5"), exist_ok=True)
+    os.makedirs(os.environ["DEBUG_DIR"], exist_ok=True)
+    config_logging("mt5")
+
+    wf_engine = WalkForward(args.wf_cfg_file, args.data_dir, args.workers, args.vectorized)
+    wf_engine.start()
+    table_stats = wf_engine.summary_trade_result()
+    table_stats.to_csv(os.path.splitext(args.wf_cfg_file)[0] + "_walk_forward.csv", index=False)